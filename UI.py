@@ -2,10 +2,22 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
+import cache
+import data
+import render
 
 st.set_page_config(page_title="Portfolio Allocator", layout="centered")
 st.title("債券與股票配置計算器")
 
+
+@st.cache_data
+def load_selected(paths, files_key):
+    # 每組檔案只讀一次 store：同一批序列產生預覽用長格式與對齊後的報酬矩陣
+    # files_key（路徑 + 修改時間）只作為快取鍵，資料檔更新後自動重新載入
+    series = data.load_series(paths)
+    return data.long_frame(series), data.align_returns(series)
+
+
 # 列出同目錄下的所有 CSV 檔案
 csv_files = [f for f in os.listdir('.') if f.lower().endswith('.csv')]
 if not csv_files:
@@ -16,30 +28,21 @@ else:
     if not selected:
         st.sidebar.warning("請至少選擇一個 CSV 檔案")
     else:
-        # 讀取並合併所有選定的檔案（同時解析 Date 欄位為 datetime）
-        df_list = []
-        for fname in selected:
-            df = pd.read_csv(fname, encoding='utf-8', parse_dates=['Date'])
-            asset_name = os.path.splitext(fname)[0]
-            if 'Asset' not in df.columns:
-                df['Asset'] = asset_name
-            # 清理 Price 與 Dividend 欄位並轉成數值
-            df['Price'] = df['Price'].astype(str).str.replace("'", "").str.replace(",", "").astype(float)
-            if 'Dividend' in df.columns:
-                df['Dividend'] = df['Dividend'].astype(str).str.replace("'", "").str.replace(",", "").fillna('0').astype(float)
-            else:
-                df['Dividend'] = 0.0
-            df_list.append(df)
-        df = pd.concat(df_list, ignore_index=True)
+        # 由共用資料層（data.py）載入：store 中的欄式資料 + 一次排序合併出對齊的報酬矩陣
+        # （依共同交易日對齊，不再以各序列最後 min_len 筆硬切）
+        df, ret_frame = load_selected(selected, cache.files_key(selected))
 
+        # 原始資料分頁顯示，每次重跑只傳一頁，不把整個合併後的表送到瀏覽器
         st.subheader("原始資料預覽")
-        st.dataframe(df)
-
-        # 計算單位期間報酬率
-        df['Return'] = (df['Price'] + df['Dividend']) / df.groupby('Asset')['Price'].shift(1) - 1
+        col_size, col_page = st.columns(2)
+        page_size = col_size.selectbox("每頁筆數", [50, 100, 500], index=1)
+        n_pages = render.n_pages(df, page_size)
+        page_no = col_page.number_input(f"頁數（共 {n_pages} 頁）", 1, n_pages, 1)
+        st.dataframe(render.page(df, page_no, page_size))
+        st.caption(f"共 {len(df):,} 筆")
 
         # 側邊設定權重
-        assets = df['Asset'].unique().tolist()
+        assets = ret_frame.columns.tolist()
         st.sidebar.header("設定配置比例 (總和需=1)")
         weights = {
             asset: st.sidebar.slider(f"{asset} 比例", 0.0, 1.0, 1.0/len(assets), step=0.01)
@@ -50,22 +53,12 @@ else:
             st.sidebar.error("比例總和不等於 1，請調整")
         else:
             # 計算組合報酬
-            ret_series = [
-                df[df['Asset']==asset]['Return'].dropna().reset_index(drop=True)
-                for asset in assets
-            ]
-            min_len = min(len(s) for s in ret_series)
-            aligned = np.vstack([s.values[-min_len:] for s in ret_series])
+            aligned = data.rets_mat(ret_frame)
             w = np.array([weights[a] for a in assets])
             port_returns = w.dot(aligned)
 
             # 取出對齊期間的日期序列
-            date_series = (
-                df[df['Asset']==assets[0]]['Date']
-                  .dropna()
-                  .reset_index(drop=True)
-                  .iloc[-min_len:]
-            )
+            date_series = ret_frame.index
 
             # 計算累積報酬並包成 DataFrame，讓 Streamlit 自動以日期作為 X 軸
             cum_returns = np.cumsum(port_returns)
@@ -84,5 +77,6 @@ else:
             st.write(f"年度化波動度：{ann_vol*100:.2f}%")
             st.write(f"夏普比率 (無風險利率0)：{sharpe:.2f}")
 
-            # 以日期為 X 軸繪製累積報酬折線圖
-            st.line_chart(port_df)
+            # 以日期為 X 軸繪製累積報酬折線圖（降採樣到約 render.DEFAULT_POINTS 個點）
+            chart_df = render.downsample(port_df.rename_axis('Date').reset_index(), 'Date', '累積報酬')
+            st.line_chart(chart_df.set_index('Date'))
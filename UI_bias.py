@@ -2,9 +2,31 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
+import time
 import altair as alt  # 新增 Altair
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import data
+import grid
+import prefix
+import analytics
+import cache
+import simulate
+import backtest
+import rolling
+import drawdown
+import surface
+import optimize
+import render
+import instrument
+import withdrawal
+import scenario
+import service
 
 st.set_page_config(page_title="Bond‐Stock 配置計算器", layout="wide")
+# 本次重跑的各階段計時從這裡開始（除錯面板與結構化 log 使用）
+_ctx = get_script_run_ctx()
+instrument.registry.begin_run(session=_ctx.session_id if _ctx else None)
+_run_t0 = time.perf_counter()
 st.title("20+年期公債、1~3年期公債 與 SPY 配置分析")
 st.subheader("取樣自2005/05/18~2025/05/16")
 
@@ -75,70 +97,95 @@ st.sidebar.markdown(
     f"**短期公債**：{w_1to3:.2%}  \n"
     f"**大盤股市**：{w_spy:.2%}"
 )
+debug = st.sidebar.checkbox("🐞 顯示效能除錯面板", value=False)
+
+
+def measured(name, chart):
+    # 除錯面板開啟時才量測圖表序列化大小（需要多序列化一次）
+    return instrument.chart_bytes(name, chart) if debug else chart
+
+# 設定 PORTFOLIO_SERVICE_URL（例如 http://127.0.0.1:8765，見 service.py）時，
+# 載入、對齊、組合報酬、逐年與區間績效改由計算服務的工作行程處理，本程式只當薄客戶端
+SERVICE_URL = os.environ.get("PORTFOLIO_SERVICE_URL")
+client = service.Client(SERVICE_URL) if SERVICE_URL else None
 
 # 接下來載入資料、計算日報酬、累積報酬等（不變）
+@instrument.cache_calls("load_matrix")
 @st.cache_data
-def load_returns(path):
-    df = pd.read_csv(path, parse_dates=['Date']).sort_values('Date')
-    df['Price'] = pd.to_numeric(df['Price'].astype(str)
-                                .str.replace("'", "")
-                                .str.replace(",", ""), errors='coerce')
-    df['Dividend'] = pd.to_numeric(df['Dividend'], errors='coerce').fillna(0.0)
-    df['Return'] = (df['Price'] + df['Dividend']) / df['Price'].shift(1) - 1
-    return df[['Date','Return']].dropna()
-
-df20  = load_returns(file_20plus).rename(columns={'Return':'Ret20'})
-df13  = load_returns(file_1to3)  .rename(columns={'Return':'Ret1to3'})
-dfspy = load_returns(file_spy)   .rename(columns={'Return':'RetSPY'})
-
-df = df20.merge(df13, on='Date', how='inner')\
-         .merge(dfspy, on='Date', how='inner')
-
-weights = np.array([w_20, w_1to3, w_spy])
-rets_mat = df[['Ret20','Ret1to3','RetSPY']].to_numpy().T
-df['PortRet'] = weights.dot(rets_mat)
-df['Cumulative Return'] = (1 + df['PortRet']).cumprod() - 1
+@instrument.cache_miss("load_matrix")
+def load_matrix(paths, names):
+    if client is not None:
+        return client.matrix(paths, names)
+    # 共用資料層（data.py）：一次排序合併出以日期為索引的 (T × N) 報酬矩陣
+    return data.load_matrix(paths, names)
+
+files = [file_20plus, file_1to3, file_spy]
+df = load_matrix(files, ['Ret20', 'Ret1to3', 'RetSPY']).reset_index()
+
+# 權重量化到 0.01，作為跨 session 共用快取的鍵
+weights = cache.dequantize(cache.quantize([w_20, w_1to3, w_spy]))
+rets_mat = data.rets_mat(df[['Ret20','Ret1to3','RetSPY']])
+risk_free_rate = 0.02  # 無風險利率，例如 2%
+asset_names = ['長期公債', '短期公債', '大盤股市']
+
+
+@instrument.timed("portfolio")
+def build_portfolio(df, weights):
+    # 先把 df 重設 index，方便用 iloc 切片
+    port = df[['Date']].reset_index(drop=True)
+    port['PortRet'] = weights.dot(rets_mat)
+    port['Year'] = port['Date'].dt.year
+    # 以前綴和索引取代逐年 groupby 與區間 cumprod/prod/std：任意區間都是常數時間查表
+    idx = prefix.PrefixIndex(port['PortRet'].to_numpy(), port['Date'].to_numpy())
+    port['Cumulative Return'] = idx.cumulative(0, len(idx))
+    # 🗓️ 每個自然年度的年化績效（若非第一年，捨去該年第一筆）
+    metrics = analytics.yearly_metrics(idx, skip_first=True, risk_free_rate=risk_free_rate)
+    metrics = metrics[['year', 'cagr', 'vol']].rename(
+        columns={'year': 'Year', 'cagr': '年化報酬率', 'vol': '年度波動率'})
+    return port, idx, metrics
+
+
+@instrument.timed("chart")
+def build_chart(df, idx, i_start, i_end):
+    # 重新從 1 開始累積報酬，作為圖表資料
+    df_chart = df.iloc[i_start:i_end][['Date']].copy()
+    df_chart['CumRetRebased'] = idx.cumulative(i_start, i_end)
+    return df_chart
+
+
+@instrument.timed("period")
+def build_period(df, idx, i_start, i_end):
+    period_res = dict(idx.range_metrics(i_start, i_end, risk_free_rate))
+    df_chart = build_chart(df, idx, i_start, i_end)
+    # 區間內最大回撤（期初資金也算一個高點）
+    wealth = np.concatenate([[1.0], 1 + df_chart['CumRetRebased'].to_numpy()])
+    period_res['mdd'] = (wealth / np.maximum.accumulate(wealth) - 1).min()
+    return period_res, df_chart
+
+
+@instrument.timed("portfolio")
+def fetch_portfolio(files, weights):
+    # 薄客戶端：逐日組合報酬與逐年績效由計算服務回傳，本地沒有前綴和索引
+    port, yearly = client.portfolio(files, weights)
+    metrics = yearly[['year', 'cagr', 'vol']].rename(
+        columns={'year': 'Year', 'cagr': '年化報酬率', 'vol': '年度波動率'})
+    return port, None, metrics
+
+
+@instrument.timed("period")
+def fetch_period(files, weights, start_year, end_year):
+    # 回傳 (i_start, i_end, 區間績效, 圖表資料)，索引位置與本地計算一致
+    i_start, i_end, period_res, df_chart = client.period(files, weights, start_year, end_year)
+    df_chart.index = pd.RangeIndex(i_start, i_start + len(df_chart))
+    return i_start, i_end, period_res, df_chart
+
 
 # ----------------------------
-# 先把 df 重設 index，方便用 iloc 切片
-df['Date'] = (
-    df['Date']
-          # 1. 去掉單引號、雙引號
-      .str.replace("'",  "", regex=False)
-      .str.replace('"',  "", regex=False)
-      # 2. 把「年」->"-"、「月」->"-」、「日」->"" 
-      .str.replace('年', '-', regex=False)
-      .str.replace('月', '-', regex=False)
-      .str.replace('日',  '', regex=False)
-      .str.replace(r'(\d{4})年(\d{1,2})月(\d{1,2})日', r'\1-\2-\3', regex=True)
-)
-df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d')
-df = df.reset_index(drop=True)
-df['Year'] = df['Date'].dt.year
-# 🗓️ 計算每 252 天為一期的年化績效
-window = 252
-metrics = []
-years = set(df['Year'])
-
-for year, grp in df.groupby('Year'):
-    # 如果不是第一年，就把 grp 的第一筆 drop 掉
-    if (year-1) in years and len(grp) > 0:
-        grp = grp.iloc[1:]
-    
-    # 該年的總報酬（幾何相乘 -1）
-    total_ret = (1 + grp['PortRet']).prod() - 1
-    # 該年實際交易日數
-    n = len(grp)
-    # 年化平均報酬：根據實際天數 n 年化到 252 天
-    ann_ret_i = (1 + total_ret) ** (252 / n) - 1
-    # 年化波動度：日波動 * sqrt(252)
-    ann_vol_i = grp['PortRet'].std() * np.sqrt(252)
-    
-    metrics.append({
-        'Year': year,
-        '年化報酬率': ann_ret_i,
-        '年度波動率': ann_vol_i
-    })
+# 相同檔案 + 相同（量化後）權重的組合結果由所有 session 共用
+df, idx, metrics = cache.portfolios.get_or_compute(
+    cache.portfolio_key(files, weights),
+    lambda: build_portfolio(df, weights) if client is None else fetch_portfolio(files, weights)
+)
 
 # 🎯 加入 Streamlit 年度範圍選擇器
 st.subheader("📆 自訂區間績效計算")
@@ -147,46 +194,68 @@ min_year = df['Year'].min()
 max_year = df['Year'].max()
 start_year, end_year = st.slider("選擇起迄年份", min_value=int(min_year), max_value=int(max_year), value=(2010, 2020))
 
+# 有預先計算的配置曲面（python surface.py）時，區間指標直接查表
+# 開啟曲面（讀 JSON、建索引表）只做一次；來源 CSV 或曲面重建後修改時間改變，鍵自然失效
+surf = cache.portfolios.get_or_compute(
+    ('surface', cache.files_key(files), cache.files_key(surface.artifact_paths(files))),
+    lambda: surface.open_surface(files)
+) if client is None else None
+
 # 篩選出該期間資料
-df_period = df[(df['Year'] >= start_year) & (df['Year'] <= end_year)].copy()
-df_period['Cumulative Return'] = (1 + df_period['PortRet']).cumprod() - 1
+if client is None:
+    i_start, i_end = idx.year_bounds(start_year, end_year)
+    if surf is not None and surf.covers(start_year, end_year):
+        # 曲面命中：指標（float32）查表，不算 range_metrics 與回撤；圖表仍需要重新起算的累積報酬
+        period_res = surf.lookup(weights, start_year, end_year)
+        df_chart = cache.portfolios.get_or_compute(
+            ('chart',) + cache.portfolio_key(files, weights, (start_year, end_year)),
+            lambda: build_chart(df, idx, i_start, i_end)
+        )
+    else:
+        period_res, df_chart = cache.portfolios.get_or_compute(
+            cache.portfolio_key(files, weights, (start_year, end_year)),
+            lambda: build_period(df, idx, i_start, i_end)
+        )
+else:
+    i_start, i_end, period_res, df_chart = cache.portfolios.get_or_compute(
+        cache.portfolio_key(files, weights, (start_year, end_year)),
+        lambda: fetch_period(files, weights, start_year, end_year)
+    )
 
 # 安全檢查：是否有資料
-if df_period.empty:
+if df_chart.empty:
     st.warning("❗ 選定的區間內無資料，請重新選擇年份")
 else:
-    # 總報酬率
-    total_return = (1 + df_period["PortRet"]).prod() - 1
-    # 有幾個交易日
-    n_days = len(df_period)
     # 年化報酬率
-    ann_return = (1 + total_return) ** (252 / n_days) - 1
+    ann_return = period_res['cagr']
     # 年化波動率
-    ann_volatility = df_period["PortRet"].std() * np.sqrt(252)
+    ann_volatility = period_res['vol']
 
     # 顯示結果
     st.markdown(f"✅ **{start_year} ~ {end_year}** 區間：")
     st.markdown(f"<h4>🔸 年化報酬率（CAGR）: {ann_return:.2%}</h4>", unsafe_allow_html=True)
     st.markdown(f"<h4>🔸 年化波動率（Volatility）: {ann_volatility:.2%}</h4>", unsafe_allow_html=True)
-    risk_free_rate = 0.02  # 無風險利率，例如 2%
-    sharpe_ratio = (ann_return - risk_free_rate) / ann_volatility
+    sharpe_ratio = period_res['sharpe']
     st.markdown(f"<h4>🔸 夏普比率（Sharpe Ratio）: {sharpe_ratio:.2f}</h4> ", unsafe_allow_html=True)
+    st.markdown(f"<h4>🔸 最大回撤（Max Drawdown）: {period_res['mdd']:.2%}</h4>", unsafe_allow_html=True)
     st.markdown(f"(無風險利率，假設 2%)")
-    base_value = df_period.iloc[0]['Cumulative Return']
 
 
 
 
 st.subheader(f"📈 {start_year} ~ {end_year} 的累積報酬走勢")
 
-# 篩選區間資料
-# 直接拿剛剛算好的 df_period（一開始就只包含選定的年份）
-df_chart = df_period.copy()
-
-# 重新從 1 開始累積報酬
-df_chart['CumRetRebased'] = (1 + df_chart['PortRet']).cumprod() - 1
-
-line = alt.Chart(df_chart).mark_line(color="steelblue").encode(
+# 圖表只送約 render.DEFAULT_POINTS 個點；放大的日期區間夠短時即為全解析度
+zoom = (None, None)
+if len(df_chart) > 1:
+    chart_dates = df_chart['Date'].dt.date
+    zoom = st.slider("放大檢視日期區間", min_value=chart_dates.iloc[0], max_value=chart_dates.iloc[-1],
+                     value=(chart_dates.iloc[0], chart_dates.iloc[-1]), format="YYYY-MM-DD")
+df_chart_view = render.downsample(df_chart, 'Date', 'CumRetRebased',
+                                  start=pd.Timestamp(zoom[0]) if zoom[0] else None,
+                                  end=pd.Timestamp(zoom[1]) if zoom[1] else None)
+
+line = alt.Chart(df_chart_view).mark_line(color="steelblue").encode(
     x=alt.X("Date:T", title="日期"),
     y=alt.Y("CumRetRebased:Q", title="累積報酬率", scale=alt.Scale(zero=False)),
     tooltip=[
@@ -198,10 +267,10 @@ line = alt.Chart(df_chart).mark_line(color="steelblue").encode(
     width="container"
 ).interactive()
 
-st.altair_chart(line, use_container_width=True)
+st.altair_chart(measured('cumulative', line), use_container_width=True)
 
 
-metrics_df = pd.DataFrame(metrics).sort_values('Year')
+metrics_df = metrics.sort_values('Year')
 st.subheader("📅 每自然年度的年化績效")
 st.dataframe(
     metrics_df
@@ -209,4 +278,434 @@ st.dataframe(
       .style
       .format("{:.2%}")
 )
-# ----------------------------
+
+
+# 🔄 滾動視窗：前綴和建一次，切換視窗長度只需 O(T)
+st.subheader("🔄 滾動視窗風險指標")
+col_window, col_roll = st.columns(2)
+roll_window = col_window.select_slider("視窗長度", options=list(rolling.WINDOWS),
+                                       value=252, format_func=rolling.WINDOWS.get)
+roll_metric = col_roll.selectbox("指標", ['ret', 'vol', 'sharpe', 'mdd'],
+                                 format_func=lambda m: {'ret': '年化報酬率', 'vol': '年化波動率',
+                                                        'sharpe': '夏普比率', 'mdd': '最大回撤'}[m])
+with instrument.timer("rolling"):
+    roll = cache.portfolios.get_or_compute(
+        ('rolling',) + cache.portfolio_key(files, weights),
+        lambda: rolling.Rolling(np.vstack([df['PortRet'].to_numpy(), rets_mat]))
+    )
+    roll_names = ['投資組合', '長期公債', '短期公債', '大盤股市']
+    df_roll = roll.frame(roll_window, df['Date'], roll_names, risk_free_rate)
+    df_corr = roll.corr_frame(roll_window, df['Date'], roll_names)
+    df_corr = df_corr[~df_corr['pair'].str.startswith('投資組合')]  # 只看三檔資產之間
+
+df_roll = render.downsample(df_roll, 'Date', roll_metric, by='series')
+df_corr = render.downsample(df_corr, 'Date', 'corr', by='pair')
+
+roll_chart = alt.Chart(df_roll).mark_line().encode(
+    x=alt.X('Date:T', title='日期'),
+    y=alt.Y(f'{roll_metric}:Q', title=None,
+            axis=alt.Axis(format='.2f' if roll_metric == 'sharpe' else '%')),
+    color=alt.Color('series:N', title=None, sort=roll_names),
+    tooltip=[alt.Tooltip('Date:T', title='日期'), alt.Tooltip('series:N', title='序列'),
+             alt.Tooltip(f'{roll_metric}:Q', format='.2f' if roll_metric == 'sharpe' else '.2%')]
+)
+corr_chart = alt.Chart(df_corr).mark_line().encode(
+    x=alt.X('Date:T', title='日期'),
+    y=alt.Y('corr:Q', title='相關係數', scale=alt.Scale(domain=[-1, 1])),
+    color=alt.Color('pair:N', title=None),
+    tooltip=[alt.Tooltip('Date:T', title='日期'), alt.Tooltip('pair:N', title='資產'),
+             alt.Tooltip('corr:Q', title='相關係數', format='.2f')]
+)
+col_roll_chart, col_corr_chart = st.columns(2)
+col_roll_chart.altair_chart(measured('rolling', roll_chart.properties(height=350).interactive()), use_container_width=True)
+col_corr_chart.altair_chart(measured('correlation', corr_chart.properties(height=350).interactive()), use_container_width=True)
+
+
+# 🛡️ 最大回撤與不虧損持有期：排序 + 索引前綴最大值，不跑「進場日 × 持有期」雙迴圈
+st.subheader("🛡️ 最大回撤與不虧損持有期")
+with instrument.timer("drawdown"):
+    dd_res, df_start, df_horizon = cache.portfolios.get_or_compute(
+        ('drawdown',) + cache.portfolio_key(files, weights),
+        lambda: (drawdown.analyze(df['PortRet'], df['Date'].to_numpy()),
+                 drawdown.by_start(df['PortRet'], df['Date']),
+                 drawdown.horizon_table(df['PortRet']))
+    )
+recovery_text = (f"{pd.Timestamp(dd_res['recovery_date']):%Y-%m-%d}（谷底後 {dd_res['recovery_days']} 個交易日）"
+                 if dd_res['recovery_date'] is not None else "尚未回復")
+st.markdown(f"<h4>🔸 最大回撤：{dd_res['mdd']:.2%}</h4>", unsafe_allow_html=True)
+st.markdown(
+    f"高點 {pd.Timestamp(dd_res['peak_date']):%Y-%m-%d} → 谷底 {pd.Timestamp(dd_res['trough_date']):%Y-%m-%d}"
+    f" → 回復 {recovery_text}  \n"
+    f"最長水下期間：{dd_res['max_underwater_days']} 個交易日（約 {dd_res['max_underwater_days'] / 252:.1f} 年）"
+)
+st.markdown(f"<h4>🔸 持有滿 {dd_res['never_lose_years']:.1f} 年（{dd_res['never_lose_days']} 個交易日），"
+            f"歷史上任何一天進場都沒有虧損</h4>", unsafe_allow_html=True)
+
+# 面積圖用 min/max 降採樣，保留每一段的最高需持有年數
+start_chart = alt.Chart(render.downsample(df_start, 'Date', 'required_years', method='minmax')).mark_area(opacity=0.6, color='indianred').encode(
+    x=alt.X('Date:T', title='進場日'),
+    y=alt.Y('required_years:Q', title='需持有年數才不虧'),
+    tooltip=[alt.Tooltip('Date:T', title='進場日'),
+             alt.Tooltip('required_years:Q', title='需持有年數', format='.2f'),
+             alt.Tooltip('worst_after:Q', title='進場後最大跌幅', format='.2%')]
+)
+horizon_base = alt.Chart(df_horizon).encode(x=alt.X('years:Q', title='持有年數'))
+horizon_chart = (
+    horizon_base.mark_area(opacity=0.2, color='steelblue').encode(
+        y=alt.Y('worst:Q', title='年化報酬率（最差 ~ 最佳）', axis=alt.Axis(format='%')), y2='best:Q')
+    + horizon_base.mark_line(color='steelblue').encode(y='median:Q')
+    + horizon_base.mark_line(color='indianred', strokeDash=[4, 2]).encode(
+        y='loss_prob:Q',
+        tooltip=[alt.Tooltip('years:Q', title='持有年數', format='.2f'),
+                 alt.Tooltip('loss_prob:Q', title='虧損機率', format='.2%'),
+                 alt.Tooltip('worst:Q', title='最差年化', format='.2%')])
+)
+col_start, col_horizon = st.columns(2)
+col_start.altair_chart(measured('holding', start_chart.properties(height=350).interactive()), use_container_width=True)
+col_horizon.altair_chart(measured('horizon', horizon_chart.properties(height=350)), use_container_width=True)
+col_horizon.caption("藍色區域：各持有期所有進場日的最差～最佳年化報酬，藍線為中位數；紅色虛線為虧損機率")
+
+
+@instrument.cache_calls("never_lose_grid")
+@st.cache_data
+@instrument.cache_miss("never_lose_grid")
+def never_lose_grid(rets_mat):
+    W = grid.simplex_grid(3, 0.01)
+    res = drawdown.sweep(W, rets_mat)
+    return pd.DataFrame({'w_20': W[:, 0], 'w_1to3': W[:, 1], 'w_spy': W[:, 2], **res})
+
+if st.checkbox("計算全部配置的不虧損持有期（5151 組，約需數秒）"):
+    df_never = never_lose_grid(rets_mat)
+    never_heat = alt.Chart(df_never).mark_rect().encode(
+        x=alt.X('w_spy:O', title='大盤股市比例', axis=alt.Axis(format='.0%', values=[i / 10 for i in range(11)])),
+        y=alt.Y('w_20:O', title='長期公債比例', sort='descending',
+                axis=alt.Axis(format='.0%', values=[i / 10 for i in range(11)])),
+        color=alt.Color('never_lose_years:Q', title='不虧損持有年數', scale=alt.Scale(scheme='redyellowgreen', reverse=True)),
+        tooltip=[alt.Tooltip('w_20:Q', title='長期公債', format='.0%'),
+                 alt.Tooltip('w_1to3:Q', title='短期公債', format='.0%'),
+                 alt.Tooltip('w_spy:Q', title='大盤股市', format='.0%'),
+                 alt.Tooltip('never_lose_years:Q', title='不虧損持有年數', format='.2f'),
+                 alt.Tooltip('mdd:Q', title='最大回撤', format='.2%')]
+    )
+    st.altair_chart(measured('never_lose', never_heat.properties(height=400)), use_container_width=True)
+
+
+# 🧯 壓力情境：自動偵測的歷史危機區間 + 自訂利率 / 股市衝擊，情境 × 配置一次批次計算
+st.subheader("🧯 壓力情境（歷史危機與自訂衝擊）")
+asset_keys = scenario.names_of(files)
+col_bp, col_eq, col_days, col_reb = st.columns(4)
+sc_bp = col_bp.slider("利率變動（bp）", -300, 300, 200, step=25)
+sc_equity = col_eq.slider("股市跌幅", -0.50, 0.0, -0.30, step=0.05, format="%.2f")
+sc_days = col_days.select_slider("衝擊發生天數", options=[1, 5, 21, 63], value=1)
+sc_rebalance = col_reb.selectbox("情境內再平衡", ['daily', 'none'],
+                                 format_func={'daily': '每日再平衡', 'none': '買進持有'}.get)
+with st.expander("各資產的存續期間（年）與股市 beta"):
+    cols_sens = st.columns(3)
+    sc_durations = {k: c.number_input(f"{n} 存續期間", 0.0, 30.0, scenario.DURATIONS.get(k, 0.0), step=0.5)
+                    for k, n, c in zip(asset_keys, asset_names, cols_sens)}
+    sc_betas = {k: c.number_input(f"{n} 股市 beta", 0.0, 2.0, scenario.EQUITY_BETAS.get(k, 0.0), step=0.1)
+                for k, n, c in zip(asset_keys, asset_names, cols_sens)}
+
+with instrument.timer("scenario"):
+    sc_history = cache.portfolios.get_or_compute(
+        ('scenario', cache.files_key(files)),
+        lambda: scenario.detect(pd.DataFrame(rets_mat.T, index=pd.DatetimeIndex(df['Date']), columns=asset_names))
+    )
+    sc_list = sc_history + [
+        scenario.shock(asset_keys, rate_bp=sc_bp, days=sc_days, durations=sc_durations, betas=sc_betas),
+        scenario.shock(asset_keys, equity=sc_equity, days=sc_days, durations=sc_durations, betas=sc_betas),
+        scenario.shock(asset_keys, rate_bp=sc_bp, equity=sc_equity, days=sc_days,
+                       durations=sc_durations, betas=sc_betas),
+    ]
+    sc_grid = grid.simplex_grid(3, 0.01)
+
+    def scenario_grid_best():
+        # 整個 1% 網格只和情境有關，與目前配置無關：每個情境只留最佳配置與其報酬
+        total = scenario.evaluate(sc_list, sc_grid, rebalance=sc_rebalance)['total']
+        best = total.argmax(axis=1)
+        return best, total[np.arange(len(sc_list)), best]
+
+    # 網格結果依檔案 + 衝擊參數 + 再平衡方式共用；拖動配置滑桿時只重算下面幾組具名配置
+    sc_best, sc_best_total = cache.portfolios.get_or_compute(
+        ('scenario_grid', cache.files_key(files), sc_bp, sc_equity, sc_days,
+         tuple(sc_durations.values()), tuple(sc_betas.values()), sc_rebalance),
+        scenario_grid_best
+    )
+    sc_weights = np.vstack([weights, np.eye(3), np.full(3, 1 / 3)])
+    sc_labels = ['目前配置'] + asset_names + ['三等分']
+    sc_res = scenario.evaluate(sc_list, sc_weights, rebalance=sc_rebalance)
+
+df_sc = pd.DataFrame(sc_res['total'], index=[s.name for s in sc_list], columns=sc_labels)
+df_sc['網格最佳'] = sc_best_total
+df_sc['最佳配置（長債 / 短債 / 股市）'] = [" / ".join(f"{x:.0%}" for x in sc_grid[b]) for b in sc_best]
+df_sc['目前配置最大回撤'] = sc_res['mdd'][:, 0]
+st.dataframe(
+    df_sc.rename_axis('情境').style.format(
+        {**{c: '{:.2%}' for c in sc_labels}, '網格最佳': '{:.2%}', '目前配置最大回撤': '{:.2%}'})
+)
+st.caption(f"歷史區間為各資產最深的高點→谷底回撤（自動偵測）；「網格最佳」為 {len(sc_grid)} 組 1% 網格配置中該情境報酬最高者")
+
+
+# 💸 提領模擬：所有進場日 × 所有提領次數一次批次計算，任何提領率的成功率只是一次比較
+st.subheader("💸 退休提領模擬（安全提領率）")
+rule_names = {'fixed': '固定金額', 'inflation': '固定金額＋通膨調整', 'percent': '固定比例'}
+col_rule, col_years_wd, col_rate, col_every = st.columns(4)
+wd_rule = col_rule.selectbox("提領規則", withdrawal.RULES, index=1, format_func=rule_names.get)
+wd_years = col_years_wd.slider("提領年數", 1, 15, 10)
+wd_rate = col_rate.slider("年提領率（期初資金的比例）", 0.01, 0.15, 0.04, step=0.005, format="%.3f")
+wd_every = col_every.select_slider("提領頻率", options=list(withdrawal.EVERY), value=21,
+                                   format_func=withdrawal.EVERY.get)
+wd_inflation = 0.03
+if wd_rule == 'inflation':
+    wd_inflation = st.number_input("每年通膨率", 0.0, 0.10, 0.03, step=0.005, format="%.3f")
+
+with instrument.timer("withdrawal"):
+    wd_level = prefix.log_wealth(df['PortRet'])
+    if wd_rule == 'percent':
+        wd_starts, wd_final, wd_floor = cache.portfolios.get_or_compute(
+            ('withdrawal',) + cache.portfolio_key(files, weights) + (wd_rule, wd_years, wd_rate, wd_every),
+            lambda: withdrawal.percent_paths(wd_level, wd_rate, wd_years, wd_every)
+        )
+    else:
+        wd_starts, wd_max = cache.portfolios.get_or_compute(
+            ('withdrawal',) + cache.portfolio_key(files, weights) + (wd_rule, wd_years, wd_every, wd_inflation),
+            lambda: withdrawal.max_rates(wd_level, wd_years, wd_rule, wd_every, inflation=wd_inflation)
+        )
+
+if len(wd_starts) == 0:
+    st.warning("❗ 資料長度不足以觀察完整的提領年數，請縮短年數")
+elif wd_rule == 'percent':
+    st.markdown(f"<h4>🔸 期末資金（期初 = 1）：中位 {np.median(wd_final):.2f}，最差 {wd_final.min():.2f}</h4>",
+                unsafe_allow_html=True)
+    st.markdown(f"<h4>🔸 單次提領金額最低降到第一次的 {wd_floor.min():.0%}</h4>", unsafe_allow_html=True)
+    st.markdown(f"固定比例提領不會耗盡資金；共 {len(wd_starts):,} 個進場日")
+    df_final = pd.DataFrame({'Date': df['Date'].to_numpy()[wd_starts], 'final': wd_final[0]})
+    final_chart = alt.Chart(render.downsample(df_final, 'Date', 'final')).mark_line(color='steelblue').encode(
+        x=alt.X('Date:T', title='開始提領日'),
+        y=alt.Y('final:Q', title='期末資金（期初 = 1）'),
+        tooltip=[alt.Tooltip('Date:T', title='開始提領日'), alt.Tooltip('final:Q', title='期末資金', format='.2f')]
+    )
+    st.altair_chart(measured('withdrawal', final_chart.properties(height=350).interactive()), use_container_width=True)
+else:
+    wd_success = withdrawal.success_rates(wd_max, [wd_rate])[0, 0]
+    st.markdown(f"<h4>🔸 年提領 {wd_rate:.1%}、持續 {wd_years} 年的成功率：{wd_success:.1%}</h4>",
+                unsafe_allow_html=True)
+    st.markdown(f"<h4>🔸 最差進場日仍可持續的最大提領率：{wd_max.min():.2%}（中位數 {np.median(wd_max):.2%}）</h4>",
+                unsafe_allow_html=True)
+    st.markdown(f"共 {len(wd_starts):,} 個進場日；提領於每期期初，{wd_years} 年後資金恰好用完即算成功")
+
+    df_wd = pd.DataFrame({'Date': df['Date'].to_numpy()[wd_starts], 'max_rate': wd_max[0]})
+    wd_chart = (
+        alt.Chart(render.downsample(df_wd, 'Date', 'max_rate')).mark_line(color='steelblue').encode(
+            x=alt.X('Date:T', title='開始提領日'),
+            y=alt.Y('max_rate:Q', title='可持續的最大年提領率', axis=alt.Axis(format='%')),
+            tooltip=[alt.Tooltip('Date:T', title='開始提領日'),
+                     alt.Tooltip('max_rate:Q', title='最大提領率', format='.2%')])
+        + alt.Chart(pd.DataFrame({'rate': [wd_rate]})).mark_rule(color='indianred', strokeDash=[4, 2]).encode(y='rate:Q')
+    )
+    wd_grid_rates = np.arange(0.01, 0.2001, 0.0025)
+    df_curve = pd.DataFrame({'rate': wd_grid_rates, 'success': withdrawal.success_rates(wd_max, wd_grid_rates)[0]})
+    curve_chart = alt.Chart(df_curve).mark_line(color='steelblue').encode(
+        x=alt.X('rate:Q', title='年提領率', axis=alt.Axis(format='%')),
+        y=alt.Y('success:Q', title='成功率', axis=alt.Axis(format='%'), scale=alt.Scale(domain=[0, 1])),
+        tooltip=[alt.Tooltip('rate:Q', title='年提領率', format='.2%'), alt.Tooltip('success:Q', title='成功率', format='.1%')]
+    )
+    col_wd, col_curve = st.columns(2)
+    col_wd.altair_chart(measured('withdrawal', wd_chart.properties(height=350).interactive()), use_container_width=True)
+    col_curve.altair_chart(measured('withdrawal_success', curve_chart.properties(height=350)), use_container_width=True)
+
+    @instrument.cache_calls("withdrawal_grid")
+    @st.cache_data
+    @instrument.cache_miss("withdrawal_grid")
+    def withdrawal_grid(rets_mat, years, rule, every, inflation):
+        W = grid.simplex_grid(3, 0.05)
+        res = withdrawal.sweep(W, rets_mat, years, [], rule, every, inflation=inflation)
+        return pd.DataFrame({'w_20': W[:, 0], 'w_1to3': W[:, 1], 'w_spy': W[:, 2],
+                             'safe_rate': res['safe_rate'], 'median_rate': res['median_rate']})
+
+    if st.checkbox("比較全部配置的安全提領率（5% 網格，231 組，約需數秒）"):
+        df_wd_grid = withdrawal_grid(rets_mat, wd_years, wd_rule, wd_every, wd_inflation)
+        wd_heat = alt.Chart(df_wd_grid).mark_rect().encode(
+            x=alt.X('w_spy:O', title='大盤股市比例', axis=alt.Axis(format='.0%')),
+            y=alt.Y('w_20:O', title='長期公債比例', sort='descending', axis=alt.Axis(format='.0%')),
+            color=alt.Color('safe_rate:Q', title='最差情況提領率', scale=alt.Scale(scheme='viridis')),
+            tooltip=[alt.Tooltip('w_20:Q', title='長期公債', format='.0%'),
+                     alt.Tooltip('w_1to3:Q', title='短期公債', format='.0%'),
+                     alt.Tooltip('w_spy:Q', title='大盤股市', format='.0%'),
+                     alt.Tooltip('safe_rate:Q', title='最差情況提領率', format='.2%'),
+                     alt.Tooltip('median_rate:Q', title='中位提領率', format='.2%')]
+        )
+        st.altair_chart(measured('withdrawal_grid', wd_heat.properties(height=400)), use_container_width=True)
+
+
+# 🧭 整個配置單純形（1% 網格，共 5151 組）一次批次計算，結果依資料快取
+@instrument.cache_calls("grid_metrics")
+@st.cache_data
+@instrument.cache_miss("grid_metrics")
+def grid_metrics(rets_mat):
+    W = grid.simplex_grid(3, 0.01)
+    res = grid.evaluate(W, rets_mat, risk_free_rate=0.02)
+    return pd.DataFrame({'w_20': W[:, 0], 'w_1to3': W[:, 1], 'w_spy': W[:, 2], **res})
+
+st.subheader("🧭 全部配置的效率前緣（全期間）")
+df_grid = grid_metrics(rets_mat)
+current = pd.DataFrame({
+    'w_20': [w_20], 'w_1to3': [w_1to3], 'w_spy': [w_spy],
+    **grid.evaluate(weights, rets_mat, risk_free_rate=0.02)
+})
+
+grid_tooltip = [
+    alt.Tooltip('w_20:Q', title='長期公債', format='.0%'),
+    alt.Tooltip('w_1to3:Q', title='短期公債', format='.0%'),
+    alt.Tooltip('w_spy:Q', title='大盤股市', format='.0%'),
+    alt.Tooltip('cagr:Q', title='CAGR', format='.2%'),
+    alt.Tooltip('vol:Q', title='波動率', format='.2%'),
+    alt.Tooltip('sharpe:Q', title='夏普比率', format='.2f'),
+    alt.Tooltip('mdd:Q', title='最大回撤', format='.2%'),
+]
+frontier = alt.Chart(df_grid).mark_circle(size=12, opacity=0.6).encode(
+    x=alt.X('vol:Q', title='年化波動率', axis=alt.Axis(format='%')),
+    y=alt.Y('cagr:Q', title='年化報酬率（CAGR）', axis=alt.Axis(format='%'), scale=alt.Scale(zero=False)),
+    color=alt.Color('sharpe:Q', title='夏普比率', scale=alt.Scale(scheme='viridis')),
+    tooltip=grid_tooltip
+)
+current_point = alt.Chart(current).mark_point(color='red', size=200, filled=True, shape='diamond').encode(
+    x='vol:Q', y='cagr:Q', tooltip=grid_tooltip
+)
+
+heat_metric = st.selectbox("熱度圖指標", ['sharpe', 'cagr', 'vol', 'mdd'],
+                           format_func=lambda m: {'sharpe': '夏普比率', 'cagr': '年化報酬率',
+                                                  'vol': '年化波動率', 'mdd': '最大回撤'}[m])
+heatmap = alt.Chart(df_grid).mark_rect().encode(
+    x=alt.X('w_spy:O', title='大盤股市比例', axis=alt.Axis(format='.0%', values=[i / 10 for i in range(11)])),
+    y=alt.Y('w_20:O', title='長期公債比例', sort='descending',
+            axis=alt.Axis(format='.0%', values=[i / 10 for i in range(11)])),
+    color=alt.Color(f'{heat_metric}:Q', title=None, scale=alt.Scale(scheme='viridis')),
+    tooltip=grid_tooltip
+)
+
+col_frontier, col_heat = st.columns(2)
+col_frontier.altair_chart(measured('frontier', (frontier + current_point).properties(height=400).interactive()),
+                          use_container_width=True)
+col_heat.altair_chart(measured('heatmap', heatmap.properties(height=400)), use_container_width=True)
+
+
+# 🎯 最佳化配置：所選區間與每個自然年度，四種目標一次批次求解
+st.subheader("🎯 最佳化配置")
+objective_names = {'min_variance': '最小變異', 'max_sharpe': '最大夏普', 'target_vol': '目標波動',
+                   'risk_parity': '風險平價'}
+col_obj, col_target = st.columns(2)
+opt_objective = col_obj.selectbox("逐年最佳配置的目標", optimize.OBJECTIVES, index=1, format_func=objective_names.get)
+opt_target = col_target.slider("目標波動率", 0.02, 0.20, 0.10, step=0.01)
+
+frame_opt = pd.DataFrame(rets_mat.T, index=pd.DatetimeIndex(df['Date']), columns=asset_names)
+with instrument.timer("optimize"):
+    opt_range = cache.portfolios.get_or_compute(
+        ('optimize', cache.files_key(files), (start_year, end_year), opt_target),
+        lambda: optimize.by_period(frame_opt, target=opt_target, labels=[f"{start_year}~{end_year}"],
+                                   bounds=[(i_start, i_end)])
+    )
+    opt_years = cache.portfolios.get_or_compute(
+        ('optimize', cache.files_key(files), 'year', opt_objective, opt_target),
+        lambda: optimize.by_period(frame_opt, objectives=(opt_objective,), target=opt_target)
+    )
+opt_columns = {'cagr': '年化報酬率', 'vol': '年化波動率', 'sharpe': '夏普比率'}
+opt_format = {**{a: '{:.0%}' for a in asset_names}, '年化報酬率': '{:.2%}', '年化波動率': '{:.2%}', '夏普比率': '{:.2f}'}
+st.markdown(f"**{start_year} ~ {end_year}** 區間的最佳配置（只做多、總和 100%，無風險利率 2%）")
+st.dataframe(
+    opt_range.assign(objective=opt_range['objective'].map(objective_names))
+      .set_index('objective')[asset_names + list(opt_columns)]
+      .rename(columns=opt_columns).rename_axis('目標')
+      .style.format(opt_format)
+)
+st.markdown(f"每個自然年度的{objective_names[opt_objective]}配置（事後最佳，僅供比較）")
+st.dataframe(
+    opt_years.set_index('period')[asset_names + list(opt_columns)]
+      .rename(columns=opt_columns).rename_axis('年度')
+      .style.format(opt_format)
+)
+
+
+# 🎲 區塊拔靴蒙地卡羅：以歷史日報酬區塊重組出大量可能路徑
+st.subheader("🎲 蒙地卡羅情境模擬（區塊拔靴）")
+col_paths, col_years, col_block = st.columns(3)
+mc_paths = col_paths.select_slider("模擬路徑數", options=[1000, 5000, 10000, 50000, 100000], value=10000)
+mc_years = col_years.slider("模擬年數", 1, 30, 10)
+mc_block = col_block.select_slider("區塊長度（交易日）", options=[5, 10, 21, 63, 126, 252], value=21)
+
+with instrument.timer("montecarlo"):
+    mc_res = cache.portfolios.get_or_compute(
+        ('mc',) + cache.portfolio_key(files, weights) + (mc_paths, mc_years, mc_block),
+        lambda: simulate.simulate(rets_mat, weights, n_paths=mc_paths, horizon=mc_years * 252,
+                                  block=mc_block, seed=0)
+    )
+
+df_bands = pd.DataFrame(mc_res['bands'].T, columns=[f"P{p:g}" for p in mc_res['percentiles']])
+df_bands['Year'] = mc_res['band_days'] / 252
+fan = alt.Chart(df_bands).encode(x=alt.X('Year:Q', title='年'))
+fan_chart = (
+    fan.mark_area(opacity=0.2, color='steelblue').encode(y=alt.Y('P5:Q', title='財富（期初 = 1）'), y2='P95:Q')
+    + fan.mark_area(opacity=0.35, color='steelblue').encode(y='P25:Q', y2='P75:Q')
+    + fan.mark_line(color='steelblue').encode(y='P50:Q')
+)
+col_fan, col_mc = st.columns([2, 1])
+col_fan.altair_chart(measured('montecarlo', fan_chart.properties(height=350)), use_container_width=True)
+col_mc.dataframe(simulate.summary_frame(mc_res).style.format({'期末財富': '{:.2f}', '年化報酬率': '{:.2%}', '最大回撤': '{:.2%}'}))
+col_mc.markdown(f"虧損機率：**{mc_res['loss_prob']:.2%}**（{mc_res['n_paths']:,} 條路徑）")
+
+# ⚖️ 再平衡策略比較：上面的計算都隱含「每日再平衡」，這裡改用實際持股回測
+st.subheader("⚖️ 再平衡策略比較")
+col_cost, col_band, col_div = st.columns(3)
+bt_cost_bp = col_cost.number_input("單邊交易成本（bp）", 0.0, 100.0, 5.0, step=1.0)
+bt_band = col_band.slider("門檻再平衡：權重偏離上限", 0.01, 0.20, 0.05, step=0.01)
+bt_reinvest = col_div.checkbox("股息再投入", value=True)
+
+with instrument.timer("backtest"):
+    market = cache.portfolios.get_or_compute(('market', cache.files_key(files)),
+                                             lambda: backtest.Market.from_files(files))
+policy_names = {'daily': '每日再平衡', 'buy_and_hold': '買進持有', 'monthly': '每月再平衡',
+                'quarterly': '每季再平衡', 'annual': '每年再平衡', 'band': f'偏離 {bt_band:.0%} 再平衡'}
+with instrument.timer("backtest"):
+    df_policy = cache.portfolios.get_or_compute(
+        ('backtest',) + cache.portfolio_key(files, weights) + (bt_cost_bp, bt_band, bt_reinvest),
+        lambda: backtest.sweep(market, weights, band=bt_band, cost=bt_cost_bp / 1e4, reinvest=bt_reinvest)
+    )
+st.dataframe(
+    df_policy.assign(policy=df_policy['policy'].map(policy_names))
+      .set_index('policy')[['cagr', 'vol', 'sharpe', 'mdd', 'turnover', 'n_rebalances']]
+      .rename(columns={'cagr': '年化報酬率', 'vol': '年化波動率', 'sharpe': '夏普比率',
+                       'mdd': '最大回撤', 'turnover': '累計換手率', 'n_rebalances': '再平衡次數'})
+      .rename_axis('策略')
+      .style.format({'年化報酬率': '{:.2%}', '年化波動率': '{:.2%}', '夏普比率': '{:.2f}',
+                     '最大回撤': '{:.2%}', '累計換手率': '{:.2f}'})
+)
+# 🐞 效能除錯面板：本次重跑的各階段耗時、行程累計、快取命中率與 Prometheus 文字輸出
+instrument.registry.observe("rerun", time.perf_counter() - _run_t0)
+run = instrument.registry.end_run()
+if debug:
+    with st.sidebar:
+        st.subheader("🐞 效能除錯")
+        st.markdown("**本次重跑**")
+        st.dataframe(
+            pd.DataFrame(run['stages'], columns=['階段', '秒']).groupby('階段', sort=False).sum()
+              .style.format('{:.4f}')
+        )
+        timers, counters = instrument.registry.snapshot()
+        st.markdown("**行程累計**")
+        st.dataframe(
+            pd.DataFrame([(k, n, total, total / n, longest) for k, (n, total, longest) in sorted(timers.items())],
+                         columns=['階段', '次數', '總秒數', '平均', '最長']).set_index('階段')
+              .style.format({'總秒數': '{:.3f}', '平均': '{:.4f}', '最長': '{:.4f}'})
+        )
+        st.markdown("**快取**")
+        lru = cache.portfolios.stats()
+        st.dataframe(
+            pd.DataFrame(instrument.cache_table() + [('portfolios (LRU)', lru['hits'] + lru['misses'], lru['misses'], lru['hits'])],
+                         columns=['快取', '呼叫', '未命中', '命中']).set_index('快取')
+        )
+        chart_kb = {dict(labels)['chart']: v / 1024 for (name, labels), v in run['counters'].items() if name == 'chart_bytes'}
+        if chart_kb:
+            st.markdown(f"**本次圖表資料**：共 {sum(chart_kb.values()):,.0f} KB")
+            st.dataframe(pd.Series(chart_kb, name='KB').rename_axis('圖表').to_frame().style.format('{:.1f}'))
+        with st.expander("Prometheus 文字輸出"):
+            st.code(instrument.registry.prometheus({'portfolios': cache.portfolios}), language='text')
@@ -3,6 +3,9 @@ import pandas as pd
 import numpy as np
 import os
 import altair as alt  # 新增 Altair
+import data
+import prefix
+import analytics
 
 st.set_page_config(page_title="Bond‐Stock 配置計算器", layout="wide")
 st.title("20+年期公債、1~3年期公債 與 SPY 配置分析")
@@ -69,60 +72,28 @@ st.sidebar.altair_chart((bars + labels).properties(height=80), use_container_wid
 
 # 接下來載入資料、計算日報酬、累積報酬等（不變）
 @st.cache_data
-def load_returns(path):
-    df = pd.read_csv(path, parse_dates=['Date']).sort_values('Date')
-    df['Price'] = pd.to_numeric(df['Price'].astype(str)
-                                .str.replace("'", "")
-                                .str.replace(",", ""), errors='coerce')
-    df['Dividend'] = pd.to_numeric(df['Dividend'], errors='coerce').fillna(0.0)
-    df['Return'] = (df['Price'] + df['Dividend']) / df['Price'].shift(1) - 1
-    return df[['Date','Return']].dropna()
-
-df20  = load_returns(file_20plus).rename(columns={'Return':'Ret20'})
-df13  = load_returns(file_1to3)  .rename(columns={'Return':'Ret1to3'})
-dfspy = load_returns(file_spy)   .rename(columns={'Return':'RetSPY'})
-
-df = df20.merge(df13, on='Date', how='inner')\
-         .merge(dfspy, on='Date', how='inner')
+def load_matrix(paths, names):
+    # 共用資料層（data.py）：一次排序合併出以日期為索引的 (T × N) 報酬矩陣
+    return data.load_matrix(paths, names)
+
+files = [file_20plus, file_1to3, file_spy]
+df = load_matrix(files, ['Ret20', 'Ret1to3', 'RetSPY']).reset_index()
 
 weights = np.array([w_20, w_1to3, w_spy])
-rets_mat = df[['Ret20','Ret1to3','RetSPY']].to_numpy().T
+rets_mat = data.rets_mat(df[['Ret20','Ret1to3','RetSPY']])
 df['PortRet'] = weights.dot(rets_mat)
-df['Cumulative Return'] = (1 + df['PortRet']).cumprod() - 1
 
 # ----------------------------
 # 先把 df 重設 index，方便用 iloc 切片
-df['Date'] = (
-    df['Date']
-          # 1. 去掉單引號、雙引號
-      .str.replace("'",  "", regex=False)
-      .str.replace('"',  "", regex=False)
-      # 2. 把「年」->"-"、「月」->"-」、「日」->"" 
-      .str.replace('年', '-', regex=False)
-      .str.replace('月', '-', regex=False)
-      .str.replace('日',  '', regex=False)
-      .str.replace(r'(\d{4})年(\d{1,2})月(\d{1,2})日', r'\1-\2-\3', regex=True)
-)
-df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d')
 df = df.reset_index(drop=True)
 df['Year'] = df['Date'].dt.year
-# 🗓️ 計算每 252 天為一期的年化績效
-window = 252
-metrics = []
-for year, grp in df.groupby('Year'):
-    # 該年的總報酬（幾何相乘 -1）
-    total_ret = (1 + grp['PortRet']).prod() - 1
-    # 該年實際交易日數
-    n = len(grp)
-    # 年化平均報酬：根據實際天數 n 年化到 252 天
-    ann_ret_i = ((1 + total_ret) ** (252 / n) - 1)
-    # 年化波動度：日波動 * sqrt(252)
-    ann_vol_i = grp['PortRet'].std() * np.sqrt(252)
-    metrics.append({
-        'Year': year,
-        '年化報酬率': ann_ret_i,
-        '年度波動率': ann_vol_i
-    })
+# 以前綴和索引取代逐年 groupby 與區間 cumprod/prod/std：任意區間都是常數時間查表
+idx = prefix.PrefixIndex(df['PortRet'].to_numpy(), df['Date'].to_numpy())
+df['Cumulative Return'] = idx.cumulative(0, len(idx))
+# 🗓️ 每個自然年度的年化績效
+metrics = analytics.yearly_metrics(idx)
+metrics = metrics[['year', 'cagr', 'vol']].rename(
+    columns={'year': 'Year', 'cagr': '年化報酬率', 'vol': '年度波動率'})
 
 # 🎯 加入 Streamlit 年度範圍選擇器
 st.subheader("📆 自訂區間績效計算")
@@ -132,42 +103,35 @@ max_year = df['Year'].max()
 start_year, end_year = st.slider("選擇起迄年份", min_value=int(min_year), max_value=int(max_year), value=(2010, 2020))
 
 # 篩選出該期間資料
-df_period = df[(df["Year"] >= start_year) & (df["Year"] <= end_year)]
+i_start, i_end = idx.year_bounds(start_year, end_year)
+df_period = df.iloc[i_start:i_end]
 
 # 安全檢查：是否有資料
 if df_period.empty:
     st.warning("❗ 選定的區間內無資料，請重新選擇年份")
 else:
-    # 總報酬率
-    total_return = (1 + df_period["PortRet"]).prod() - 1
-    # 有幾個交易日
-    n_days = len(df_period)
+    risk_free_rate = 0.02  # 無風險利率，例如 2%
+    period_res = idx.range_metrics(i_start, i_end, risk_free_rate)
     # 年化報酬率
-    ann_return = (1 + total_return) ** (252 / n_days) - 1
+    ann_return = period_res['cagr']
     # 年化波動率
-    ann_volatility = df_period["PortRet"].std() * np.sqrt(252)
+    ann_volatility = period_res['vol']
 
     # 顯示結果
     st.markdown(f"✅ **{start_year} ~ {end_year}** 區間：")
     st.markdown(f"<h4>🔸 年化報酬率（CAGR）: {ann_return:.2%}</h4>", unsafe_allow_html=True)
     st.markdown(f"<h4>🔸 年化波動率（Volatility）: {ann_volatility:.2%}</h4>", unsafe_allow_html=True)
-    risk_free_rate = 0.02  # 無風險利率，例如 2%
-    sharpe_ratio = (ann_return - risk_free_rate) / ann_volatility
+    sharpe_ratio = period_res['sharpe']
     st.markdown(f"<h4>🔸 夏普比率（Sharpe Ratio）: {sharpe_ratio:.2f}</h4> ", unsafe_allow_html=True)
     st.markdown(f"(無風險利率，假設 2%)")
-    base_value = df_period.iloc[0]['Cumulative Return']
 
 
 
 
 st.subheader(f"📈 {start_year} ~ {end_year} 的累積報酬走勢")
 
-# 篩選區間資料
-# 篩選區間資料
-df_chart = df[(df['Year'] >= start_year) & (df['Year'] <= end_year)].copy()
-
-# 1. 按日期排序，确保第一个索引就是起点年第一天
-df_chart = df_chart.sort_values('Date')
+# 篩選區間資料（df 已依日期排序，直接用前綴索引給的位置切片）
+df_chart = df_period.copy()
 
 # 2. 取该区间首日的累積報酬作為基準
 base_value = df_chart['Cumulative Return'].iloc[0]
@@ -190,7 +154,7 @@ st.altair_chart(line, use_container_width=True)
 
 
 
-metrics_df = pd.DataFrame(metrics).sort_values('Year')
+metrics_df = metrics.sort_values('Year')
 st.subheader("📅 每自然年度的年化績效")
 st.dataframe(
     metrics_df
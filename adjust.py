@@ -1,4 +1,7 @@
 import csv
+import numpy as np
+import dates
+import store
 
 name = "spy"
 input_path  = f"{name}.csv"
@@ -29,9 +32,16 @@ with open(output_path, "w", newline="", encoding="utf-8") as fout:
     # 写表头
     writer.writerow(["Date", "Price", "Dividend"])
 
-    for date, entry in sorted(data_map.items()):
+    # 按实际日期排序（字符串排序会把 2005年10月 排在 2005年5月 之前）
+    keys = list(data_map)
+    order = np.argsort(dates.parse(keys), kind="stable")
+    for date in (keys[i] for i in order):
+        entry = data_map[date]
         price    = entry.get("price", "")
         dividend = entry.get("dividend", "")
         writer.writerow([date, price, dividend])
 
+# 同步寫入欄式 store，之後 UI 直接 memory-map 讀取
+store.ingest(output_path)
+
 print("Done")
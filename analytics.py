@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+import data
+import instrument
+import prefix
+
+# 組合分析函式庫：UI_bias.py / UI_test.py 的計算邏輯抽出為可匯入的模組
+# 只依賴 numpy / pandas，不載入 streamlit、altair，可給批次作業與 cli.py 使用
+
+RISK_FREE_RATE = 0.02  # 無風險利率，與 UI 相同假設 2%
+PERIODS = 252
+
+
+def portfolio(frame, weights):
+    # frame 為 data.load_matrix 的 (T × N) 報酬；回傳 (逐日組合 DataFrame, PrefixIndex)
+    port_ret = np.asarray(weights, dtype=np.float64) @ data.rets_mat(frame)
+    idx = prefix.PrefixIndex(port_ret, frame.index.to_numpy(), PERIODS)
+    port = pd.DataFrame({'Date': frame.index, 'PortRet': port_ret})
+    port['Year'] = port['Date'].dt.year
+    port['Cumulative Return'] = idx.cumulative(0, len(idx))
+    return port, idx
+
+
+def yearly_metrics(idx, skip_first=False, risk_free_rate=RISK_FREE_RATE):
+    # 每個自然年度的績效；skip_first 見 PrefixIndex.year_table
+    with instrument.timer("yearly"):
+        res = idx.year_table(skip_first=skip_first, risk_free_rate=risk_free_rate)
+    instrument.count("rows", len(idx), stage="yearly")
+    return pd.DataFrame({
+        'year': res['year'],
+        'n': res['n'],
+        'total_return': res['total_return'],
+        'cagr': res['cagr'],
+        'vol': res['vol'],
+        'sharpe': res['sharpe'],
+    })
+
+
+def range_bounds(dates, start=None, end=None):
+    # start / end 可為年份（int）或日期字串；年份代表整年，回傳 [i, j) 位置
+    dates = np.asarray(dates).astype('datetime64[D]')
+    lo = dates[0] if start is None else _as_date(start, first=True)
+    hi = dates[-1] if end is None else _as_date(end, first=False)
+    return np.searchsorted(dates, lo, side='left'), np.searchsorted(dates, hi, side='right')
+
+
+def _as_date(value, first):
+    if isinstance(value, (int, np.integer)) or (isinstance(value, str) and value.isdigit()):
+        return np.datetime64(f"{int(value)}-01-01" if first else f"{int(value)}-12-31", 'D')
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+def period_metrics(idx, start=None, end=None, risk_free_rate=RISK_FREE_RATE):
+    i, j = range_bounds(idx.dates, start, end)
+    res = idx.range_metrics(i, j, risk_free_rate)
+    return {k: int(v) if k == 'n' else float(v) for k, v in res.items()}
+
+
+def score(frame, weights, starts, ends, risk_free_rate=RISK_FREE_RATE, chunk=256):
+    # 批次評分：weights 為 (S × N)，starts / ends 長度 S（年份或日期）
+    # 相同權重只算一次前綴和，再以索引一次取出所有區間，不逐情境重算
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    rets_mat = data.rets_mat(frame)
+    dates = frame.index.to_numpy()
+    bounds = [range_bounds(dates, s, e) for s, e in zip(starts, ends)]
+    i = np.array([b[0] for b in bounds], dtype=np.int64)
+    j = np.array([b[1] for b in bounds], dtype=np.int64)
+
+    uniq, inverse = np.unique(weights, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    cols = {k: np.empty(len(weights)) for k in ('n', 'total_return', 'cagr', 'vol', 'sharpe')}
+    for lo in range(0, len(uniq), chunk):
+        port = uniq[lo:lo + chunk] @ rets_mat
+        sums = [np.zeros((len(port), port.shape[1] + 1)) for _ in range(3)]
+        np.cumsum(np.log1p(port), axis=1, out=sums[0][:, 1:])
+        np.cumsum(port, axis=1, out=sums[1][:, 1:])
+        np.cumsum(port * port, axis=1, out=sums[2][:, 1:])
+
+        rows = np.flatnonzero((inverse >= lo) & (inverse < lo + chunk))
+        u = inverse[rows] - lo
+        ii, jj = i[rows], j[rows]
+        res = prefix.metrics_from_sums(jj - ii, *(s[u, jj] - s[u, ii] for s in sums),
+                                       periods=PERIODS, risk_free_rate=risk_free_rate)
+        for k in cols:
+            cols[k][rows] = res[k]
+    cols['n'] = cols['n'].astype(np.int64)
+    return pd.DataFrame(cols)
+
+
+def analyze(paths, weights, start=None, end=None, skip_first=False, risk_free_rate=RISK_FREE_RATE):
+    # 單一配置的完整分析：區間績效 + 每年績效
+    frame = data.load_matrix(paths)
+    _, idx = portfolio(frame, weights)
+    return {
+        'files': list(paths),
+        'weights': [float(w) for w in weights],
+        'period': period_metrics(idx, start, end, risk_free_rate),
+        'yearly': yearly_metrics(idx, skip_first, risk_free_rate),
+    }
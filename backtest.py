@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+import data
+import prefix
+
+# 再平衡策略回測引擎
+# 支援：daily（每日再平衡，即 UI 中 weights.dot(rets_mat) 的隱含假設）、buy_and_hold、
+# monthly / quarterly / annual 日曆再平衡、band（權重偏離超過門檻才再平衡）
+# 兩次再平衡之間持股不變，資產價值 = 持有單位 × 累積成長因子，整段一次向量化計算，
+# 內層迴圈只跑「再平衡次數」而不是「交易日數」
+
+POLICIES = ("daily", "buy_and_hold", "monthly", "quarterly", "annual", "band")
+
+
+class Market:
+    # price_ret、div_yield 皆為 (N × T)：P_t / P_{t-1} - 1 與 D_t / P_{t-1}
+    # 時間點 0 為期初（尚未發生任何報酬），1..T 為各交易日收盤
+
+    def __init__(self, price_ret, div_yield, dates, names=None):
+        self.price_ret = np.asarray(price_ret, dtype=np.float64)
+        self.div_yield = np.asarray(div_yield, dtype=np.float64)
+        self.dates = np.asarray(dates)
+        self.names = list(names) if names is not None else [f"asset{i}" for i in range(len(self.price_ret))]
+        self.n_assets, self.n_days = self.price_ret.shape
+
+        self.total_ret = self.price_ret + self.div_yield
+        # 累積成長因子（含配息再投入 / 僅價格），第 0 欄為 1
+        self.growth_total = np.exp(prefix.prefix_cols(np.log1p(self.total_ret)))
+        self.growth_price = np.exp(prefix.prefix_cols(np.log1p(self.price_ret)))
+        # 不再投入時，單位持股自 0 起累積領到的股息（以期初 1 單位計）
+        self.div_cash = prefix.prefix_cols(self.growth_price[:, :-1] * self.div_yield)
+        self._calendar = {}
+
+    @classmethod
+    def from_files(cls, paths):
+        dates, price, dividend, names = data.load_prices(paths)
+        price_ret = price[:, 1:] / price[:, :-1] - 1
+        div_yield = dividend[:, 1:] / price[:, :-1]
+        return cls(price_ret, div_yield, dates[1:], names)
+
+    def rebalance_points(self, policy):
+        # 每個月 / 季 / 年最後一個交易日（不含最後一天），回傳時間點索引（1..T-1）
+        if policy not in self._calendar:
+            months = self.dates.astype("datetime64[M]").astype(np.int64)
+            key = {"monthly": months, "quarterly": months // 3, "annual": months // 12}[policy]
+            self._calendar[policy] = np.flatnonzero(key[1:] != key[:-1]) + 1
+        return self._calendar[policy]
+
+
+def _daily(market, w, cost):
+    # 每日再平衡：組合報酬 w·r；交易成本依當日漂移後調回目標權重的換手率估算
+    r = market.total_ret
+    port = w @ r
+    drifted = w[:, None] * (1 + r) / (1 + port)
+    turnover = np.abs(drifted - w[:, None]).sum(axis=0)
+    turnover[-1] = 0.0
+    net = (1 + port) * (1 - cost * turnover)
+    value = np.empty(market.n_days + 1)
+    value[0] = 1.0
+    np.cumprod(net, out=value[1:])
+    return value, float(turnover.sum()), market.n_days - 1
+
+
+def backtest(market, weights, policy="annual", band=0.05, cost=0.0, reinvest=True, scan=252):
+    # 回傳 value（長度 T+1 的組合淨值，期初 1）、turnover（累計換手率）、n_rebalances
+    # cost：單邊交易成本比例（例如 0.001 = 10bp），以調整前淨值估算，期初建倉不計
+    # reinvest=False 時股息留在現金，直到下一次再平衡才投入；buy_and_hold 則一直持有現金
+    w = np.asarray(weights, dtype=np.float64)
+    if policy not in POLICIES:
+        raise ValueError(f"未知的再平衡策略：{policy}，可用：{', '.join(POLICIES)}")
+    if policy == "daily":
+        value, turnover, n_rebalances = _daily(market, w, cost)
+        return {"value": value, "turnover": turnover, "n_rebalances": n_rebalances}
+
+    T = market.n_days
+    G = market.growth_total if reinvest else market.growth_price
+    calendar = market.rebalance_points(policy) if policy in ("monthly", "quarterly", "annual") else None
+
+    value = np.empty(T + 1)
+    value[0] = 1.0
+    units = w.copy()          # 期初 G[:, 0] = 1，單位數 = 投入金額
+    cash = 0.0
+    turnover = 0.0
+    n_rebalances = 0
+    s = 0
+    k = 0
+    while s < T:
+        if calendar is not None:
+            while k < len(calendar) and calendar[k] <= s:
+                k += 1
+            e = calendar[k] if k < len(calendar) else T
+            rebalance = e < T
+        elif policy == "band":
+            e = min(T, s + scan)
+            rebalance = False
+        else:
+            e = T
+            rebalance = False
+
+        held = units[:, None] * G[:, s + 1:e + 1]
+        seg = held.sum(axis=0)
+        if not reinvest:
+            cash_path = cash + units @ (market.div_cash[:, s + 1:e + 1] - market.div_cash[:, s][:, None])
+            seg = seg + cash_path
+
+        if policy == "band":
+            breach = np.abs(held / seg - w[:, None]).max(axis=0) > band
+            if breach.any():
+                hit = int(np.argmax(breach))
+                e = s + 1 + hit
+                seg = seg[:hit + 1]
+                rebalance = e < T
+
+        value[s + 1:e + 1] = seg
+        if not reinvest:
+            cash = float(cash_path[e - s - 1])
+        if rebalance:
+            holdings = units * G[:, e]
+            total = value[e]
+            traded = np.abs(w * total - holdings).sum()
+            total -= cost * traded
+            value[e] = total
+            units = w * total / G[:, e]
+            cash = 0.0
+            turnover += traded / value[e]
+            n_rebalances += 1
+        s = e
+
+    return {"value": value, "turnover": turnover, "n_rebalances": n_rebalances}
+
+
+def metrics(value, periods=252, risk_free_rate=0.02):
+    value = np.asarray(value, dtype=np.float64)
+    ret = value[1:] / value[:-1] - 1
+    n = len(ret)
+    cagr = (value[-1] / value[0]) ** (periods / n) - 1
+    vol = ret.std(ddof=1) * np.sqrt(periods)
+    peak = np.maximum.accumulate(value)
+    return {
+        "cagr": cagr,
+        "vol": vol,
+        "sharpe": (cagr - risk_free_rate) / vol if vol else np.nan,
+        "mdd": (value / peak - 1).min(),
+    }
+
+
+def sweep(market, weight_grid, policies=("daily", "buy_and_hold", "monthly", "quarterly", "annual", "band"),
+          band=0.05, cost=0.0, reinvest=True, risk_free_rate=0.02):
+    # 策略 × 權重 的所有組合，回傳一列一組的績效表
+    rows = []
+    weight_grid = np.atleast_2d(weight_grid)
+    for policy in policies:
+        for w in weight_grid:
+            res = backtest(market, w, policy=policy, band=band, cost=cost, reinvest=reinvest)
+            row = {"policy": policy}
+            row.update({f"w_{name}": wi for name, wi in zip(market.names, w)})
+            row.update(metrics(res["value"], risk_free_rate=risk_free_rate))
+            row["turnover"] = res["turnover"]
+            row["n_rebalances"] = res["n_rebalances"]
+            rows.append(row)
+    return pd.DataFrame(rows)
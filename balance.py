@@ -1,17 +1,27 @@
 import pandas as pd, numpy as np
-# 1. 讀取指數歷史價格
-stocks = pd.read_csv('sp500.csv', index_col='Date', parse_dates=True)['Close']
-bonds  = pd.read_csv('bonds.csv',  index_col='Date', parse_dates=True)['Close']
-# 2. 計算報酬率
-rtn_s = stocks.pct_change().dropna()
-rtn_b = bonds.pct_change().dropna()
-# 3. 回測不同配比
-results = []
-for w in np.arange(0, 1.01, 0.1):
-    port = w * rtn_s + (1-w) * rtn_b
-    ann_r = (1+port.mean())**12 - 1
-    ann_vol = port.std() * np.sqrt(12)
-    sharpe = ann_r / ann_vol
-    results.append({'w_stock':w, 'ann_r':ann_r, 'ann_vol':ann_vol, 'Sharpe':sharpe})
-df = pd.DataFrame(results)
-# 4. 繪圖與表格
+import grid
+
+
+def sweep(rtn_s, rtn_b, step=0.1, periods=12):
+    # 回測不同配比：整條股票權重網格一次矩陣運算，不再逐一權重跑迴圈
+    rtn = pd.concat([rtn_s, rtn_b], axis=1, join='inner').dropna()
+    rets_mat = rtn.to_numpy().T
+    W = grid.simplex_grid(2, step)
+    # 只用到波動度：直接由共變異數矩陣計算，不必像 grid.evaluate 逐日累積 CAGR 與最大回撤
+    ann_vol = grid.volatility(W, rets_mat, periods=periods)
+    ann_r = (1 + W @ rets_mat.mean(axis=1))**periods - 1
+    return pd.DataFrame({'w_stock': W[:, 0], 'ann_r': ann_r, 'ann_vol': ann_vol,
+                         'Sharpe': ann_r / ann_vol})
+
+
+if __name__ == "__main__":
+    # 1. 讀取指數歷史價格
+    stocks = pd.read_csv('sp500.csv', index_col='Date', parse_dates=True)['Close']
+    bonds  = pd.read_csv('bonds.csv',  index_col='Date', parse_dates=True)['Close']
+    # 2. 計算報酬率
+    rtn_s = stocks.pct_change().dropna()
+    rtn_b = bonds.pct_change().dropna()
+    # 3. 回測不同配比
+    df = sweep(rtn_s, rtn_b)
+    # 4. 繪圖與表格
+    print(df)
@@ -0,0 +1,202 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import balance
+import data
+import dates
+import prefix
+import store
+
+# 效能基準：量測資料載入、日期對齊、組合報酬、逐年績效、balance.py 網格掃描與記憶體峰值
+# 三種情境：bundled（內附三檔 CSV）、long（歷史長度 ×100）、wide（50 檔資產）
+# 合成資料以固定種子從內附資料區塊抽樣產生，每次執行結果可重現
+# 結果附加到 JSON 歷史檔，並與同情境的上一筆紀錄比較，變慢超過門檻即標示
+#
+#   python bench.py                       # 全部情境
+#   python bench.py --scenarios bundled   # 只跑內附資料
+#   python bench.py --no-save             # 只顯示，不寫入歷史
+
+BUNDLED = ["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"]
+SCENARIOS = ("bundled", "long", "wide")
+HISTORY = "bench_history.json"
+
+
+def _block_indices(rng, n_src, n_out, block=21):
+    # 區塊抽樣的來源索引（保留波動群聚與資產間相關性）
+    starts = rng.integers(0, n_src - block, size=-(-n_out // block))
+    return (starts[:, None] + np.arange(block)).ravel()[:n_out]
+
+
+def synthesize(out_dir, n_assets, n_days, seed=0, block=21):
+    # 以內附資料的價格報酬與股息殖利率抽樣產生 *_c.csv，回傳檔案路徑
+    # 日期為連續的週一至週五；價格去除長期漂移，避免極長歷史下數值溢位
+    _, price, dividend, _ = data.load_prices(BUNDLED)
+    price_ret = price[:, 1:] / price[:, :-1] - 1
+    div_yield = dividend[:, 1:] / price[:, :-1]
+
+    rng = np.random.default_rng(seed)
+    idx = _block_indices(rng, price_ret.shape[1], n_days, block)
+    first = np.datetime64("1900-01-01")
+    bdays = np.busday_offset(first, np.arange(n_days), roll="forward")
+    labels = np.array(dates.format_days(bdays))
+
+    paths = []
+    for k in range(n_assets):
+        src = k % len(price_ret)
+        r = price_ret[src, idx]
+        if k >= len(price_ret):
+            r = r + rng.normal(0.0, 0.005, n_days)
+        log_r = np.log1p(r)
+        p = 100 * np.exp(np.cumsum(log_r - log_r.mean()))
+        d = np.round(div_yield[src, idx] * np.concatenate([[100.0], p[:-1]]), 4)
+        # 各資產隨機缺 1% 交易日，讓日期對齊有實際工作量
+        keep = rng.random(n_days) > (0.01 if n_assets > 1 else 0.0)
+        keep[0] = True
+
+        path = os.path.join(out_dir, f"syn{k:03d}_c.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("Date,Price,Dividend\n")
+            f.writelines(
+                f"'{lab}', '{pv:.4f}', '{dv:g}'\n" if dv else f"'{lab}', '{pv:.4f}',\n"
+                for lab, pv, dv in zip(labels[keep], p[keep], d[keep])
+            )
+        paths.append(path)
+    return paths
+
+
+def _measure(fn, repeat):
+    # 回傳 (最短秒數, 中位數秒數, 記憶體峰值 MB, 最後一次結果)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), float(np.median(times)), peak / 2**20, out
+
+
+def run_scenario(paths, repeat=5, grid_step=0.01):
+    # 逐階段量測；每階段的輸入取自前一階段的結果
+    for p in paths:
+        store.ingest(p)
+    stages = {}
+
+    def record(name, fn, n=repeat):
+        best, median, peak, out = _measure(fn, n)
+        stages[name] = {"best_s": best, "median_s": median, "peak_mb": peak}
+        return out
+
+    record("parse_csv", lambda: [store.parse_csv(p) for p in paths], max(1, repeat // 2))
+    series = record("load", lambda: data.load_series(paths))
+    frame = record("align", lambda: data.align_returns(series))
+    rets_mat = data.rets_mat(frame)
+    weights = np.full(len(paths), 1.0 / len(paths))
+    port_ret = record("portfolio", lambda: weights.dot(rets_mat))
+    dates_arr = frame.index.to_numpy()
+    record("yearly", lambda: analytics.yearly_metrics(prefix.PrefixIndex(port_ret, dates_arr)))
+    record("grid_sweep", lambda: balance.sweep(frame.iloc[:, 0], frame.iloc[:, 1], step=grid_step, periods=252))
+    record("end_to_end", lambda: analytics.yearly_metrics(analytics.portfolio(data.load_matrix(paths), weights)[1]), 1)
+    return {"n_assets": len(paths), "n_days": len(frame), "stages": stages}
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(previous, current, tolerance=0.2, min_delta=1e-3):
+    # 與上一筆同情境紀錄比較：回傳 (情境, 階段, 舊秒數, 新秒數, 比值, 是否退步) 列表
+    # 差距小於 min_delta 秒的階段視為量測雜訊，不標示退步
+    rows = []
+    for name, res in current.items():
+        old = previous.get(name) if previous else None
+        for stage, m in res["stages"].items():
+            before = old["stages"].get(stage, {}).get("best_s") if old else None
+            ratio = m["best_s"] / before if before else np.nan
+            regressed = bool(ratio > 1 + tolerance) and m["best_s"] - before > min_delta
+            rows.append((name, stage, before, m["best_s"], ratio, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="效能基準")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=100, help="long 情境的歷史長度倍數")
+    parser.add_argument("--assets", type=int, default=50, help="wide 情境的資產數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), HISTORY))
+    parser.add_argument("--tolerance", type=float, default=0.2, help="變慢超過此比例即標示退步")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        n_base = len(data.load_matrix(BUNDLED)) + 1
+        for name in args.scenarios:
+            if name == "bundled":
+                paths = BUNDLED
+            else:
+                out_dir = os.path.join(tmp, name)
+                os.makedirs(out_dir)
+                n_assets, n_days = (3, n_base * args.scale) if name == "long" else (args.assets, n_base)
+                paths = synthesize(out_dir, n_assets, n_days, args.seed)
+            print(f"[{name}] {len(paths)} 檔資產 ...", flush=True)
+            results[name] = run_scenario(paths, args.repeat)
+
+    history = load_history(args.history)
+    previous = {}
+    for entry in reversed(history):
+        for name, res in entry["results"].items():
+            previous.setdefault(name, res)
+
+    rows = compare(previous, results, args.tolerance)
+    table = pd.DataFrame(rows, columns=["scenario", "stage", "prev_s", "best_s", "ratio", "regressed"])
+    table["peak_mb"] = [results[s]["stages"][st]["peak_mb"] for s, st in zip(table["scenario"], table["stage"])]
+    with pd.option_context("display.width", 120, "display.float_format", "{:.4f}".format):
+        print(table.to_string(index=False))
+
+    if not args.no_save:
+        history.append({
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "repeat": args.repeat,
+            "results": results,
+        })
+        with open(args.history, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=1)
+        print(f"已寫入 {args.history}")
+    if table["regressed"].any():
+        print("⚠️ 有階段比上一筆紀錄慢超過", f"{args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 行程層級（跨 Streamlit session 共用）的 LRU 快取
+# 權重以 0.01 量化後作為鍵，熱門配置（例如 60/40）只算一次，之後所有使用者直接取用
+# 注意：快取中的物件會被多個 session 共用，取出後請勿原地修改
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        # 計算在鎖外進行，避免一個慢計算卡住其他 session 的查詢
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def quantize(weights, step=0.01):
+    # 0.66 - 0.33 這類浮點誤差會讓相同配置產生不同鍵，統一換成 step 的整數倍
+    return tuple(int(q) for q in np.rint(np.asarray(weights, dtype=np.float64) / step))
+
+
+def dequantize(qweights, step=0.01):
+    return np.asarray(qweights, dtype=np.float64) * step
+
+
+def files_key(paths):
+    # 檔案路徑加上修改時間，資料檔更新後舊結果自然失效
+    key = []
+    for p in paths:
+        p = os.path.abspath(p)
+        key.append((p, os.stat(p).st_mtime_ns if os.path.exists(p) else None))
+    return tuple(key)
+
+
+def portfolio_key(paths, weights, years=None, step=0.01):
+    return (files_key(paths), quantize(weights, step), tuple(years) if years is not None else None)
+
+
+# 全行程共用的組合結果快取
+portfolios = LRUCache(maxsize=512)
@@ -0,0 +1,86 @@
+import argparse
+import sys
+
+import pandas as pd
+
+import analytics
+import data
+
+# 無介面批次工具：不啟動 Streamlit，直接輸出績效 CSV / JSON
+#
+#   單一配置：
+#     python cli.py --files ishare20_c.csv ishare1_3_c.csv spy_c.csv --weights 0.3 0.3 0.4 --start 2010 --end 2020
+#   大量情境（CSV 欄位：每個資產一欄權重（欄名為檔名去副檔名，或 w0, w1, ...），以及 start、end）：
+#     python cli.py --files ... --scenarios scenarios.csv --out results.csv
+
+DEFAULT_FILES = ["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"]
+
+
+def _weight_columns(scenarios, names):
+    if all(n in scenarios.columns for n in names):
+        return names
+    positional = [f"w{k}" for k in range(len(names))]
+    if all(c in scenarios.columns for c in positional):
+        return positional
+    raise SystemExit(f"情境檔缺少權重欄位：需要 {names} 或 {positional}")
+
+
+def _write(frame, out, fmt):
+    if fmt == "json":
+        text = frame.to_json(orient="records", force_ascii=False, indent=2)
+        if out:
+            with open(out, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            print(text)
+    else:
+        frame.to_csv(out or sys.stdout, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="配置績效批次計算")
+    parser.add_argument("--files", nargs="+", default=DEFAULT_FILES)
+    parser.add_argument("--weights", nargs="+", type=float, help="各資產權重，總和需為 1")
+    parser.add_argument("--start", help="起始年份或日期（YYYY 或 YYYY-MM-DD）")
+    parser.add_argument("--end", help="結束年份或日期（含）")
+    parser.add_argument("--yearly", action="store_true", help="輸出每個自然年度的績效")
+    parser.add_argument("--skip-first", action="store_true", help="每年捨去第一筆（同 UI_bias.py）")
+    parser.add_argument("--scenarios", help="情境 CSV，每列一組權重與區間")
+    parser.add_argument("--risk-free-rate", type=float, default=analytics.RISK_FREE_RATE)
+    parser.add_argument("--format", choices=["csv", "json"], default="csv")
+    parser.add_argument("--out", help="輸出檔，預設寫到標準輸出")
+    args = parser.parse_args(argv)
+
+    frame = data.load_matrix(args.files)
+    names = frame.columns.tolist()
+
+    if args.scenarios:
+        scenarios = pd.read_csv(args.scenarios, dtype={"start": str, "end": str})
+        cols = _weight_columns(scenarios, names)
+        starts = scenarios["start"] if "start" in scenarios.columns else [None] * len(scenarios)
+        ends = scenarios["end"] if "end" in scenarios.columns else [None] * len(scenarios)
+        starts = [None if pd.isna(s) else s for s in starts]
+        ends = [None if pd.isna(e) else e for e in ends]
+        res = analytics.score(frame, scenarios[cols].to_numpy(), starts, ends, args.risk_free_rate)
+        _write(pd.concat([scenarios.reset_index(drop=True), res], axis=1), args.out, args.format)
+        return
+
+    if args.weights is None:
+        parser.error("需要 --weights 或 --scenarios")
+    if len(args.weights) != len(names):
+        parser.error(f"--weights 數量（{len(args.weights)}）與 --files 數量（{len(names)}）不符")
+    if abs(sum(args.weights) - 1.0) > 1e-6:
+        parser.error("--weights 總和需為 1")
+
+    _, idx = analytics.portfolio(frame, args.weights)
+    if args.yearly:
+        result = analytics.yearly_metrics(idx, args.skip_first, args.risk_free_rate)
+    else:
+        period = analytics.period_metrics(idx, args.start, args.end, args.risk_free_rate)
+        result = pd.DataFrame([{**{n: w for n, w in zip(names, args.weights)},
+                                "start": args.start, "end": args.end, **period}])
+    _write(result, args.out, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,160 @@
+import argparse
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from bs4 import BeautifulSoup
-
-# url = "https://hk.finance.yahoo.com/quote/TLT/history/?period1=1116374400&period2=1747526400"
-# url= "https://hk.finance.yahoo.com/quote/SPY/history/?period1=1116374400&period2=1747556014"
-url = "https://hk.finance.yahoo.com/quote/SHY/history/?period1=1116374400&period2=1747556692"
-headers = {"User-Agent": "Mozilla/5.0"}
-
-resp = requests.get(url, headers=headers)
-soup = BeautifulSoup(resp.text, "html.parser")
-
-# 用一條 Selector 抓到 <div class="table-container yf-1jecxey"> 底下那張 table 的 tbody
-tbody = soup.select_one(
-    "div.table-container.yf-1jecxey "
-    "> table.table.yf-1jecxey.noDl.hideOnPrint "
-    "> tbody"
-)
-
-# 確認拿到了
-print(tbody)           # 如果不是 None，就代表成功定位到
-print(len(tbody))      # 內部節點數量，通常是多個 <tr>
-
-# 接下來就可以拿 tr
-for tr in tbody.select("tr.yf-1jecxey"):
-    cols = [td.get_text(strip=True) for td in tr.select("td")]
-    with open("ishare1_3.csv", "a", encoding="UTF-8") as f:
-            f.write(f"{cols}" + "\n")
-
-print("Done")
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+
+BASE_URL = "https://hk.finance.yahoo.com"
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+# 代號 -> adjust.py 產出的資料檔
+TICKERS = {
+    "TLT": "ishare20_c.csv",
+    "SHY": "ishare1_3_c.csv",
+    "SPY": "spy_c.csv",
+}
+
+# 這些狀態碼視為暫時性錯誤，重試
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def build_url(ticker, period1, period2, base_url=BASE_URL):
+    # period1 / period2 為 UTC epoch 秒，例如 1116374400 = 2005/05/18
+    return f"{base_url}/quote/{ticker}/history/?period1={int(period1)}&period2={int(period2)}"
+
+
+def make_session(pool_size=16):
+    # 共用連線池（keep-alive），多執行緒同時抓取時不必每次重新建立 TCP/TLS 連線
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_html(url, session=None, timeout=30):
+    resp = (session or requests).get(url, headers=HEADERS, timeout=timeout)
+    resp.raise_for_status()
+    # 沒有宣告 charset 時 requests 會當成 ISO-8859-1，中文日期會變亂碼
+    if "charset" not in resp.headers.get("Content-Type", ""):
+        resp.encoding = "utf-8"
+    return resp.text
+
+
+class RateLimiter:
+    # 令牌桶：平均每秒 rate 次，最多累積 burst 次的突發量；多執行緒共用
+
+    def __init__(self, rate=5.0, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    # 可直接當成 fetch(url) -> html 使用（例如傳給 update.update）
+    # 共用 session + 速率限制 + 指數退避重試
+
+    def __init__(self, rate=5.0, burst=None, retries=3, backoff=0.5, timeout=30, pool_size=16, session=None):
+        self.session = session or make_session(pool_size)
+        self.limiter = RateLimiter(rate, burst) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def __call__(self, url):
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                return fetch_html(url, self.session, self.timeout)
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in RETRY_STATUS or attempt == self.retries:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            # 指數退避加上隨機抖動，避免所有執行緒同時重試
+            time.sleep(self.backoff * 2**attempt * (1 + random.random()))
+
+
+# 只把 <table> 交給解析器建樹，略過整頁其他 DOM（script、導覽列等）
+TABLE_ONLY = SoupStrainer("table")
+
+
+def parse_history(html):
+    # 回傳歷史表格每一列的欄位文字：價格列 7 欄（日期、開、高、低、收、經調整收、成交量），
+    # 股息列 2 欄（日期、"0.672股息"）
+    soup = BeautifulSoup(html, "html.parser", parse_only=TABLE_ONLY)
+    tbody = soup.select_one("table.table.noDl.hideOnPrint > tbody") or soup.select_one("table tbody")
+    if tbody is None:
+        return []
+    return [[td.get_text(strip=True) for td in tr.find_all("td")] for tr in tbody.find_all("tr")]
+
+
+def crawl_many(urls, fetch=None, workers=8):
+    # urls: {鍵: url}，以執行緒池同時抓取並解析；回傳 {鍵: rows 或 Exception}
+    # 單一代號失敗不影響其他代號
+    fetch = fetch or Fetcher(pool_size=workers)
+
+    def one(url):
+        try:
+            return parse_history(fetch(url))
+        except Exception as e:
+            return e
+
+    keys = list(urls)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(one, [urls[k] for k in keys]))
+    return dict(zip(keys, results))
+
+
+def write_rows(rows, path):
+    # 一次緩衝寫入，不再每一列重新開檔 append
+    with open(path, "a", encoding="UTF-8") as f:
+        f.write("".join(f"{cols}\n" for cols in rows))
+
+
+if __name__ == "__main__":
+    # python crawl.py SPY TLT SHY QQQ --out-dir raw；每個代號輸出 <代號小寫>.csv 供 adjust.py 轉換
+    parser = argparse.ArgumentParser(description="同時抓取多個代號的歷史價格")
+    parser.add_argument("tickers", nargs="*", default=list(TICKERS))
+    parser.add_argument("--period1", type=int, default=1116374400)
+    parser.add_argument("--period2", type=int, default=int(time.time()))
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=5.0, help="每秒最多請求數")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--base-url", default=BASE_URL)
+    args = parser.parse_args()
+
+    urls = {t: build_url(t, args.period1, args.period2, args.base_url) for t in args.tickers}
+    fetcher = Fetcher(rate=args.rate, retries=args.retries, pool_size=args.workers)
+    os.makedirs(args.out_dir, exist_ok=True)
+    for ticker, rows in crawl_many(urls, fetcher, args.workers).items():
+        if isinstance(rows, Exception):
+            print(f"{ticker}: 失敗 {rows}")
+            continue
+        write_rows(rows, os.path.join(args.out_dir, f"{ticker.lower()}.csv"))
+        print(f"{ticker}: {len(rows)} rows")
+    print("Done")
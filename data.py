@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+import instrument
+import store
+
+# 共用資料層：任意 N 個資產 -> 以日期為索引的 (T × N) float64 報酬矩陣
+# 各資產日期在 store 中已排序，合併時把所有日期串起來做一次排序計數，
+# 只保留 N 個資產都有的交易日，再用 searchsorted 取出各自的列；不做兩兩 merge
+
+
+def common_dates(date_arrays):
+    # 多個已排序日期陣列的交集（一次 sorted-index join）
+    if len(date_arrays) == 1:
+        return np.asarray(date_arrays[0])
+    values, counts = np.unique(np.concatenate(date_arrays), return_counts=True)
+    return values[counts == len(date_arrays)]
+
+
+def total_returns(series):
+    # (P_t + D_t) / P_{t-1} - 1，對應第 1..n-1 天
+    return series.date[1:], (series.price[1:] + series.dividend[1:]) / series.price[:-1] - 1
+
+
+def load_series(paths):
+    with instrument.timer("load", assets=len(paths)):
+        series = [store.load(p) for p in paths]
+    instrument.count("rows", sum(len(s.date) for s in series), stage="load")
+    return series
+
+
+def load_matrix(paths, names=None):
+    # 回傳 DataFrame：index 為 Date（datetime64），每欄一個資產的日報酬
+    return align_returns(load_series(paths), names)
+
+
+def align_returns(series, names=None):
+    # 日報酬先在各資產自己的完整序列上計算，再取共同交易日
+    with instrument.timer("align", assets=len(series)):
+        rets = [total_returns(s) for s in series]
+        dates = common_dates([d for d, _ in rets])
+        cols = np.empty((len(dates), len(rets)))
+        for k, (d, r) in enumerate(rets):
+            cols[:, k] = r[np.searchsorted(d, dates)]
+        names = list(names) if names is not None else [s.name for s in series]
+        frame = pd.DataFrame(cols, index=pd.DatetimeIndex(dates, name="Date"), columns=names).dropna()
+    instrument.count("rows", len(frame), stage="align")
+    return frame
+
+
+def load_prices(paths):
+    # 對齊後的價格與股息：回傳 (dates, price (N × T), dividend (N × T), names)
+    # 供需要區分價格報酬與股息的引擎（backtest.Market）使用
+    series = load_series(paths)
+    dates = common_dates([s.date for s in series])
+    price = np.empty((len(series), len(dates)))
+    dividend = np.empty((len(series), len(dates)))
+    for k, s in enumerate(series):
+        pos = np.searchsorted(s.date, dates)
+        price[k] = s.price[pos]
+        dividend[k] = s.dividend[pos]
+    return dates, price, dividend, [s.name for s in series]
+
+
+def load_long(paths):
+    # 長格式（Date, Price, Dividend, Asset）原始資料，供預覽表格使用
+    return long_frame(load_series(paths))
+
+
+def long_frame(series):
+    # 已載入的序列 -> 長格式；與 align_returns 共用同一次 load_series，不必重讀 store
+    frames = []
+    for s in series:
+        frames.append(pd.DataFrame({
+            "Date": pd.to_datetime(s.date),
+            "Price": np.asarray(s.price),
+            "Dividend": np.asarray(s.dividend),
+            "Asset": s.name,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def rets_mat(frame):
+    # UI 與各引擎使用的 (N × T) 連續記憶體配置
+    return np.ascontiguousarray(frame.to_numpy(dtype=np.float64).T)
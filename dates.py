@@ -0,0 +1,83 @@
+import numpy as np
+
+# 中文日期字串（'2005年10月10日'，可帶前後引號）的向量化解析
+# 字串轉成 Unicode code point 矩陣後，以固定樣式直接取出年／月／日數字，
+# 不經過逐筆 regex、.str.replace 或 strptime；資料只在 ingest 時解析一次
+
+_YEAR, _MONTH, _DAY = ord("年"), ord("月"), ord("日")
+_ZERO = ord("0")
+
+
+def _digits_at(cp, pos):
+    rows = np.arange(len(cp))
+    pos = np.clip(pos, 0, cp.shape[1] - 1)
+    return cp[rows, pos] - _ZERO
+
+
+def _two_digit(cp, start, end):
+    # [start, end) 之間為 1 或 2 位數字
+    n = end - start
+    ones = _digits_at(cp, end - 1)
+    tens = np.where(n == 2, _digits_at(cp, start), 0)
+    return tens * 10 + ones, (n >= 1) & (n <= 2)
+
+
+def parse_parts(strings):
+    # 回傳 (year, month, day, valid) 四個陣列
+    arr = np.asarray(strings).astype(str)
+    width = max(arr.dtype.itemsize // 4, 1)
+    cp = arr.view(np.uint32).reshape(len(arr), width).astype(np.int64)
+
+    is_digit = (cp >= _ZERO) & (cp <= _ZERO + 9)
+    # 第一個數字的位置（略過前導引號、空白）
+    start = np.argmax(is_digit, axis=1)
+    pos_y = np.argmax(cp == _YEAR, axis=1)
+    pos_m = np.argmax(cp == _MONTH, axis=1)
+    pos_d = np.argmax(cp == _DAY, axis=1)
+
+    rows = np.arange(len(arr))
+    year = np.zeros(len(arr), dtype=np.int64)
+    for k in range(4):
+        year = year * 10 + _digits_at(cp, start + k)
+    month, ok_m = _two_digit(cp, pos_y + 1, pos_m)
+    day, ok_d = _two_digit(cp, pos_m + 1, pos_d)
+
+    valid = (
+        is_digit.any(axis=1)
+        & (pos_y - start == 4)
+        & (cp[rows, pos_y] == _YEAR) & (cp[rows, pos_m] == _MONTH) & (cp[rows, pos_d] == _DAY)
+        & ok_m & ok_d
+        & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    )
+    return year, month, day, valid
+
+
+def from_parts(year, month, day):
+    # 整數年／月／日 -> datetime64[D]，全部以 datetime64 算術完成
+    months = (np.asarray(year) - 1970) * 12 + (np.asarray(month) - 1)
+    return months.astype("datetime64[M]").astype("datetime64[D]") + (np.asarray(day) - 1)
+
+
+def parse(strings):
+    # '2005年10月10日' -> datetime64[D]；無法解析的輸入為 NaT
+    year, month, day, valid = parse_parts(strings)
+    year, month, day = np.where(valid, year, 1970), np.where(valid, month, 1), np.where(valid, day, 1)
+    out = from_parts(year, month, day)
+    # 2 月 30 日之類會進位到下個月，視為無效
+    valid &= out.astype("datetime64[M]") == from_parts(year, month, 1).astype("datetime64[M]")
+    out[~valid] = np.datetime64("NaT")
+    return out
+
+
+def to_days(strings):
+    # int64 epoch 天數（store 的日期欄格式）
+    return parse(strings).astype(np.int64)
+
+
+def format_days(days):
+    # datetime64[D] 或 epoch 天數 -> '2005年10月10日'
+    d = np.asarray(days).astype("datetime64[D]")
+    y = d.astype("datetime64[Y]").astype(np.int64) + 1970
+    m = d.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    dd = (d - d.astype("datetime64[M]")).astype(np.int64) + 1
+    return [f"{a}年{b}月{c}日" for a, b, c in zip(y, m, dd)]
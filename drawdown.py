@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+import prefix
+
+# 最大回撤與「不虧損持有期」分析
+# 財富以 log 表示：L_0 = 0，L_t = Σ log(1+r)，共 T+1 個時間點；第 i 天進場、持有 h 天的報酬為 L_{i+h} - L_i
+# - 回撤、水下期間：running max 一次掃描
+# - 每個進場日最後一次「跌破進場價」的時間：依 L 排序後對索引取前綴最大值，O(T log T)，
+#   取代逐進場日 × 逐持有期的 O(T²) 雙迴圈
+# - 不虧損持有期 = 所有進場日中「最後一次跌破進場價距進場的天數 + 1」的最大值
+#   持有至少這麼久，歷史上任何進場日都沒有虧損
+
+
+def last_loss(level):
+    # level 為 (A × P)；回傳每個時間點 i 之後最後一個 L_j < L_i 的 j（沒有則 -1）
+    # 依值排序後，嚴格較小者都排在同值區段之前；對排序後的索引取前綴最大值即可
+    level = np.atleast_2d(level)
+    a, p = level.shape
+    order = np.argsort(level, axis=1, kind="stable")
+    values = np.take_along_axis(level, order, axis=1)
+    pos = np.arange(p)
+    # 每個排序位置所在同值區段的第一個位置 = 嚴格較小的個數
+    new = np.ones((a, p), dtype=bool)
+    new[:, 1:] = values[:, 1:] != values[:, :-1]
+    first = np.maximum.accumulate(np.where(new, pos, 0), axis=1)
+    best = np.maximum.accumulate(order, axis=1)
+    prev = np.take_along_axis(best, np.maximum(first - 1, 0), axis=1)
+    prev = np.where(first > 0, prev, -1)
+    out = np.empty((a, p), dtype=np.int64)
+    np.put_along_axis(out, order, prev, axis=1)
+    return out
+
+
+def holding_required(level):
+    # 每個進場點 i 需要持有幾天才保證不虧（之後任何時點賣出都 >= 進場價）；從未跌破則為 0
+    level = np.atleast_2d(level)
+    j = last_loss(level)
+    i = np.arange(level.shape[1])
+    return np.where(j > i, j - i + 1, 0)
+
+
+def never_lose_days(level):
+    # 持有 >= 此天數時，歷史上任何進場日都沒有虧損（每列一個配置）
+    return holding_required(level).max(axis=1)
+
+
+def underwater(level):
+    # 每個時間點距離上一次創新高的天數（0 表示正在新高）
+    level = np.atleast_2d(level)
+    pos = np.arange(level.shape[1])
+    peak = np.maximum.accumulate(level, axis=1)
+    last_high = np.maximum.accumulate(np.where(level >= peak, pos, 0), axis=1)
+    return pos - last_high
+
+
+def _point_date(dates, t):
+    # 時間點 t 對應第 t-1 天收盤；t = 0 視為第一天
+    return dates[max(int(t) - 1, 0)]
+
+
+def analyze(port_ret, dates, periods=252):
+    # 單一配置的回撤摘要：最大回撤、高點 / 谷底 / 回復日、回撤期間、回復時間、最長水下期間、不虧損持有期
+    level = prefix.log_wealth(port_ret)
+    dates = np.asarray(dates)
+    peak = np.maximum.accumulate(level)
+    dd = level - peak
+    trough = int(np.argmin(dd))
+    peak_at = int(np.argmax(level[:trough + 1])) if trough > 0 else 0
+    after = np.flatnonzero(level[trough:] >= level[peak_at])
+    recovery = trough + int(after[0]) if len(after) else None
+    never = int(never_lose_days(level)[0])
+    return {
+        "mdd": float(np.expm1(dd[trough])),
+        "peak_date": _point_date(dates, peak_at),
+        "trough_date": _point_date(dates, trough),
+        "recovery_date": _point_date(dates, recovery) if recovery is not None else None,
+        "drawdown_days": (recovery if recovery is not None else len(level) - 1) - peak_at,
+        "recovery_days": recovery - trough if recovery is not None else None,
+        "max_underwater_days": int(underwater(level).max()),
+        "never_lose_days": never,
+        "never_lose_years": never / periods,
+    }
+
+
+def by_start(port_ret, dates, periods=252):
+    # 每個進場日需要的持有期（年），以及之後的最大跌幅，供畫圖
+    level = prefix.log_wealth(port_ret)
+    req = holding_required(level)[0, :-1]
+    # 進場後最深跌到多少：之後的最小值（後綴最小值）相對進場點
+    future_min = np.minimum.accumulate(level[::-1])[::-1]
+    return pd.DataFrame({
+        "Date": np.asarray(dates),
+        "required_days": req,
+        "required_years": req / periods,
+        "worst_after": np.expm1(future_min[1:] - level[:-1]),
+    })
+
+
+def horizon_table(port_ret, horizons=None, periods=252):
+    # 各持有期（交易日）下所有進場日的虧損機率與最差 / 中位 / 最佳年化報酬
+    # 每個持有期 O(T)；預設每 21 個交易日取一個持有期
+    level = prefix.log_wealth(port_ret)
+    t = len(level) - 1
+    horizons = np.arange(21, t + 1, 21) if horizons is None else np.asarray(horizons)
+    rows = []
+    for h in horizons:
+        diff = level[h:] - level[:-h]
+        rows.append((h, np.mean(diff < 0), diff.min(), np.median(diff), diff.max()))
+    h, loss, worst, median, best = (np.array(c) for c in zip(*rows))
+    return pd.DataFrame({
+        "days": h,
+        "years": h / periods,
+        "loss_prob": loss,
+        "worst": np.expm1(worst * periods / h),
+        "median": np.expm1(median * periods / h),
+        "best": np.expm1(best * periods / h),
+    })
+
+
+def sweep(weights, rets_mat, periods=252, chunk=256):
+    # 整個配置網格（A × N）的最大回撤、最長水下期間與不虧損持有期
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    mdd = np.empty(len(weights))
+    under = np.empty(len(weights), dtype=np.int64)
+    never = np.empty(len(weights), dtype=np.int64)
+    for lo in range(0, len(weights), chunk):
+        level = prefix.log_wealth(weights[lo:lo + chunk] @ rets_mat)
+        peak = np.maximum.accumulate(level, axis=1)
+        mdd[lo:lo + chunk] = np.expm1((level - peak).min(axis=1))
+        under[lo:lo + chunk] = underwater(level).max(axis=1)
+        never[lo:lo + chunk] = never_lose_days(level)
+    return {"mdd": mdd, "max_underwater_days": under,
+            "never_lose_days": never, "never_lose_years": never / periods}
+
+
+if __name__ == "__main__":
+    import time
+
+    import data
+    import grid
+
+    frame = data.load_matrix(["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"])
+    rets_mat = data.rets_mat(frame)
+    port = np.array([0.3, 0.3, 0.4]) @ rets_mat
+    for k, v in analyze(port, frame.index.to_numpy()).items():
+        print(f"{k:>20}: {v}")
+
+    W = grid.simplex_grid(3, 0.01)
+    t0 = time.perf_counter()
+    res = sweep(W, rets_mat)
+    print(f"{len(W)} 組配置 × {rets_mat.shape[1]} 天：{time.perf_counter() - t0:.2f} 秒")
+    best = np.argmin(res["never_lose_days"])
+    print("不虧損持有期最短的配置：", W[best], f"{res['never_lose_years'][best]:.2f} 年")
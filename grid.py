@@ -0,0 +1,52 @@
+from itertools import combinations
+
+import numpy as np
+
+# 配置網格批次引擎：一次矩陣乘法評估單純形（simplex）上所有配置
+# rets_mat 與 UI 相同為 (資產數 N × 交易日 T)，weights 為 (組合數 P × N)
+
+
+def simplex_grid(n_assets=3, step=0.01):
+    # 以「隔板法」列舉所有權重為 step 倍數且總和為 1 的組合
+    # n_assets=3、step=0.01 時共 C(102, 2) = 5151 組
+    if n_assets == 1:
+        return np.ones((1, 1))
+    m = int(round(1 / step))
+    cuts = np.array(list(combinations(range(m + n_assets - 1), n_assets - 1)), dtype=np.int64)
+    bounds = np.hstack([np.full((len(cuts), 1), -1), cuts, np.full((len(cuts), 1), m + n_assets - 1)])
+    counts = np.diff(bounds, axis=1) - 1
+    return counts / m
+
+
+def volatility(weights, rets_mat, periods=252):
+    # 年化波動度只需共變異數矩陣：w'Σw 與逐日組合報酬的 std(ddof=1) 完全相同，不必產生 P × T 的組合報酬
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    cov = np.atleast_2d(np.cov(np.asarray(rets_mat, dtype=np.float64), ddof=1))
+    return np.sqrt(np.einsum("pi,ij,pj->p", weights, cov, weights).clip(min=0.0) * periods)
+
+
+def evaluate(weights, rets_mat, periods=252, risk_free_rate=0.02, chunk=512):
+    # 回傳每個組合的 CAGR、年化波動度、夏普比率與最大回撤（皆為長度 P 的陣列）
+    # 依 chunk 分批計算，避免 P × T 的中間矩陣一次佔滿記憶體
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    rets_mat = np.asarray(rets_mat, dtype=np.float64)
+    n_port, n_days = len(weights), rets_mat.shape[1]
+
+    vol = volatility(weights, rets_mat, periods)
+
+    cagr = np.empty(n_port)
+    mdd = np.empty(n_port)
+    for lo in range(0, n_port, chunk):
+        hi = min(lo + chunk, n_port)
+        log_wealth = weights[lo:hi] @ rets_mat
+        np.log1p(log_wealth, out=log_wealth)
+        np.cumsum(log_wealth, axis=1, out=log_wealth)
+        cagr[lo:hi] = np.expm1(log_wealth[:, -1] * periods / n_days)
+        # 期初資金 1 也算一個高點
+        peak = np.maximum.accumulate(log_wealth, axis=1)
+        np.maximum(peak, 0.0, out=peak)
+        mdd[lo:hi] = np.expm1((log_wealth - peak).min(axis=1))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = (cagr - risk_free_rate) / vol
+    return {"cagr": cagr, "vol": vol, "sharpe": sharpe, "mdd": mdd}
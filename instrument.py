@@ -0,0 +1,228 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 熱路徑量測：各階段計時、計數器（處理列數、快取命中 / 未命中、送到圖表的位元組）
+# - 行程層級累計（所有 session 共用），可輸出 Prometheus 文字格式
+# - 每個執行緒（= 每個 Streamlit session 的一次重跑）另記一份本次明細，供除錯側欄顯示
+# - 每個階段結束時寫一行 JSON 結構化 log（logger 名稱 "portfolio"，預設 DEBUG 等級）
+#   設定環境變數 PORTFOLIO_LOG=INFO / DEBUG 即輸出到 stderr
+# 計時只用 perf_counter 與一把鎖，未開啟 log 時每個階段的額外成本在微秒以下
+
+log = logging.getLogger("portfolio")
+_level = os.environ.get("PORTFOLIO_LOG", "").strip().upper()
+if _level:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    # 無效的等級名稱（例如 PORTFOLIO_LOG=verbose）不讓匯入失敗，退回 INFO 並警告
+    if _level not in logging.getLevelNamesMapping():
+        log.warning(json.dumps({"event": "config", "warning": "invalid PORTFOLIO_LOG",
+                                "value": os.environ["PORTFOLIO_LOG"], "fallback": "INFO"}))
+        _level = "INFO"
+    log.setLevel(_level)
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            # stage -> [次數, 總秒數, 最長秒數]
+            self.timers = defaultdict(lambda: [0, 0.0, 0.0])
+            # (名稱, 標籤) -> 累計值
+            self.counters = defaultdict(float)
+
+    # ---- 本次執行（執行緒區域）----
+    def begin_run(self, session=None):
+        self._local.run = {"session": session, "stages": [], "counters": defaultdict(float)}
+
+    def current_run(self):
+        return getattr(self._local, "run", None)
+
+    # ---- 記錄 ----
+    def observe(self, stage, seconds, **fields):
+        with self._lock:
+            t = self.timers[stage]
+            t[0] += 1
+            t[1] += seconds
+            t[2] = max(t[2], seconds)
+        run = self.current_run()
+        if run is not None:
+            run["stages"].append((stage, seconds))
+        if log.isEnabledFor(logging.DEBUG):
+            session = run["session"] if run is not None else None
+            log.debug(json.dumps({"event": "stage", "stage": stage, "seconds": round(seconds, 6),
+                                  "session": session, **fields}, default=str))
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+        run = self.current_run()
+        if run is not None:
+            run["counters"][key] += value
+
+    @contextmanager
+    def timer(self, stage, **fields):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0, **fields)
+
+    def end_run(self):
+        # 結束本次執行，寫一行摘要 log，回傳本次明細
+        run = self.current_run()
+        self._local.run = None
+        if run is not None and log.isEnabledFor(logging.INFO):
+            log.info(json.dumps({
+                "event": "run", "session": run["session"],
+                "stages": {k: round(v, 6) for k, v in _sum_stages(run["stages"]).items()},
+            }, default=str))
+        return run
+
+    # ---- 輸出 ----
+    def snapshot(self):
+        with self._lock:
+            timers = {k: tuple(v) for k, v in self.timers.items()}
+            counters = dict(self.counters)
+        return timers, counters
+
+    def prometheus(self, caches=None):
+        # Prometheus 文字格式；caches 為 {名稱: LRUCache}，附上 cache.py 的命中統計
+        timers, counters = self.snapshot()
+        lines = [
+            "# HELP portfolio_stage_seconds Time spent per stage.",
+            "# TYPE portfolio_stage_seconds summary",
+        ]
+        for stage, (n, total, _) in sorted(timers.items()):
+            lines.append(f'portfolio_stage_seconds_count{{stage="{stage}"}} {n}')
+            lines.append(f'portfolio_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines += ["# HELP portfolio_stage_seconds_max Longest single call per stage.",
+                  "# TYPE portfolio_stage_seconds_max gauge"]
+        for stage, (_, _, longest) in sorted(timers.items()):
+            lines.append(f'portfolio_stage_seconds_max{{stage="{stage}"}} {longest:.6f}')
+
+        # 先依 metric family 收集樣本，每個 family 只輸出一次 # TYPE
+        # （st.cache_data 的 cache_misses 計數與 LRUCache 的未命中同屬 portfolio_cache_misses_total）
+        families = defaultdict(list)
+        kinds = {}
+        for (name, labels), v in sorted(counters.items()):
+            family = f"portfolio_{name}_total"
+            kinds[family] = "counter"
+            families[family].append(f"{family}{_labels(labels)} {v:g}")
+        for cname, c in sorted((caches or {}).items()):
+            s = c.stats()
+            for family, kind, key in (("portfolio_cache_hits_total", "counter", "hits"),
+                                      ("portfolio_cache_misses_total", "counter", "misses"),
+                                      ("portfolio_cache_entries", "gauge", "size")):
+                kinds[family] = kind
+                families[family].append(f'{family}{{cache="{cname}"}} {s[key]}')
+        for family in sorted(families):
+            lines.append(f"# TYPE {family} {kinds[family]}")
+            lines += families[family]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _sum_stages(stages):
+    out = defaultdict(float)
+    for stage, seconds in stages:
+        out[stage] += seconds
+    return dict(out)
+
+
+# 全行程共用
+registry = Registry()
+timer = registry.timer
+count = registry.count
+
+
+def timed(stage):
+    # 裝飾器版本的 timer
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with registry.timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def cache_calls(name):
+    # 放在 @st.cache_data 外層：記錄呼叫次數；搭配內層的 cache_miss 即可得到命中數
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            registry.count("cache_calls", cache=name)
+            return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def cache_miss(name):
+    # 放在 @st.cache_data 內層：只有真的執行函式（未命中）時才會記到
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            registry.count("cache_misses", cache=name)
+            with registry.timer(f"compute:{name}"):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def chart_bytes(name, chart):
+    # 圖表序列化成 Vega-Lite JSON 的大小（另計序列化時間）；回傳原圖表方便串接
+    # Streamlit 送出圖表時不受 Altair 的 5000 列上限限制，量測時同樣關掉
+    import altair as alt
+
+    with registry.timer("chart_serialize", chart=name), alt.data_transformers.disable_max_rows():
+        size = len(chart.to_json().encode("utf-8"))
+    registry.count("chart_bytes", size, chart=name)
+    return chart
+
+
+def cache_table():
+    # st.cache_data 的命中統計：[(名稱, 呼叫, 未命中, 命中)]
+    _, counters = registry.snapshot()
+    rows = defaultdict(lambda: [0, 0])
+    for (name, labels), v in counters.items():
+        if name in ("cache_calls", "cache_misses"):
+            rows[dict(labels)["cache"]][name == "cache_misses"] += v
+    return [(k, int(c), int(m), int(c - m)) for k, (c, m) in sorted(rows.items())]
+
+
+if __name__ == "__main__":
+    import analytics
+    import cache
+    import data
+    import prefix
+    # 以模組身分重新匯入，與 data / analytics 共用同一個 registry
+    from instrument import registry
+
+    logging.basicConfig(level=logging.DEBUG, format="%(message)s")
+    registry.begin_run(session="demo")
+    with registry.timer("rerun"):
+        frame = data.load_matrix(["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"])
+        port = frame.to_numpy() @ [0.3, 0.3, 0.4]
+        idx = prefix.PrefixIndex(port, frame.index.to_numpy())
+        analytics.yearly_metrics(idx)
+    registry.end_run()
+    print()
+    print(registry.prometheus({"portfolios": cache.portfolios}))
@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+
+# 線上（串流）績效累加器：報酬逐筆或小批次餵入，不必每次對整個 df 重算
+# 每個欄位（組合 + 各資產）只保存固定數量的狀態：
+#   筆數、平均與離差平方和（Welford / Chan 合併）、累積 log 財富、歷史高點、最大回撤
+# 每年另存一組同樣的狀態（年度第一筆單獨保存，以便重現 UI_bias.py 捨去第一筆的年度表）
+# 單筆更新 O(1)、批次更新 O(k)，結果與 prefix.PrefixIndex / analytics 的批次計算一致
+
+
+class RunningStats:
+    # 向量化於欄位：每個狀態都是長度 n_cols 的陣列
+
+    def __init__(self, n_cols):
+        self.n = 0
+        self.mean = np.zeros(n_cols)
+        self.m2 = np.zeros(n_cols)
+        self.log = np.zeros(n_cols)
+        self.peak = np.zeros(n_cols)   # log 財富的歷史高點（期初財富 1，故至少為 0）
+        self.mdd = np.zeros(n_cols)    # 最深回撤，以 log 表示（<= 0）
+
+    def push(self, r):
+        r = np.asarray(r, dtype=np.float64)
+        self.n += 1
+        delta = r - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (r - self.mean)
+        self.log += np.log1p(r)
+        np.maximum(self.peak, self.log, out=self.peak)
+        np.minimum(self.mdd, self.log - self.peak, out=self.mdd)
+
+    def push_batch(self, rets):
+        # rets 為 (k × n_cols)；以 Chan 的平行公式合併批次的平均與離差平方和
+        rets = np.asarray(rets, dtype=np.float64)
+        k = len(rets)
+        if k == 0:
+            return
+        mean_b = rets.mean(axis=0)
+        m2_b = ((rets - mean_b) ** 2).sum(axis=0)
+        n = self.n + k
+        delta = mean_b - self.mean
+        self.m2 += m2_b + delta * delta * self.n * k / n
+        self.mean += delta * k / n
+        self.n = n
+
+        path = self.log + np.cumsum(np.log1p(rets), axis=0)
+        running = np.maximum(self.peak, np.maximum.accumulate(path, axis=0))
+        np.minimum(self.mdd, (path - running).min(axis=0), out=self.mdd)
+        self.log = path[-1].copy()
+        self.peak = running[-1].copy()
+
+    def merge_first(self, r):
+        # 把單筆 r 視為發生在本段「之前」，回傳合併後的 (n, log, m2)；不改變狀態
+        n = self.n + 1
+        delta = self.mean - r
+        m2 = self.m2 + delta * delta * self.n / n
+        return n, self.log + np.log1p(r), m2
+
+
+def _metrics(n, log, m2, periods, risk_free_rate):
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.expm1(log * periods / n)
+        vol = np.sqrt(m2 / (n - 1) * periods)
+        sharpe = (cagr - risk_free_rate) / vol
+    return {
+        "n": n.astype(np.int64),
+        "total_return": np.expm1(log),
+        "cagr": cagr,
+        "vol": np.where(n > 1, vol, np.nan),
+        "sharpe": np.where(n > 1, sharpe, np.nan),
+    }
+
+
+class OnlineMetrics:
+    # 組合（每日再平衡，與 UI 的 weights.dot(rets_mat) 相同）與各資產的線上績效
+    # 欄位 0 為組合，1..N 為各資產
+
+    def __init__(self, weights, names=None, periods=252, risk_free_rate=0.02):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        n_assets = len(self.weights)
+        self.names = list(names) if names is not None else [f"asset{i}" for i in range(n_assets)]
+        self.columns = ["portfolio"] + self.names
+        self.periods = periods
+        self.risk_free_rate = risk_free_rate
+
+        self.total = RunningStats(n_assets + 1)
+        self.years = []            # 已結束年度：(year, has_prev, first, RunningStats)
+        self.year = None
+        self.year_has_prev = False
+        self.year_first = None
+        self.year_rest = None
+        self.last_date = None
+        self.last_price = None
+
+    @classmethod
+    def from_frame(cls, frame, weights, periods=252, risk_free_rate=0.02):
+        # 以 data.load_matrix 的 (T × N) 歷史報酬建立初始狀態，之後再逐筆追加
+        acc = cls(weights, frame.columns, periods, risk_free_rate)
+        acc.update_batch(frame.to_numpy(dtype=np.float64), frame.index.to_numpy())
+        return acc
+
+    def _row(self, rets):
+        rets = np.atleast_2d(np.asarray(rets, dtype=np.float64))
+        return np.column_stack([rets @ self.weights, rets])
+
+    def _start_year(self, year):
+        if self.year is not None:
+            self.years.append((self.year, self.year_has_prev, self.year_first, self.year_rest))
+        self.year_has_prev = self.year is not None and year == self.year + 1
+        self.year = year
+        self.year_first = None
+        self.year_rest = RunningStats(len(self.columns))
+
+    def _check_order(self, date):
+        if self.last_date is not None and date < self.last_date:
+            raise ValueError(f"日期必須遞增：{date} 早於 {self.last_date}")
+        self.last_date = date
+
+    def update(self, rets, date):
+        # 單筆：rets 為 N 個資產在 date 的報酬
+        date = np.datetime64(date, "D")
+        self._check_order(date)
+        row = self._row(rets)[0]
+        self.total.push(row)
+        year = int(date.astype("datetime64[Y]").astype(np.int64)) + 1970
+        if year != self.year:
+            self._start_year(year)
+        if self.year_first is None:
+            self.year_first = row
+        else:
+            self.year_rest.push(row)
+
+    def update_batch(self, rets, dates):
+        # 小批次：rets 為 (k × N)，dates 長度 k 且遞增；依年度切段後整段向量化更新
+        dates = np.asarray(dates).astype("datetime64[D]")
+        if len(dates) == 0:
+            return
+        if np.any(dates[1:] < dates[:-1]):
+            raise ValueError("批次內日期必須遞增")
+        self._check_order(dates[0])
+        self.last_date = dates[-1]
+        rows = self._row(rets)
+        self.total.push_batch(rows)
+
+        years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+        cuts = np.flatnonzero(years[1:] != years[:-1]) + 1
+        for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, len(years)]):
+            if years[lo] != self.year:
+                self._start_year(int(years[lo]))
+            if self.year_first is None:
+                self.year_first = rows[lo]
+                lo += 1
+            self.year_rest.push_batch(rows[lo:hi])
+
+    def update_prices(self, price, dividend, date):
+        # 直接餵價格：總報酬 (P_t + D_t) / P_{t-1} - 1，與 data.total_returns 相同
+        # 第一筆只記錄價格，不產生報酬
+        price = np.asarray(price, dtype=np.float64)
+        dividend = np.zeros_like(price) if dividend is None else np.asarray(dividend, dtype=np.float64)
+        if self.last_price is not None:
+            self.update((price + dividend) / self.last_price - 1, date)
+        self.last_price = price
+
+    def summary(self):
+        # 全期間績效（含最大回撤），一列一個欄位
+        s = self.total
+        res = _metrics(s.n, s.log, s.m2, self.periods, self.risk_free_rate)
+        res["mdd"] = np.expm1(s.mdd)
+        return pd.DataFrame(res, index=pd.Index(self.columns, name="column"))
+
+    def year_table(self, column="portfolio", skip_first=False):
+        # 每個自然年度的績效，欄位與 analytics.yearly_metrics 相同
+        # skip_first 同 PrefixIndex.year_table：若前一年也有資料則捨去該年第一筆
+        k = self.columns.index(column)
+        buckets = list(self.years)
+        if self.year is not None:
+            buckets.append((self.year, self.year_has_prev, self.year_first, self.year_rest))
+        rows = {"year": [], "n": [], "log": [], "m2": []}
+        for year, has_prev, first, rest in buckets:
+            if skip_first and has_prev:
+                n, log, m2 = rest.n, rest.log, rest.m2
+            else:
+                n, log, m2 = rest.merge_first(first)
+            log, m2 = log[k], m2[k]
+            rows["year"].append(year)
+            rows["n"].append(n)
+            rows["log"].append(log)
+            rows["m2"].append(m2)
+        res = _metrics(np.array(rows["n"]), np.array(rows["log"]), np.array(rows["m2"]),
+                       self.periods, self.risk_free_rate)
+        return pd.DataFrame({"year": np.array(rows["year"], dtype=np.int64), **res})
+
+
+if __name__ == "__main__":
+    import analytics
+    import data
+
+    # 以內附資料逐批重播，與批次計算比對
+    files = ["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"]
+    weights = [0.3, 0.3, 0.4]
+    frame = data.load_matrix(files)
+    acc = OnlineMetrics(weights, frame.columns)
+    values = frame.to_numpy()
+    stamps = frame.index.to_numpy()
+    for lo in range(0, len(frame), 37):
+        acc.update_batch(values[lo:lo + 37], stamps[lo:lo + 37])
+
+    _, idx = analytics.portfolio(frame, weights)
+    batch = analytics.yearly_metrics(idx, skip_first=True)
+    online = acc.year_table(skip_first=True)
+    print(acc.summary())
+    print("年度表最大差異：", float(np.nanmax(np.abs(online[["cagr", "vol"]].to_numpy()
+                                                - batch[["cagr", "vol"]].to_numpy()))))
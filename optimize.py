@@ -0,0 +1,277 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import data
+
+# 配置最佳化：最小變異、最大夏普、目標波動、風險平價（只做多、權重總和為 1）
+# 輸入為年化的平均報酬 mu (K × N) 與共變異數 cov (K × N × N)，K 個期間一次批次求解
+# - N 小（預設 <= 6）：列舉所有「有效資產集合」，每個集合解一次 KKT 線性方程，
+#   取滿足非負與乘數條件者，為二次規劃的精確解
+# - N 大：對單純形做投影梯度（FISTA），同樣批次於 K 個期間
+# 夏普以年化算術平均報酬計算（二次規劃可解的形式）；結果表另外附上與 UI 相同口徑的 CAGR 夏普
+
+EXACT_MAX_ASSETS = 6
+OBJECTIVES = ("min_variance", "max_sharpe", "target_vol", "risk_parity")
+
+
+def moments(rets_mat, bounds, periods=252):
+    # rets_mat 為 (N × T)，bounds 為 K 個 [i, j) 交易日區間；前綴和一次算出所有區間的年化 mu 與 cov
+    r = np.asarray(rets_mat, dtype=np.float64)
+    n_assets, n_days = r.shape
+    center = r.mean(axis=1, keepdims=True)
+    x = r - center
+    s1 = np.zeros((n_assets, n_days + 1))
+    np.cumsum(x, axis=1, out=s1[:, 1:])
+    cross = np.zeros((n_assets, n_assets, n_days + 1))
+    np.cumsum(x[:, None, :] * x[None, :, :], axis=2, out=cross[:, :, 1:])
+
+    i = np.asarray([b[0] for b in bounds])
+    j = np.asarray([b[1] for b in bounds])
+    n = (j - i).astype(np.float64)
+    m = ((s1[:, j] - s1[:, i]) / n).T                       # (K × N)，已扣除全期平均
+    c = np.moveaxis(cross[:, :, j] - cross[:, :, i], 2, 0)  # (K × N × N)
+    cov = (c - n[:, None, None] * m[:, :, None] * m[:, None, :]) / (n - 1)[:, None, None]
+    mu = m + center.T
+    return mu * periods, cov * periods
+
+
+def _subsets(n):
+    for k in range(1, n + 1):
+        yield from combinations(range(n), k)
+
+
+def solve_qp(Q, c, a=None, tol=1e-10):
+    # 精確解 min ½ w'Qw - c'w  s.t.  a'w = 1, w >= 0（a 預設全為 1，即單純形）
+    # Q: (K × N × N)、c: (K × N)、a: (K × N)；回傳 (K × N)，無可行解的列為 NaN
+    Q = np.asarray(Q, dtype=np.float64)
+    c = np.asarray(c, dtype=np.float64)
+    K, N = c.shape
+    a = np.ones((K, N)) if a is None else np.asarray(a, dtype=np.float64)
+    ridge = 1e-12 * np.trace(Q, axis1=1, axis2=2)[:, None, None] * np.eye(N)
+    Q = Q + ridge
+
+    best = np.full((K, N), np.nan)
+    best_obj = np.full(K, np.inf)
+    for S in _subsets(N):
+        S = list(S)
+        s = len(S)
+        kkt = np.zeros((K, s + 1, s + 1))
+        kkt[:, :s, :s] = Q[:, S][:, :, S]
+        kkt[:, :s, s] = a[:, S]
+        kkt[:, s, :s] = a[:, S]
+        rhs = np.concatenate([c[:, S], np.ones((K, 1))], axis=1)
+        try:
+            sol = np.linalg.solve(kkt, rhs[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            sol = (np.linalg.pinv(kkt) @ rhs[..., None])[..., 0]
+        w = np.zeros((K, N))
+        w[:, S] = sol[:, :s]
+        nu = sol[:, s]
+        # KKT 方程為 Qw + ν a = c；不在集合內的資產，乘數 (Qw - c + ν a)_i 必須 >= 0
+        grad = np.einsum("kij,kj->ki", Q, w) - c + nu[:, None] * a
+        out = np.setdiff1d(np.arange(N), S)
+        scale = 1.0 + np.abs(w).sum(axis=1)
+        ok = (w[:, S] >= -tol * scale[:, None]).all(axis=1)
+        ok &= (grad[:, out] >= -tol * np.abs(Q).max(axis=(1, 2))[:, None] * scale[:, None]).all(axis=1)
+        ok &= np.isfinite(sol).all(axis=1) & (np.abs((a * w).sum(axis=1) - 1) < 1e-8)
+        obj = 0.5 * np.einsum("ki,kij,kj->k", w, Q, w) - (c * w).sum(axis=1)
+        take = ok & (obj < best_obj - 1e-15)
+        best[take] = np.clip(w[take], 0.0, None)
+        best_obj[take] = obj[take]
+    return best
+
+
+def project_simplex(v):
+    # 每列投影到 {w >= 0, Σw = 1}（排序法）
+    K, N = v.shape
+    u = -np.sort(-v, axis=1)
+    css = np.cumsum(u, axis=1) - 1
+    k = np.arange(1, N + 1)
+    rho = (u - css / k > 0).sum(axis=1)
+    theta = css[np.arange(K), rho - 1] / rho
+    return np.clip(v - theta[:, None], 0.0, None)
+
+
+def solve_simplex_pg(Q, c, iters=500, tol=1e-12):
+    # 大 N 用：FISTA 投影梯度解 min ½ w'Qw - c'w  s.t. 單純形，K 個問題同時迭代
+    Q = np.asarray(Q, dtype=np.float64)
+    c = np.asarray(c, dtype=np.float64)
+    K, N = c.shape
+    L = np.linalg.eigvalsh(Q)[:, -1][:, None]
+    L = np.where(L > 0, L, 1.0)
+    w = np.full((K, N), 1.0 / N)
+    y = w.copy()
+    t = 1.0
+    for _ in range(iters):
+        grad = np.einsum("kij,kj->ki", Q, y) - c
+        w_next = project_simplex(y - grad / L)
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        y = w_next + (t - 1) / t_next * (w_next - w)
+        done = np.abs(w_next - w).max() < tol
+        w, t = w_next, t_next
+        if done:
+            break
+    return w
+
+
+def _simplex_qp(Q, c):
+    return solve_qp(Q, c) if c.shape[1] <= EXACT_MAX_ASSETS else solve_simplex_pg(Q, c)
+
+
+def _vol(w, cov):
+    return np.sqrt(np.clip(np.einsum("ki,kij,kj->k", w, cov, w), 0.0, None))
+
+
+def min_variance(mu, cov):
+    return _simplex_qp(cov, np.zeros_like(mu))
+
+
+def frontier(mu, cov, lam):
+    # 效率前緣上的點：min ½ w'Σw - λ μ'w（λ 為每列一個的風險容忍度）
+    return _simplex_qp(cov, np.asarray(lam)[:, None] * mu)
+
+
+def max_sharpe(mu, cov, risk_free_rate=0.02):
+    # 有資產超額報酬 > 0 時，令 y = w / (μ - rf)'w，解 min ½ y'Σy s.t. (μ - rf)'y = 1, y >= 0，再正規化
+    # 全部資產超額報酬 <= 0 時沒有正夏普的組合，退而取單一資產中夏普最高者
+    excess = mu - risk_free_rate
+    K, N = mu.shape
+    w = np.full((K, N), np.nan)
+    pos = (excess > 0).any(axis=1)
+    if pos.any():
+        if N <= EXACT_MAX_ASSETS:
+            y = solve_qp(cov[pos], np.zeros((pos.sum(), N)), excess[pos])
+            w[pos] = y / y.sum(axis=1, keepdims=True)
+        else:
+            w[pos] = _sharpe_search(mu[pos], cov[pos], risk_free_rate)
+    if (~pos).any():
+        sd = np.sqrt(np.diagonal(cov[~pos], axis1=1, axis2=2))
+        pick = np.argmax(excess[~pos] / sd, axis=1)
+        w[~pos] = np.eye(N)[pick]
+    return w
+
+
+def _sharpe_search(mu, cov, risk_free_rate, iters=60):
+    # 大 N：夏普沿效率前緣為單峰，對 log λ 做黃金分割搜尋
+    def sharpe(log_lam):
+        w = frontier(mu, cov, np.exp(log_lam))
+        return ((w * mu).sum(axis=1) - risk_free_rate) / _vol(w, cov), w
+
+    lo = np.full(len(mu), -12.0)
+    hi = np.full(len(mu), 6.0)
+    g = (np.sqrt(5) - 1) / 2
+    for _ in range(iters):
+        m1 = hi - g * (hi - lo)
+        m2 = lo + g * (hi - lo)
+        left = sharpe(m1)[0] >= sharpe(m2)[0]
+        hi = np.where(left, m2, hi)
+        lo = np.where(left, lo, m1)
+    return sharpe((lo + hi) / 2)[1]
+
+
+def target_vol(mu, cov, target, iters=60):
+    # 年化波動不超過 target 下報酬最高的配置：沿效率前緣對 log λ 二分搜尋
+    # target 低於最小變異組合的波動時回傳最小變異組合；高於最高報酬資產的波動時回傳該資產
+    K = len(mu)
+    target = np.broadcast_to(np.asarray(target, dtype=np.float64), (K,))
+    lo = np.full(K, -12.0)
+    hi = np.full(K, 12.0)
+    for _ in range(iters):
+        mid = (lo + hi) / 2
+        over = _vol(frontier(mu, cov, np.exp(mid)), cov) > target
+        hi = np.where(over, mid, hi)
+        lo = np.where(over, lo, mid)
+    w = frontier(mu, cov, np.exp(lo))
+    w_min = min_variance(mu, cov)
+    return np.where((_vol(w_min, cov) >= target)[:, None], w_min, w)
+
+
+def risk_parity(cov, iters=50, tol=1e-12):
+    # 各資產風險貢獻 w_i (Σw)_i 相等：解凸問題 min ½ y'Σy - Σ log(y_i) / N 的牛頓法，再正規化
+    cov = np.asarray(cov, dtype=np.float64)
+    K, N = cov.shape[:2]
+    b = 1.0 / N
+    y = 1.0 / np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+    for _ in range(iters):
+        grad = np.einsum("kij,kj->ki", cov, y) - b / y
+        hess = cov + np.eye(N) * (b / y ** 2)[:, :, None]
+        step = np.linalg.solve(hess, grad[..., None])[..., 0]
+        # 保持 y > 0 的回溯
+        with np.errstate(divide="ignore", invalid="ignore"):
+            limit = np.where(step > 0, 0.99 * y / step, np.inf).min(axis=1)
+        alpha = np.minimum(1.0, limit)
+        y = y - alpha[:, None] * step
+        if np.abs(alpha[:, None] * step).max() < tol:
+            break
+    return y / y.sum(axis=1, keepdims=True)
+
+
+def solve(objective, mu, cov, risk_free_rate=0.02, target=0.10):
+    if objective == "min_variance":
+        return min_variance(mu, cov)
+    if objective == "max_sharpe":
+        return max_sharpe(mu, cov, risk_free_rate)
+    if objective == "target_vol":
+        return target_vol(mu, cov, target)
+    if objective == "risk_parity":
+        return risk_parity(cov)
+    raise ValueError(f"未知的目標：{objective}，可用：{', '.join(OBJECTIVES)}")
+
+
+def windows(dates, kind="year"):
+    # 期間列表：'year' 每個自然年度，'pairs' 所有 [起年, 迄年] 組合，'full' 全期間
+    # 回傳 (標籤列表, [i, j) 區間列表)
+    years = np.asarray(dates).astype("datetime64[Y]").astype(np.int64) + 1970
+    uniq, starts = np.unique(years, return_index=True)
+    edges = np.append(starts, len(years))
+    if kind == "full":
+        return ["全期間"], [(0, len(years))]
+    if kind == "year":
+        return [str(y) for y in uniq], list(zip(edges[:-1], edges[1:]))
+    if kind == "pairs":
+        a, b = np.triu_indices(len(uniq))
+        return [f"{uniq[x]}-{uniq[y]}" for x, y in zip(a, b)], list(zip(edges[a], edges[b + 1]))
+    raise ValueError(f"未知的期間類型：{kind}")
+
+
+def by_period(frame, objectives=OBJECTIVES, kind="year", risk_free_rate=0.02, target=0.10, periods=252,
+              labels=None, bounds=None):
+    # 各期間 × 各目標的最佳配置，一次批次求解；附上該期間以 UI 口徑計算的 CAGR / 波動 / 夏普
+    # 直接給 labels / bounds（[i, j) 區間）時不使用 kind
+    if bounds is None:
+        labels, bounds = windows(frame.index.to_numpy(), kind)
+    mu, cov = moments(data.rets_mat(frame), bounds, periods)
+    names = list(frame.columns)
+    tables = []
+    for objective in objectives:
+        w = solve(objective, mu, cov, risk_free_rate, target)
+        t = pd.DataFrame(w, columns=names)
+        t.insert(0, "objective", objective)
+        t.insert(0, "period", labels)
+        t["exp_return"] = (w * mu).sum(axis=1)
+        t["exp_vol"] = _vol(w, cov)
+        tables.append(t)
+    table = pd.concat(tables, ignore_index=True)
+
+    starts = [frame.index[i] for i, _ in bounds] * len(objectives)
+    ends = [frame.index[j - 1] for _, j in bounds] * len(objectives)
+    realized = analytics.score(frame, np.nan_to_num(table[names].to_numpy()),
+                               [str(d.date()) for d in starts], [str(d.date()) for d in ends], risk_free_rate)
+    return pd.concat([table, realized[["cagr", "vol", "sharpe"]]], axis=1)
+
+
+if __name__ == "__main__":
+    import time
+
+    frame = data.load_matrix(["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"])
+    t0 = time.perf_counter()
+    table = by_period(frame, kind="year")
+    print(f"{table['period'].nunique()} 個年度 × {len(OBJECTIVES)} 個目標：{time.perf_counter() - t0:.3f} 秒")
+    with pd.option_context("display.width", 160, "display.max_rows", 200):
+        print(table[table["objective"] == "max_sharpe"].round(3).to_string(index=False))
+    t0 = time.perf_counter()
+    pairs = by_period(frame, kind="pairs")
+    print(f"所有起迄年組合（{pairs['period'].nunique()} 個）：{time.perf_counter() - t0:.3f} 秒")
@@ -0,0 +1,105 @@
+import numpy as np
+
+# 組合報酬的前綴和索引：log(1+r)、r、r² 的累加和加上每年起始位置
+# 任意 [i, j) 交易日區間或 [起年, 迄年] 的 CAGR／波動度都只需常數時間查表
+# 權重變動時重建只需一次 w @ rets_mat 與三次 cumsum（O(N·T) 向量化）
+
+
+def _prefix(x):
+    out = np.empty(len(x) + 1)
+    out[0] = 0.0
+    np.cumsum(x, out=out[1:])
+    return out
+
+
+def prefix_cols(x):
+    # (N × T) 逐列前綴和 -> (N × T+1)，第 0 欄為 0；backtest.py、rolling.py 共用
+    out = np.zeros((x.shape[0], x.shape[1] + 1))
+    np.cumsum(x, axis=1, out=out[:, 1:])
+    return out
+
+
+def log_wealth(port_ret):
+    # (T,) 或 (A × T) 的報酬 -> (…, T+1) 的 log 財富，第 0 點為 0；drawdown.py、withdrawal.py 共用
+    r = np.asarray(port_ret, dtype=np.float64)
+    out = np.zeros(r.shape[:-1] + (r.shape[-1] + 1,))
+    np.cumsum(np.log1p(r), axis=-1, out=out[..., 1:])
+    return out
+
+
+def metrics_from_sums(n, log_ret, s1, s2, periods=252, risk_free_rate=0.02):
+    # 由區間內 log(1+r)、r、r² 的總和與筆數算出績效；皆可為陣列
+    n = np.asarray(n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.expm1(log_ret * periods / n)
+        var = (s2 - s1 * s1 / n) / (n - 1)
+        vol = np.sqrt(np.clip(var, 0.0, None) * periods)
+        sharpe = (cagr - risk_free_rate) / vol
+    return {
+        "n": n,
+        "total_return": np.expm1(log_ret),
+        "cagr": cagr,
+        "vol": np.where(n > 1, vol, np.nan),
+        "sharpe": np.where(n > 1, sharpe, np.nan),
+    }
+
+
+class PrefixIndex:
+
+    def __init__(self, port_ret, dates, periods=252):
+        r = np.asarray(port_ret, dtype=np.float64)
+        self.periods = periods
+        self.dates = np.asarray(dates)
+        self.log = _prefix(np.log1p(r))
+        self.s1 = _prefix(r)
+        self.s2 = _prefix(r * r)
+
+        years = self.dates.astype("datetime64[Y]").astype(np.int64) + 1970
+        self.years, starts = np.unique(years, return_index=True)
+        self.year_start = np.append(starts, len(r))
+
+    @classmethod
+    def from_weights(cls, weights, rets_mat, dates, periods=252):
+        return cls(np.asarray(weights) @ np.asarray(rets_mat), dates, periods)
+
+    def __len__(self):
+        return len(self.s1) - 1
+
+    def range_metrics(self, i, j, risk_free_rate=0.02):
+        # 交易日位置 [i, j) 的績效；i、j 可為純量或陣列（一次查多個區間）
+        i = np.asarray(i)
+        j = np.asarray(j)
+        return metrics_from_sums(j - i, self.log[j] - self.log[i], self.s1[j] - self.s1[i],
+                                 self.s2[j] - self.s2[i], self.periods, risk_free_rate)
+
+    def year_bounds(self, start_year, end_year):
+        # [起年, 迄年] 在序列中的 [i, j) 位置
+        lo = np.searchsorted(self.years, start_year, side="left")
+        hi = np.searchsorted(self.years, end_year, side="right")
+        return self.year_start[lo], self.year_start[hi]
+
+    def date_bounds(self, start, end):
+        # [起日, 迄日]（含）在序列中的 [i, j) 位置
+        i = np.searchsorted(self.dates, np.datetime64(start), side="left")
+        j = np.searchsorted(self.dates, np.datetime64(end), side="right")
+        return i, j
+
+    def year_range(self, start_year, end_year, risk_free_rate=0.02):
+        i, j = self.year_bounds(start_year, end_year)
+        return self.range_metrics(i, j, risk_free_rate)
+
+    def year_table(self, skip_first=False, risk_free_rate=0.02):
+        # 每個自然年度的績效；skip_first=True 時，若前一年也有資料則捨去該年第一筆
+        # （對應 UI_bias.py 原本 grp.iloc[1:] 的作法）
+        i = self.year_start[:-1].copy()
+        j = self.year_start[1:]
+        if skip_first:
+            has_prev = np.concatenate([[False], np.diff(self.years) == 1])
+            i[has_prev & (j - i > 0)] += 1
+        res = self.range_metrics(i, j, risk_free_rate)
+        res["year"] = self.years
+        return res
+
+    def cumulative(self, i, j):
+        # [i, j) 區間以 i 為起點重新累積的報酬序列，取代 (1 + r).cumprod() - 1
+        return np.expm1(self.log[i + 1:j + 1] - self.log[i])
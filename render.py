@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+# 輕量繪圖層：長序列只送「看得出差別」的點給瀏覽器
+# - lttb：Largest-Triangle-Three-Buckets，每個桶挑與前後兩點圍出最大三角形的點，保留折線外形
+# - minmax：每個桶保留最小與最大值，峰谷不會被削掉，適合面積圖與回撤
+# 點數預設約為圖表像素寬度；放大到某個日期區間時先切片再降採樣，區間內點數夠少就是全解析度
+# 原始資料表則分頁，每次只傳一頁
+
+DEFAULT_POINTS = 1000
+METHODS = ("lttb", "minmax")
+
+
+def _numeric(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb_indices(x, y, n):
+    # 回傳保留點的索引（含首尾，共 n 個）；每個桶內的三角形面積一次向量化算完
+    x, y = _numeric(x), np.asarray(y, dtype=np.float64)
+    t = len(y)
+    if n >= t or n < 3:
+        return np.arange(t)
+    edges = np.linspace(1, t - 1, n - 1).astype(np.int64)
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, t - 1
+    a = 0
+    for k in range(n - 2):
+        lo, hi = edges[k], edges[k + 1]
+        # 下一個桶的平均點（最後一個桶則用終點）
+        nlo, nhi = hi, edges[k + 2] if k + 2 < len(edges) else t
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[k + 1] = a
+    return out
+
+
+def minmax_indices(y, n):
+    # 每個桶保留最小、最大值的索引（含首尾），依時間排序；約 n 個點
+    y = np.asarray(y, dtype=np.float64)
+    t = len(y)
+    if n >= t or n < 4:
+        return np.arange(t)
+    width = -(-t // (n // 2))
+    nb = -(-t // width)
+    pad = nb * width - t
+    lo = np.concatenate([y, np.full(pad, np.inf)]).reshape(nb, width)
+    hi = np.concatenate([y, np.full(pad, -np.inf)]).reshape(nb, width)
+    base = np.arange(nb) * width
+    keep = np.concatenate([[0, t - 1], base + np.argmin(lo, axis=1), base + np.argmax(hi, axis=1)])
+    return np.unique(keep)
+
+
+def indices(x, y, n=DEFAULT_POINTS, method="lttb"):
+    if method not in METHODS:
+        raise ValueError(f"未知的降採樣方法：{method}，可用 {METHODS}")
+    # NaN 會讓兩種方法都挑錯點，先排除
+    ok = np.flatnonzero(~np.isnan(np.asarray(y, dtype=np.float64)))
+    if method == "lttb":
+        return ok[lttb_indices(np.asarray(x)[ok], np.asarray(y)[ok], n)]
+    return ok[minmax_indices(np.asarray(y)[ok], n)]
+
+
+def window(frame, x, start=None, end=None):
+    # 依 x 欄（已排序）切出 [start, end] 的連續列
+    values = frame[x].to_numpy()
+    lo = 0 if start is None else np.searchsorted(values, np.asarray(start, dtype=values.dtype), side="left")
+    hi = len(values) if end is None else np.searchsorted(values, np.asarray(end, dtype=values.dtype), side="right")
+    return frame.iloc[lo:hi]
+
+
+def downsample(frame, x, y, n=DEFAULT_POINTS, method="lttb", by=None, start=None, end=None):
+    # 圖表用的資料：先切到 [start, end]，再把每條序列（by 欄分組）降到約 n 個點
+    # 區間內點數 <= n 時原樣回傳，也就是放大後自動回到全解析度
+    if by is None:
+        frame = window(frame, x, start, end)
+        if len(frame) <= n:
+            return frame
+        return frame.iloc[indices(frame[x].to_numpy(), frame[y].to_numpy(), n, method)]
+    parts = [downsample(g, x, y, n, method, None, start, end) for _, g in frame.groupby(by, sort=False)]
+    return pd.concat(parts) if parts else frame
+
+
+def n_pages(frame, size):
+    return max(1, -(-len(frame) // size))
+
+
+def page(frame, number, size=100):
+    # 第 number 頁（從 1 開始）的列
+    number = min(max(int(number), 1), n_pages(frame, size))
+    return frame.iloc[(number - 1) * size:number * size]
+
+
+if __name__ == "__main__":
+    import time
+
+    import data
+
+    frame = data.load_matrix(["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"])
+    port = np.array([0.3, 0.3, 0.4]) @ data.rets_mat(frame)
+    chart = pd.DataFrame({"Date": frame.index, "CumRet": np.cumprod(1 + port) - 1})
+
+    for method in METHODS:
+        t0 = time.perf_counter()
+        small = downsample(chart, "Date", "CumRet", method=method)
+        dt = time.perf_counter() - t0
+        before, after = (len(f.to_json(date_format="iso")) / 1024 for f in (chart, small))
+        print(f"{method:>6}: {len(chart)} -> {len(small)} 點，{dt * 1000:.1f} ms，JSON {before:.0f} KB -> {after:.0f} KB")
+    zoom = downsample(chart, "Date", "CumRet", start=np.datetime64("2020-01-01"), end=np.datetime64("2020-12-31"))
+    print(f"放大 2020 年：{len(zoom)} 點（全解析度）")
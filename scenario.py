@@ -0,0 +1,203 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import store
+
+# 壓力情境：歷史危機區間自動偵測 + 自訂衝擊，所有情境 × 所有配置一次批次評估
+# - 危機區間：各資產 log 財富依「創新高」切段，每段的高點 -> 谷底即一次回撤事件，
+#   取每個資產最深的幾次，合併重疊區間後成為情境目錄；落在知名事件期間者附上名稱
+# - 自訂衝擊：利率 ±bp 依存續期間換算債券報酬（-D·Δy），股市 ±% 依 beta 換算，可分散在數天內
+# - 每個情境都是一段 (N × L) 的報酬；不同長度補 0（報酬為 0 = 不變）後疊成 (S × N × L)，
+#   與 (A × N) 權重一次 einsum，得到 (情境 × 配置) 的總報酬、最大回撤與最差單日
+
+# 內附資料的存續期間（年）與股市 beta；其他檔案預設 0（不受該衝擊影響），可自行指定
+DURATIONS = {"ishare20_c": 17.0, "ishare1_3_c": 1.9}
+EQUITY_BETAS = {"spy_c": 1.0}
+# 偵測到的區間與這些期間重疊時，情境名稱附上事件名
+KNOWN_EVENTS = {
+    "2008 金融海嘯": ("2007-10-01", "2009-03-31"),
+    "2011 美債降評": ("2011-07-01", "2011-10-31"),
+    "2018 Q4 股災": ("2018-09-20", "2018-12-31"),
+    "2020 新冠疫情": ("2020-02-15", "2020-04-30"),
+    "2022 升息債災": ("2021-12-01", "2022-10-31"),
+}
+
+
+class Scenario(NamedTuple):
+    name: str
+    kind: str          # "historical" 或 "shock"
+    start: object      # 歷史區間的起迄日（衝擊情境為 None）
+    end: object
+    rets: np.ndarray   # (N × L) 逐日報酬
+
+
+def episodes(level):
+    # level 為單一序列 (P,) 的 log 財富；回傳所有回撤事件 (高點, 谷底, 回復或 None, 深度 log)，依深度排序
+    level = np.asarray(level, dtype=np.float64)
+    pos = np.arange(len(level))
+    peak = np.maximum.accumulate(level)
+    seg = np.maximum.accumulate(np.where(level >= peak, pos, 0))
+    # 同一段（同一個高點）連續排列，reduceat 一次取每段的最低點
+    starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+    dd = level - peak
+    depth = np.minimum.reduceat(dd, starts)
+    ends = np.r_[starts[1:], len(level)]
+    out = []
+    for k in np.argsort(depth):
+        if depth[k] >= 0:
+            break
+        lo, hi = starts[k], ends[k]
+        trough = lo + int(np.argmin(dd[lo:hi]))
+        out.append((int(seg[lo]), trough, int(hi) if hi < len(level) else None, float(depth[k])))
+    return out
+
+
+def _event_name(start, end):
+    for name, (lo, hi) in KNOWN_EVENTS.items():
+        if pd.Timestamp(start) <= pd.Timestamp(hi) and pd.Timestamp(end) >= pd.Timestamp(lo):
+            return name
+    return None
+
+
+def detect(frame, top=3, min_depth=0.05, overlap=0.5):
+    # frame 為 (T × N) 報酬（DatetimeIndex）；每個資產取最深的 top 次高點 -> 谷底區間
+    # 區間交集 / 聯集超過 overlap 者視為同一事件，只留最深的一個
+    rets = frame.to_numpy(dtype=np.float64).T
+    dates = frame.index
+    level = np.zeros((rets.shape[0], rets.shape[1] + 1))
+    np.cumsum(np.log1p(rets), axis=1, out=level[:, 1:])
+
+    found = []
+    for n, name in enumerate(frame.columns):
+        for peak, trough, _, depth in episodes(level[n])[:top]:
+            if np.expm1(depth) > -min_depth:
+                break
+            # log 財富第 t 點 = 第 t 天收盤後；區間報酬為第 peak ~ trough-1 筆
+            found.append((depth, name, peak, trough))
+
+    kept = []
+    for depth, name, lo, hi in sorted(found):
+        if all(_iou((lo, hi), (k[2], k[3])) <= overlap for k in kept):
+            kept.append((depth, name, lo, hi))
+
+    out = []
+    for depth, name, lo, hi in sorted(kept, key=lambda k: k[2]):
+        start, end = dates[lo], dates[hi - 1]
+        event = _event_name(start, end)
+        label = f"{start:%Y-%m-%d} ~ {end:%Y-%m-%d}（{name} {np.expm1(depth):.0%}）"
+        out.append(Scenario(f"{event}：{label}" if event else label, "historical", start, end, rets[:, lo:hi]))
+    return out
+
+
+def _iou(a, b):
+    inter = min(a[1], b[1]) - max(a[0], b[0])
+    return max(inter, 0) / (max(a[1], b[1]) - min(a[0], b[0]))
+
+
+def window(frame, start, end, name=None):
+    # 指定起迄日的歷史情境
+    sub = frame.loc[pd.Timestamp(start):pd.Timestamp(end)]
+    name = name or f"{pd.Timestamp(start):%Y-%m-%d} ~ {pd.Timestamp(end):%Y-%m-%d}"
+    return Scenario(name, "historical", sub.index[0], sub.index[-1], sub.to_numpy(dtype=np.float64).T)
+
+
+def shock_returns(names, rate_bp=0.0, equity=0.0, durations=None, betas=None):
+    # 每個資產的瞬間報酬：債券 -D·Δy（忽略凸性），股票 beta·股市跌幅；兩者相加
+    durations = {**DURATIONS, **(durations or {})}
+    betas = {**EQUITY_BETAS, **(betas or {})}
+    d = np.array([durations.get(n, 0.0) for n in names])
+    b = np.array([betas.get(n, 0.0) for n in names])
+    return np.maximum(-d * rate_bp / 1e4 + b * equity, -1.0)
+
+
+def shock(names, rate_bp=0.0, equity=0.0, days=1, durations=None, betas=None, name=None):
+    # 自訂衝擊情境；days > 1 時以等比方式分散在 days 天內（總報酬不變，但回撤路徑更平滑）
+    total = shock_returns(names, rate_bp, equity, durations, betas)
+    daily = np.expm1(np.log1p(total) / days)
+    if name is None:
+        parts = []
+        if rate_bp:
+            parts.append(f"利率 {rate_bp:+.0f}bp")
+        if equity:
+            parts.append(f"股市 {equity:+.0%}")
+        name = "、".join(parts) or "無衝擊"
+        if days > 1:
+            name += f"（{days} 天）"
+    return Scenario(name, "shock", None, None, np.repeat(daily[:, None], days, axis=1))
+
+
+def stack(scenarios):
+    # 不同長度補 0 報酬 -> (S × N × L)，以及每個情境的實際長度
+    lengths = np.array([s.rets.shape[1] for s in scenarios])
+    out = np.zeros((len(scenarios), scenarios[0].rets.shape[0], lengths.max()))
+    for k, s in enumerate(scenarios):
+        out[k, :, :lengths[k]] = s.rets
+    return out, lengths
+
+
+def evaluate(scenarios, weights, rebalance="daily", chunk=1024):
+    # 所有情境 × 所有配置：總報酬、最大回撤（期初也算高點）、最差單日，皆為 (S × A)
+    # rebalance="daily" 與其他引擎相同每日再平衡；"none" 為期初配置後買進持有
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    rets, _ = stack(scenarios)
+    s, a = len(scenarios), len(weights)
+    total, mdd, worst = np.empty((s, a)), np.empty((s, a)), np.empty((s, a))
+    if rebalance == "none":
+        growth = np.cumprod(1 + rets, axis=2)
+    elif rebalance != "daily":
+        raise ValueError(f"未知的再平衡方式：{rebalance}")
+    for lo in range(0, a, chunk):
+        w = weights[lo:lo + chunk]
+        if rebalance == "daily":
+            port = np.einsum("an,snl->sal", w, rets)
+            level = np.cumsum(np.log1p(port), axis=2)
+            worst[:, lo:lo + chunk] = port.min(axis=2)
+        else:
+            value = np.einsum("an,snl->sal", w, growth)
+            level = np.log(value)
+            worst[:, lo:lo + chunk] = np.expm1(np.diff(level, axis=2, prepend=0.0).min(axis=2))
+        # 補 0 的尾端報酬為 0，財富不變，不影響總報酬與回撤
+        total[:, lo:lo + chunk] = np.expm1(level[:, :, -1])
+        peak = np.maximum(np.maximum.accumulate(level, axis=2), 0.0)
+        mdd[:, lo:lo + chunk] = np.expm1((level - peak).min(axis=2))
+    return {"total": total, "mdd": mdd, "worst_day": worst}
+
+
+def loss_table(scenarios, weights, labels=None, metric="total", rebalance="daily"):
+    # 情境 × 配置的表格（列為情境，欄為配置）
+    res = evaluate(scenarios, weights, rebalance)
+    labels = labels or [" / ".join(f"{x:.0%}" for x in w) for w in np.atleast_2d(weights)]
+    return pd.DataFrame(res[metric], index=[s.name for s in scenarios], columns=labels).rename_axis("scenario")
+
+
+def names_of(paths):
+    return [store.asset_name(p) for p in paths]
+
+
+if __name__ == "__main__":
+    import time
+
+    import data
+    import grid
+
+    files = ["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"]
+    frame = data.load_matrix(files)
+    names = names_of(files)
+
+    scenarios = detect(frame) + [
+        shock(names, rate_bp=200),
+        shock(names, equity=-0.30),
+        shock(names, rate_bp=200, equity=-0.20, days=21),
+    ]
+    weights = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1], [0.2, 0.2, 0.6], [1 / 3, 1 / 3, 1 / 3]])
+    with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+        print(loss_table(scenarios, weights).to_string(float_format="{:.2%}".format))
+
+    W = grid.simplex_grid(3, 0.01)
+    t0 = time.perf_counter()
+    res = evaluate(scenarios, W)
+    print(f"{len(scenarios)} 個情境 × {len(W)} 組配置：{time.perf_counter() - t0:.3f} 秒")
+    best = res["total"].min(axis=0).argmax()
+    print("所有情境中最差結果最好的配置：", W[best], f"{res['total'][:, best].min():.2%}")
@@ -0,0 +1,317 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import data
+import grid
+
+# 大型 ETF 母體的組合搜尋：一個目錄下數百檔 *_c.csv，評估所有 2 檔 / 3 檔組合 × 權重網格
+# 1. 全母體只算一次日報酬平均 μ 與共變異數 Σ（一次矩陣乘法），放進共享記憶體
+# 2. 初篩：組合 c、權重 w 的平均 w'μ_c 與變異數 w'Σ_c w 都是「Σ_c 的 6 個元素 × 權重的二次項」，
+#    一批組合 × 整個網格只是一次 (B × 6) @ (6 × P) 的矩陣乘法；CAGR 以 μ - σ²/2 近似
+# 3. 精算：各任務的候選組合合併後，依初篩估計取全母體前 top × oversample 組，用共享記憶體中的
+#    報酬矩陣逐一精算「整個權重網格」的實際 CAGR / 波動 / 夏普 / 最大回撤，再取前 top 名
+# 初篩估計不考慮偏態與厚尾，候選池外的組合不會被精算，所以三種目標的結果都是近似：
+# 池內的組合保證取到網格上真正最好的權重，但排名可能與窮舉不同；oversample 越大越接近窮舉
+# 工作依「第一檔資產」切分給行程池；300 檔約 450 萬組三檔組合
+#
+#   python search.py etfs/ --objective sharpe --top 20
+#   python search.py etfs/ --objective cagr --vol-cap 0.10 --sizes 3 --workers 8
+#   python search.py etfs/ --objective mdd --min-cagr 0.05 --start 2010-01-01
+
+OBJECTIVES = ("sharpe", "cagr", "mdd")
+# 每個名次精算的候選組合數；最大回撤無法由動差估計，初篩以「最低波動」代替，候選池放大
+# 精算時間與候選數成正比
+OVERSAMPLE = {"sharpe": 10, "cagr": 10, "mdd": 50}
+# 網格精算每批 (組合 × 權重 × 交易日) 的上限（bytes）
+REFINE_BYTES = 64 * 2**20
+
+
+class Moments(NamedTuple):
+    mu: np.ndarray   # (N,) 日報酬平均
+    cov: np.ndarray  # (N × N) 日報酬共變異數（ddof=1）
+
+
+def load_universe(directory, start=None, pattern="_c.csv"):
+    # 目錄下所有 adjust.py 格式的檔案 -> (T × N) 共同交易日報酬
+    # 指定 start 時，只保留在 start 之前就有資料的資產，並從 start 開始對齊（避免新上市 ETF 把共同期間縮短）
+    paths = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(pattern))
+    if not paths:
+        raise FileNotFoundError(f"{directory} 下沒有 *{pattern} 檔案")
+    series = data.load_series(paths)
+    if start is not None:
+        start = np.datetime64(pd.Timestamp(start).date(), "D")
+        series = [s for s in series if len(s.date) and s.date[0] <= start]
+    frame = data.align_returns(series)
+    if start is not None:
+        frame = frame[frame.index >= pd.Timestamp(start)]
+    return frame
+
+
+def moments(rets_mat):
+    rets_mat = np.asarray(rets_mat, dtype=np.float64)
+    mu = rets_mat.mean(axis=1)
+    x = rets_mat - mu[:, None]
+    return Moments(mu, x @ x.T / (rets_mat.shape[1] - 1))
+
+
+def weight_grid(k, step=0.05):
+    # 每檔權重都 > 0 的網格（有 0 的配置屬於較小的組合，不重複評估）
+    W = grid.simplex_grid(k, step)
+    return W[(W > 0).all(axis=1)]
+
+
+def _quad_terms(W):
+    # w'Σw = Σ_i w_i² σ_ii + Σ_{i<j} 2 w_i w_j σ_ij；回傳 (項數 × P) 與對應的 (i, j)
+    k = W.shape[1]
+    pairs = [(i, i) for i in range(k)] + [(i, j) for i in range(k) for j in range(i + 1, k)]
+    terms = np.array([W[:, i] * W[:, j] * (1 if i == j else 2) for i, j in pairs])
+    return terms, np.array(pairs)
+
+
+def combos_with_first(n, k, first):
+    # 第一檔為 first、其餘依序遞增的所有 k 檔組合
+    rest = np.arange(first + 1, n)
+    if k == 2:
+        return np.column_stack([np.full(len(rest), first), rest])
+    i, j = np.triu_indices(len(rest), 1)
+    return np.column_stack([np.full(len(i), first), rest[i], rest[j]])
+
+
+def estimate(mu_c, cov_terms, W, terms, periods=252, risk_free_rate=0.02):
+    # mu_c (B × k)、cov_terms (B × 項數) -> 每個組合 × 權重的 (CAGR 估計, 年化波動, 夏普估計)，皆為 (B × P)
+    mean = mu_c @ W.T
+    var = np.clip(cov_terms @ terms, 0.0, None)
+    cagr = np.expm1((mean - 0.5 * var) * periods)
+    vol = np.sqrt(var * periods)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = (cagr - risk_free_rate) / vol
+    return cagr, vol, sharpe
+
+
+def _score(objective, cagr, vol, sharpe, mdd=None, vol_cap=None, min_cagr=None):
+    # 越大越好；不符合限制者為 -inf
+    if objective == "sharpe":
+        score = np.where(vol > 0, sharpe, -np.inf)
+    elif objective == "cagr":
+        score = cagr.copy()
+    elif objective == "mdd":
+        score = -vol if mdd is None else mdd.copy()
+    else:
+        raise ValueError(f"未知的目標：{objective}，可用 {OBJECTIVES}")
+    if vol_cap is not None:
+        score[vol > vol_cap] = -np.inf
+    if min_cagr is not None:
+        score[cagr < min_cagr] = -np.inf
+    return score
+
+
+def exact_metrics(port, periods=252, risk_free_rate=0.02):
+    # port 為 (K × T) 逐日組合報酬；與 grid.evaluate 相同定義
+    n_days = port.shape[1]
+    level = np.cumsum(np.log1p(port), axis=1)
+    cagr = np.expm1(level[:, -1] * periods / n_days)
+    vol = port.std(axis=1, ddof=1) * np.sqrt(periods)
+    peak = np.maximum(np.maximum.accumulate(level, axis=1), 0.0)
+    mdd = np.expm1((level - peak).min(axis=1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = (cagr - risk_free_rate) / vol
+    return cagr, vol, sharpe, mdd
+
+
+# ---- 共享記憶體 ----
+_shared = {}
+
+
+def _share(arrays):
+    # 把陣列複製到共享記憶體，回傳 (SharedMemory 物件, 給工作行程的描述)
+    blocks, spec = [], {}
+    for name, a in arrays.items():
+        a = np.ascontiguousarray(a, dtype=np.float64)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype=np.float64, buffer=shm.buf)[...] = a
+        blocks.append(shm)
+        spec[name] = (shm.name, a.shape)
+    return blocks, spec
+
+
+def _attach(spec):
+    # 工作行程初始化：以唯讀視圖掛上共享陣列（保留 SharedMemory 物件避免被回收）
+    for name, (shm_name, shape) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        view = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        view.flags.writeable = False
+        _shared[name] = (shm, view)
+
+
+def _get(name):
+    return _shared[name][1]
+
+
+def _search_first(first, k, step, objective, keep, vol_cap, min_cagr, periods, risk_free_rate, batch):
+    # 一個任務：第一檔資產為 first 的所有 k 檔組合；回傳初篩估計的前 keep 名（組合與估計值）
+    mu, cov = _get("mu"), _get("cov")
+    W = weight_grid(k, step)
+    terms, pairs = _quad_terms(W)
+    combos = combos_with_first(len(mu), k, first)
+    best_score, best_combo = [], []
+    for lo in range(0, len(combos), batch):
+        c = combos[lo:lo + batch]
+        cov_terms = cov[c[:, pairs[:, 0]], c[:, pairs[:, 1]]]
+        cagr, vol, sharpe = estimate(mu[c], cov_terms, W, terms, periods, risk_free_rate)
+        score = _score(objective, cagr, vol, sharpe, vol_cap=vol_cap, min_cagr=min_cagr)
+        # 每個組合先取自己最好的權重，再在批次內取前 keep 名
+        w_at = score.argmax(axis=1)
+        s = score[np.arange(len(c)), w_at]
+        top = np.argsort(-s)[:keep]
+        top = top[np.isfinite(s[top])]
+        best_score.append(s[top])
+        best_combo.append(c[top])
+    if not best_score:
+        return None
+    s = np.concatenate(best_score)
+    top = np.argsort(-s)[:keep]
+    if len(top) == 0:
+        return None
+    return {"combo": np.concatenate(best_combo)[top], "estimate": s[top]}
+
+
+def _refine_grid(combos, estimates, step, objective, vol_cap, min_cagr, periods, risk_free_rate):
+    # 一批 k 檔組合 × 整個權重網格的實際績效，每個組合取最好的權重
+    # (K × P × T) 的逐日組合報酬；初篩的最佳權重不一定是實際最佳（偏態、厚尾、最大回撤）
+    rets = _get("rets")
+    W = weight_grid(combos.shape[1], step)
+    port = np.einsum("pj,kjt->kpt", W, rets[combos]).reshape(-1, rets.shape[1])
+    cagr, vol, sharpe, mdd = (m.reshape(len(combos), len(W)) for m in exact_metrics(port, periods, risk_free_rate))
+    score = _score(objective, cagr, vol, sharpe, mdd, vol_cap, min_cagr)
+    at, rows = score.argmax(axis=1), np.arange(len(combos))
+    return {"combo": combos, "weights": W[at], "estimate": estimates, "score": score[rows, at],
+            "cagr": cagr[rows, at], "vol": vol[rows, at], "sharpe": sharpe[rows, at], "mdd": mdd[rows, at]}
+
+
+def _grid_tasks(results, pool_size, step, n_days, args):
+    # 合併各任務的候選組合，依初篩估計取全母體前 pool_size 組，依檔數分批給 _refine_grid
+    found = [(e, tuple(c)) for res in results if res is not None
+             for c, e in zip(res["combo"], res["estimate"])]
+    found.sort(key=lambda x: -x[0])
+    tasks = []
+    for k in sorted({len(c) for _, c in found}):
+        picked = [(e, c) for e, c in found[:pool_size] if len(c) == k]
+        chunk = max(1, REFINE_BYTES // (len(weight_grid(k, step)) * n_days * 8))
+        for lo in range(0, len(picked), chunk):
+            part = picked[lo:lo + chunk]
+            tasks.append((np.array([c for _, c in part]), np.array([e for e, _ in part]), step) + args)
+    return tasks
+
+
+def search(frame, objective="sharpe", sizes=(2, 3), step=0.05, top=20, vol_cap=None, min_cagr=None,
+           workers=None, periods=252, risk_free_rate=0.02, batch=4096, oversample=None):
+    # frame 為 (T × N) 報酬；回傳依目標排序的前 top 名組合
+    # oversample：每個名次要精算的候選數，預設見 OVERSAMPLE（結果為近似，放大可更接近窮舉）
+    if objective not in OBJECTIVES:
+        raise ValueError(f"未知的目標：{objective}，可用 {OBJECTIVES}")
+    names = list(frame.columns)
+    rets = data.rets_mat(frame)
+    mom = moments(rets)
+    keep = top * (oversample or OVERSAMPLE[objective])
+    tasks = [(first, k) for k in sizes for first in range(len(names) - k + 1)]
+    # 第一檔越前面的組合越多，先送大任務讓行程池負載平衡
+    tasks.sort(key=lambda t: -(len(names) - t[0] - 1) ** (t[1] - 1))
+
+    blocks, spec = _share({"mu": mom.mu, "cov": mom.cov, "rets": rets})
+    try:
+        args = [(first, k, step, objective, keep, vol_cap, min_cagr, periods, risk_free_rate, batch)
+                for first, k in tasks]
+        workers = workers or os.cpu_count()
+        pool = None
+        if workers == 1:
+            _attach(spec)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(spec,))
+
+        def run(fn, tasks):
+            if pool is None or not tasks:
+                return [fn(*a) for a in tasks]
+            return list(pool.map(fn, *zip(*tasks), chunksize=max(1, len(tasks) // (workers * 8))))
+
+        try:
+            results = run(_refine_grid, _grid_tasks(run(_search_first, args), keep, step, rets.shape[1],
+                                                    (objective, vol_cap, min_cagr, periods, risk_free_rate)))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    finally:
+        for name in list(_shared):
+            _shared.pop(name)[0].close()
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    rows = []
+    for res in results:
+        if res is None:
+            continue
+        for i in range(len(res["combo"])):
+            if np.isfinite(res["score"][i]):
+                rows.append({
+                    "assets": " + ".join(names[j] for j in res["combo"][i]),
+                    "weights": " / ".join(f"{w:.0%}" for w in res["weights"][i]),
+                    "n_assets": len(res["combo"][i]),
+                    "cagr": res["cagr"][i], "vol": res["vol"][i],
+                    "sharpe": res["sharpe"][i], "mdd": res["mdd"][i],
+                    "score": res["score"][i], "estimate": res["estimate"][i],
+                })
+    if not rows:
+        return pd.DataFrame(columns=["assets", "weights", "n_assets", "cagr", "vol", "sharpe", "mdd", "score", "estimate"])
+    out = pd.DataFrame(rows).sort_values("score", ascending=False, ignore_index=True)
+    return out.head(top)
+
+
+def n_combinations(n, sizes=(2, 3), step=0.05):
+    # 組合數與「組合 × 權重」評估次數
+    from math import comb
+    n_combo = sum(comb(n, k) for k in sizes)
+    n_eval = sum(comb(n, k) * len(weight_grid(k, step)) for k in sizes)
+    return n_combo, n_eval
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="ETF 母體的 2 / 3 檔組合搜尋")
+    parser.add_argument("directory", help="放置 *_c.csv 的目錄")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="sharpe",
+                        help="皆為近似：動差初篩（mdd 以最低波動代替）後，精算候選池的整個權重網格")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 3], choices=[2, 3])
+    parser.add_argument("--step", type=float, default=0.05, help="權重網格間距")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--vol-cap", type=float, default=None, help="年化波動上限（cagr 目標常用）")
+    parser.add_argument("--min-cagr", type=float, default=None, help="年化報酬下限（mdd 目標常用）")
+    parser.add_argument("--start", default=None, help="只用此日期前已上市的資產，並從此日期起對齊")
+    parser.add_argument("--workers", type=int, default=None, help="預設使用所有 CPU")
+    parser.add_argument("--oversample", type=int, default=None,
+                        help="每個名次精算的候選組合數（預設 sharpe / cagr 10、mdd 50）；調大可更接近窮舉")
+    parser.add_argument("--out", default=None, help="結果另存 CSV")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    frame = load_universe(args.directory, args.start)
+    n_combo, n_eval = n_combinations(frame.shape[1], args.sizes, args.step)
+    print(f"{frame.shape[1]} 檔資產 × {len(frame)} 個交易日：{n_combo:,} 組組合、{n_eval:,} 次評估"
+          f"（載入 {time.perf_counter() - t0:.1f} 秒）")
+
+    t0 = time.perf_counter()
+    table = search(frame, args.objective, tuple(args.sizes), args.step, args.top,
+                   args.vol_cap, args.min_cagr, args.workers, oversample=args.oversample)
+    print(f"搜尋 {time.perf_counter() - t0:.1f} 秒")
+    with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+        print(table.to_string(formatters={"cagr": "{:.2%}".format, "vol": "{:.2%}".format,
+                                          "sharpe": "{:.3f}".format, "mdd": "{:.2%}".format,
+                                          "score": "{:.4f}".format, "estimate": "{:.4f}".format}))
+    if args.out:
+        table.to_csv(args.out, index=False)
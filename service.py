@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import cache
+import data
+import instrument
+import prefix
+
+# 無狀態計算服務：UI_bias.py 的資料載入、對齊、組合報酬、逐年與區間績效以本機 HTTP/JSON 提供
+# - 主行程載入並對齊報酬矩陣一次，放進共享記憶體；工作行程池依名稱掛上，不複製、不重新解析
+# - 相同的請求（檔案 + 量化後權重 + 年份）同時到達時只算一次，其他請求等同一個 Future；
+#   算完的結果放進 LRU（cache.LRUCache），之後直接回傳
+# - 排隊中的計算超過上限時立即回 503 + Retry-After，讓前端退避，而不是把佇列越堆越長
+# - Streamlit 端設定 PORTFOLIO_SERVICE_URL 後只當薄客戶端（見 Client）
+#
+#   python service.py --port 8765 --workers 4
+#   PORTFOLIO_SERVICE_URL=http://127.0.0.1:8765 streamlit run UI_bias.py
+#
+#   GET  /health                       服務狀態
+#   GET  /metrics                      Prometheus 文字格式（instrument.py）
+#   POST /matrix     {files}           對齊後的 (T × N) 報酬
+#   POST /portfolio  {files, weights}  逐日組合報酬、累積報酬與逐年績效
+#   POST /period     {files, weights, start_year, end_year}  區間績效與重新起算的累積報酬
+
+DEFAULT_PORT = 8765
+RISK_FREE_RATE = 0.02
+
+
+class Busy(Exception):
+    pass
+
+
+# ---- 共享記憶體中的報酬矩陣 ----
+
+def _share(array):
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+# 工作行程內已掛上的區段：名稱 -> (SharedMemory, 陣列)
+_attached = {}
+
+
+def _view(spec):
+    name, shape, dtype = spec
+    if name not in _attached:
+        # 舊版本的矩陣（來源檔案更新後）不再被引用，只保留最近幾個
+        while len(_attached) >= 16:
+            _attached.pop(next(iter(_attached)))[0].close()
+        shm = shared_memory.SharedMemory(name=name)
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        view.flags.writeable = False
+        _attached[name] = (shm, view)
+    return _attached[name][1]
+
+
+# ---- 工作行程中執行的計算（回傳可直接轉 JSON 的 dict）----
+
+def _index(matrix, weights):
+    rets, dates = _view(matrix["rets"]), _view(matrix["dates"])
+    return prefix.PrefixIndex(np.asarray(weights) @ rets, dates.view("datetime64[D]"))
+
+
+def _portfolio(matrix, weights, skip_first, risk_free_rate):
+    idx = _index(matrix, weights)
+    yearly = analytics.yearly_metrics(idx, skip_first=skip_first, risk_free_rate=risk_free_rate)
+    return {
+        "dates": idx.dates.astype(str).tolist(),
+        "port_ret": (np.asarray(weights) @ _view(matrix["rets"])).tolist(),
+        "cumulative": idx.cumulative(0, len(idx)).tolist(),
+        "yearly": {k: v.tolist() for k, v in yearly.items()},
+    }
+
+
+def _period(matrix, weights, start_year, end_year, risk_free_rate):
+    idx = _index(matrix, weights)
+    i, j = (int(x) for x in idx.year_bounds(start_year, end_year))
+    res = {k: float(v) for k, v in idx.range_metrics(i, j, risk_free_rate).items()}
+    cum = idx.cumulative(i, j)
+    # 區間內最大回撤（期初資金也算一個高點），與 UI_bias.build_period 相同
+    wealth = np.concatenate([[1.0], 1 + cum])
+    res["mdd"] = float((wealth / np.maximum.accumulate(wealth) - 1).min()) if j > i else float("nan")
+    return {"start": i, "end": j, "metrics": res, "dates": idx.dates[i:j].astype(str).tolist(),
+            "cumulative": cum.tolist()}
+
+
+class Service:
+
+    def __init__(self, root=".", workers=None, max_pending=None, cache_size=512):
+        self.root = os.path.abspath(root)
+        self.workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.max_pending = max_pending or self.workers * 4
+        self.results = cache.LRUCache(maxsize=cache_size)
+        # Future 可能在 add_done_callback 時已完成、回呼立即在持鎖的執行緒中執行，所以用 RLock
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._matrices = {}   # 檔案清單 -> (files_key, spec, names, 共享區段, 陣列)
+        # 來源檔案更新後被換下的區段：可能仍有排隊中的計算要掛上，關閉服務時才釋放
+        self._retired = []
+        self._inflight = {}   # 請求鍵 -> Future
+        self.pending = 0
+
+    # ---- 報酬矩陣 ----
+    def _paths(self, files):
+        # 只允許服務根目錄下的檔案
+        paths = []
+        for f in files:
+            p = os.path.abspath(os.path.join(self.root, f))
+            if os.path.commonpath([p, self.root]) != self.root or not os.path.exists(p):
+                raise ValueError(f"找不到檔案：{f}")
+            paths.append(p)
+        return paths
+
+    def matrix(self, files):
+        # 回傳 (files_key, spec, names)；來源檔案修改時間改變就重新載入並換掉共享區段
+        return self._entry(files)[:3]
+
+    def _entry(self, files):
+        paths = self._paths(files)
+        key = cache.files_key(paths)
+        entry = self._matrices.get(tuple(paths))
+        if entry is not None and entry[0] == key:
+            return entry
+        # 同一組檔案只載入一次（同時到達的請求等第一個載完）
+        with self._load_lock:
+            entry = self._matrices.get(tuple(paths))
+            if entry is not None and entry[0] == key:
+                return entry
+            with instrument.timer("service_load"):
+                frame = data.load_matrix(paths)
+                rets = data.rets_mat(frame)
+                dates = frame.index.to_numpy().astype("datetime64[D]").view(np.int64)
+                rets_shm, rets_spec = _share(rets)
+                dates_shm, dates_spec = _share(dates)
+            entry = (key, {"rets": rets_spec, "dates": dates_spec}, list(frame.columns),
+                     (rets_shm, dates_shm), (rets, dates))
+            with self._lock:
+                old = self._matrices.get(tuple(paths))
+                self._matrices[tuple(paths)] = entry
+                if old is not None:
+                    self._retired.extend(old[3])
+        return entry
+
+    def matrix_payload(self, files):
+        _, _, names, _, (rets, dates) = self._entry(files)
+        return {"names": names, "dates": dates.view("datetime64[D]").astype(str).tolist(), "rets": rets.tolist()}
+
+    # ---- 合併相同請求 + 背壓 ----
+    def submit(self, key, fn, *args):
+        # 已算過 -> 直接回傳；相同請求計算中 -> 共用 Future；佇列已滿 -> Busy
+        done = self.results.get(key)
+        if done is not None:
+            instrument.count("service_requests", outcome="cached")
+            return done
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                if self.pending >= self.max_pending:
+                    instrument.count("service_requests", outcome="rejected")
+                    raise Busy()
+                self.pending += 1
+                future = self.pool.submit(fn, *args)
+                self._inflight[key] = future
+                future.add_done_callback(lambda f, key=key: self._finish(key, f))
+                instrument.count("service_requests", outcome="computed")
+            else:
+                instrument.count("service_requests", outcome="coalesced")
+        return future.result()
+
+    def _finish(self, key, future):
+        # 先放進結果快取再移出計算中清單，中間到達的相同請求不會重算
+        if not future.cancelled() and future.exception() is None:
+            self.results.put(key, future.result())
+        with self._lock:
+            self._inflight.pop(key, None)
+            self.pending -= 1
+
+    def portfolio(self, files, weights, skip_first=True, risk_free_rate=RISK_FREE_RATE):
+        fkey, spec, _ = self.matrix(files)
+        q = cache.quantize(weights)
+        key = ("portfolio", fkey, q, skip_first, risk_free_rate)
+        return self.submit(key, _portfolio, spec, cache.dequantize(q).tolist(), skip_first, risk_free_rate)
+
+    def period(self, files, weights, start_year, end_year, risk_free_rate=RISK_FREE_RATE):
+        fkey, spec, _ = self.matrix(files)
+        q = cache.quantize(weights)
+        key = ("period", fkey, q, int(start_year), int(end_year), risk_free_rate)
+        return self.submit(key, _period, spec, cache.dequantize(q).tolist(), int(start_year), int(end_year),
+                           risk_free_rate)
+
+    def health(self):
+        with self._lock:
+            return {"status": "ok", "workers": self.workers, "pending": self.pending,
+                    "max_pending": self.max_pending, "matrices": len(self._matrices), **self.results.stats()}
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        with self._lock:
+            blocks = [shm for entry in self._matrices.values() for shm in entry[3]] + self._retired
+            self._matrices.clear()
+            self._retired = []
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def make_handler(service):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            # 存取紀錄改走 instrument 的結構化 log
+            pass
+
+        def _send(self, status, body, content_type="application/json", headers=None):
+            raw = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, service.health())
+            elif self.path == "/metrics":
+                text = instrument.registry.prometheus({"service_results": service.results})
+                self._send(200, text.encode("utf-8"), content_type="text/plain; version=0.0.4")
+            else:
+                self._send(404, {"error": f"未知的路徑：{self.path}"})
+
+        def do_POST(self):
+            routes = {
+                "/matrix": lambda p: service.matrix_payload(p["files"]),
+                "/portfolio": lambda p: service.portfolio(p["files"], p["weights"], p.get("skip_first", True),
+                                                          p.get("risk_free_rate", RISK_FREE_RATE)),
+                "/period": lambda p: service.period(p["files"], p["weights"], p["start_year"], p["end_year"],
+                                                    p.get("risk_free_rate", RISK_FREE_RATE)),
+            }
+            route = routes.get(self.path)
+            if route is None:
+                self._send(404, {"error": f"未知的路徑：{self.path}"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with instrument.timer(f"service{self.path.replace('/', '_')}"):
+                    body = route(payload)
+                self._send(200, body)
+            except Busy:
+                self._send(503, {"error": "服務忙碌中，請稍後再試"}, headers={"Retry-After": "1"})
+            except (KeyError, TypeError, ValueError) as e:
+                self._send(400, {"error": f"請求格式錯誤：{e}"})
+            except Exception as e:  # noqa: BLE001 - 計算錯誤回給客戶端，服務不中斷
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    # 預設 listen backlog 只有 5，多個 UI 工作階段同時送出時連線會被重置；忙碌與否交給 max_pending 判斷
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, root=".", workers=None, max_pending=None, preload=()):
+    service = Service(root, workers, max_pending)
+    for files in preload:
+        service.matrix(files)
+    server = _Server((host, port), make_handler(service))
+    return server, service
+
+
+# ---- 薄客戶端（UI_bias.py 使用）----
+
+class ServiceError(Exception):
+    pass
+
+
+class Client:
+
+    def __init__(self, url, timeout=30, retries=5):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+
+    def _post(self, path, payload):
+        body = json.dumps(payload).encode("utf-8")
+        for attempt in range(self.retries + 1):
+            req = urllib.request.Request(self.url + path, data=body, headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                    return json.loads(resp.read())
+            except urllib.error.HTTPError as e:
+                if e.code == 503 and attempt < self.retries:
+                    # 背壓：依 Retry-After 退避後重試
+                    time.sleep(float(e.headers.get("Retry-After", 1)) * (attempt + 1) / 2)
+                    continue
+                try:
+                    message = json.loads(e.read()).get("error", "")
+                except ValueError:
+                    message = ""
+                raise ServiceError(f"{path} 失敗（HTTP {e.code}）：{message}") from None
+            except urllib.error.URLError as e:
+                raise ServiceError(f"無法連線到計算服務 {self.url}：{e.reason}") from None
+
+    def matrix(self, files, names=None):
+        res = self._post("/matrix", {"files": list(files)})
+        return pd.DataFrame(np.array(res["rets"]).T, columns=list(names) if names is not None else res["names"],
+                            index=pd.DatetimeIndex(pd.to_datetime(res["dates"]), name="Date"))
+
+    def portfolio(self, files, weights, skip_first=True):
+        # 回傳 (逐日 DataFrame：Date / PortRet / Year / Cumulative Return, 逐年績效 DataFrame)
+        res = self._post("/portfolio", {"files": list(files), "weights": [float(w) for w in weights],
+                                        "skip_first": skip_first})
+        port = pd.DataFrame({"Date": pd.to_datetime(res["dates"]), "PortRet": res["port_ret"]})
+        port["Year"] = port["Date"].dt.year
+        port["Cumulative Return"] = res["cumulative"]
+        return port, pd.DataFrame(res["yearly"])
+
+    def period(self, files, weights, start_year, end_year):
+        # 回傳 (i_start, i_end, 區間績效 dict, 圖表 DataFrame：Date / CumRetRebased)
+        res = self._post("/period", {"files": list(files), "weights": [float(w) for w in weights],
+                                     "start_year": int(start_year), "end_year": int(end_year)})
+        chart = pd.DataFrame({"Date": pd.to_datetime(res["dates"]), "CumRetRebased": res["cumulative"]})
+        return res["start"], res["end"], res["metrics"], chart
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="組合分析計算服務（HTTP/JSON）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--root", default=".", help="允許讀取的資料目錄")
+    parser.add_argument("--workers", type=int, default=None, help="預設使用所有 CPU")
+    parser.add_argument("--max-pending", type=int, default=None, help="排隊中計算上限，預設 workers × 4")
+    parser.add_argument("--preload", nargs="*", default=["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"],
+                        help="啟動時先載入的檔案組合")
+    args = parser.parse_args()
+
+    server, service = serve(args.host, args.port, args.root, args.workers, args.max_pending,
+                            [args.preload] if args.preload else [])
+    print(f"http://{args.host}:{args.port}（{service.workers} 個工作行程）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
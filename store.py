@@ -0,0 +1,181 @@
+import json
+import os
+import sys
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import dates
+import instrument
+
+# 欄式價格儲存：每個資產存成三個 .npy（日期 int64 epoch 天數、Price float64、Dividend float64）
+# 檔名為 <資產>.<gen>.<欄位>.npy，gen 為寫入世代
+# 加上一份 manifest.json，讀取時直接 memory-map，不再逐次解析帶引號的字串 CSV
+STORE_DIRNAME = "store"
+MANIFEST = "manifest.json"
+COLUMNS = ("date", "price", "dividend")
+VERSION = 2
+
+# 同一行程內多執行緒（例如 update.py 同時更新多個代號）共用 manifest 時的讀改寫鎖
+_manifest_lock = threading.Lock()
+
+
+class PriceSeries(NamedTuple):
+    name: str
+    date: np.ndarray      # datetime64[D]，由 int64 epoch 天數零拷貝 view 而來
+    price: np.ndarray     # float64
+    dividend: np.ndarray  # float64，無配息為 0
+
+
+def default_store_dir(csv_path):
+    # 預設把 store/ 放在來源 CSV 旁邊
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), STORE_DIRNAME)
+
+
+def asset_name(csv_path):
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def read_manifest(store_dir):
+    path = os.path.join(store_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"version": VERSION, "assets": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != VERSION:
+        return {"version": VERSION, "assets": {}}
+    return manifest
+
+
+def _write_manifest(store_dir, manifest):
+    path = os.path.join(store_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def parse_csv(csv_path):
+    # adjust.py 輸出的格式：'2005年10月10日', '82.15', '0.672'
+    # 以單引號作為 quotechar，一次讀成欄位，不再逐欄 .str.replace
+    raw = pd.read_csv(csv_path, quotechar="'", skipinitialspace=True, dtype=str,
+                      encoding="utf-8")
+    date = dates.parse(raw["Date"].to_numpy())
+    price = pd.to_numeric(raw["Price"].str.replace(",", ""), errors="coerce")
+    dividend = pd.to_numeric(raw["Dividend"].str.replace(",", ""), errors="coerce").fillna(0.0)
+
+    days = date.astype(np.int64)
+    price = price.to_numpy(dtype=np.float64)
+    dividend = dividend.to_numpy(dtype=np.float64)
+
+    keep = ~np.isnan(price) & ~np.isnat(date)
+    days, price, dividend = days[keep], price[keep], dividend[keep]
+    order = np.argsort(days, kind="stable")
+    return days[order], price[order], dividend[order]
+
+
+def _array_path(store_dir, name, gen, col):
+    return os.path.join(store_dir, f"{name}.{gen}.{col}.npy")
+
+
+def write_arrays(store_dir, name, days, price, dividend, source=None, extra=None):
+    # 每次寫入產生新一代（gen）的檔案，最後以 os.replace 切換 manifest 指向新一代，
+    # 讀取端永遠看到同一代完整的三個欄位，不會讀到寫到一半的資料
+    os.makedirs(store_dir, exist_ok=True)
+    with _manifest_lock:
+        old = read_manifest(store_dir)["assets"].get(name)
+    gen = old.get("gen", 0) + 1 if old else 1
+
+    arrays = dict(zip(COLUMNS, (
+        np.ascontiguousarray(days, dtype=np.int64),
+        np.ascontiguousarray(price, dtype=np.float64),
+        np.ascontiguousarray(dividend, dtype=np.float64),
+    )))
+    for col, arr in arrays.items():
+        path = _array_path(store_dir, name, gen, col)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, path)
+
+    entry = {
+        "gen": gen,
+        "rows": int(len(days)),
+        "start": str(np.datetime64(int(days[0]), "D")) if len(days) else None,
+        "end": str(np.datetime64(int(days[-1]), "D")) if len(days) else None,
+    }
+    if source is not None:
+        entry["source"] = os.path.basename(source)
+        entry.update(_source_stamp(source))
+    if extra:
+        entry.update(extra)
+    with _manifest_lock:
+        manifest = read_manifest(store_dir)
+        manifest["assets"][name] = entry
+        _write_manifest(store_dir, manifest)
+
+    # 清掉舊一代；已 memory-map 的讀取端在 POSIX 上仍可繼續使用
+    if old:
+        for col in COLUMNS:
+            try:
+                os.remove(_array_path(store_dir, name, old.get("gen", 0), col))
+            except OSError:
+                pass
+    return entry
+
+
+def ingest(csv_path, store_dir=None):
+    store_dir = store_dir or default_store_dir(csv_path)
+    with instrument.timer("csv_parse", source=csv_path):
+        days, price, dividend = parse_csv(csv_path)
+    instrument.count("rows", len(days), stage="csv_parse")
+    return write_arrays(store_dir, asset_name(csv_path), days, price, dividend, source=csv_path)
+
+
+def is_fresh(csv_path, store_dir=None):
+    store_dir = store_dir or default_store_dir(csv_path)
+    entry = read_manifest(store_dir)["assets"].get(asset_name(csv_path))
+    if entry is None:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    stamp = _source_stamp(csv_path)
+    return entry.get("size") == stamp["size"] and entry.get("mtime_ns") == stamp["mtime_ns"]
+
+
+def load_name(name, store_dir, mmap=True):
+    mode = "r" if mmap else None
+    gen = read_manifest(store_dir)["assets"][name]["gen"]
+    cols = [np.load(_array_path(store_dir, name, gen, col), mmap_mode=mode) for col in COLUMNS]
+    return PriceSeries(name, cols[0].view("datetime64[D]"), cols[1], cols[2])
+
+
+def load(csv_path, store_dir=None, mmap=True):
+    # store 不存在或來源 CSV 有變動時自動重建；唯讀環境下退回記憶體內的解析結果
+    store_dir = store_dir or default_store_dir(csv_path)
+    name = asset_name(csv_path)
+    if not is_fresh(csv_path, store_dir):
+        try:
+            ingest(csv_path, store_dir)
+        except OSError:
+            with instrument.timer("csv_parse", source=csv_path):
+                days, price, dividend = parse_csv(csv_path)
+            instrument.count("rows", len(days), stage="csv_parse")
+            return PriceSeries(name, days.view("datetime64[D]"), price, dividend)
+    return load_name(name, store_dir, mmap=mmap)
+
+
+if __name__ == "__main__":
+    # python store.py [a_c.csv b_c.csv ...]；未指定時轉換目前目錄下所有 *_c.csv
+    paths = sys.argv[1:] or sorted(f for f in os.listdir(".") if f.endswith("_c.csv"))
+    for p in paths:
+        entry = ingest(p)
+        print(f"{p}: {entry['rows']} rows, {entry['start']} ~ {entry['end']}")
+    print("Done")
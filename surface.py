@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import data
+import grid
+import prefix
+import store
+
+# 預先計算的配置曲面：三資產 1% 網格（5151 組）× 所有 [起年, 迄年] 組合 × 4 項指標
+# 資料固定、滑桿解析度 0.01，UI 所有可能的答案是有限集合，離線算好存成 float32 .npy，
+# UI 以 memory-map 開啟，滑桿移動只是一次陣列索引
+# 檔案放在 store/ 底下（不進版控），附一份 JSON 記錄來源 CSV 的大小與修改時間，過期即不使用
+#
+#   python surface.py                      # 內附三檔 CSV，使用所有 CPU
+#   python surface.py a_c.csv b_c.csv c_c.csv --workers 4
+
+METRICS = ("cagr", "vol", "sharpe", "mdd")
+VERSION = 1
+
+
+def artifact_paths(paths, store_dir=None):
+    store_dir = store_dir or store.default_store_dir(paths[0])
+    stem = os.path.join(store_dir, "surface", "+".join(store.asset_name(p) for p in paths))
+    return stem + ".npy", stem + ".json"
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def year_pairs(years):
+    # 所有 起年 <= 迄年 的組合，依 (起年, 迄年) 排序
+    i, j = np.triu_indices(len(years))
+    return i, j
+
+
+def _build_chunk(npy_path, lo, weights, rets_mat, ii, jj, periods, risk_free_rate):
+    # 一批配置：前綴和一次算出所有區間的 CAGR / 波動 / 夏普，回撤則依起點分組做 running max
+    level = np.zeros((len(weights), rets_mat.shape[1] + 1))
+    port = weights @ rets_mat
+    sums = [np.zeros_like(level) for _ in range(2)]
+    np.cumsum(port, axis=1, out=sums[0][:, 1:])
+    np.cumsum(port * port, axis=1, out=sums[1][:, 1:])
+    np.cumsum(np.log1p(port, out=port), axis=1, out=level[:, 1:])
+
+    res = prefix.metrics_from_sums(jj - ii, level[:, jj] - level[:, ii], sums[0][:, jj] - sums[0][:, ii],
+                                   sums[1][:, jj] - sums[1][:, ii], periods, risk_free_rate)
+    out = np.empty((len(weights), len(ii), len(METRICS)), dtype=np.float32)
+    for k, name in enumerate(METRICS[:3]):
+        out[:, :, k] = res[name]
+    for start in np.unique(ii):
+        seg = level[:, start:]
+        dd = np.minimum.accumulate(seg - np.maximum.accumulate(seg, axis=1), axis=1)
+        cols = np.flatnonzero(ii == start)
+        out[:, cols, 3] = np.expm1(dd[:, jj[cols] - start])
+
+    arr = np.load(npy_path, mmap_mode="r+")
+    arr[lo:lo + len(weights)] = out
+    arr.flush()
+    return len(weights)
+
+
+def build(paths, store_dir=None, step=0.01, workers=None, chunk=256, periods=252, risk_free_rate=0.02):
+    frame = data.load_matrix(paths)
+    rets_mat = data.rets_mat(frame)
+    idx = prefix.PrefixIndex(np.zeros(len(frame)), frame.index.to_numpy(), periods)
+    pi, pj = year_pairs(idx.years)
+    ii = idx.year_start[pi]
+    jj = idx.year_start[pj + 1]
+    W = grid.simplex_grid(len(paths), step)
+
+    npy_path, meta_path = artifact_paths(paths, store_dir)
+    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+    tmp = npy_path + ".tmp.npy"
+    np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(W), len(ii), len(METRICS))).flush()
+
+    args = [(tmp, lo, W[lo:lo + chunk], rets_mat, ii, jj, periods, risk_free_rate)
+            for lo in range(0, len(W), chunk)]
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        for a in args:
+            _build_chunk(*a)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_build_chunk, *zip(*args)))
+    os.replace(tmp, npy_path)
+
+    meta = {
+        "version": VERSION,
+        "sources": {store.asset_name(p): _stamp(p) for p in paths},
+        "step": step,
+        "years": [int(y) for y in idx.years],
+        "metrics": list(METRICS),
+        "periods": periods,
+        "risk_free_rate": risk_free_rate,
+    }
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+    return npy_path
+
+
+class Surface:
+
+    def __init__(self, values, meta):
+        self.values = values
+        self.meta = meta
+        self.years = np.asarray(meta["years"])
+        self.m = int(round(1 / meta["step"]))
+        n_years = len(self.years)
+        # (起年位置, 迄年位置) -> 第幾個區間
+        self.pair_index = np.full((n_years, n_years), -1, dtype=np.int64)
+        pi, pj = year_pairs(self.years)
+        self.pair_index[pi, pj] = np.arange(len(pi))
+        # 前 N-1 個資產的權重（step 的整數倍）-> simplex_grid 的列
+        counts = np.rint(grid.simplex_grid(len(meta["sources"]), meta["step"]) * self.m)
+        self.row_index = np.full((self.m + 1,) * (counts.shape[1] - 1), -1, dtype=np.int64)
+        self.row_index[tuple(counts[:, :-1].astype(np.int64).T)] = np.arange(len(counts))
+
+    def covers(self, start_year, end_year):
+        return self.years[0] <= start_year <= end_year <= self.years[-1]
+
+    def lookup(self, weights, start_year, end_year):
+        q = np.rint(np.asarray(weights, dtype=np.float64) * self.m).astype(np.int64)
+        row = self.row_index[tuple(q[:-1])]
+        col = self.pair_index[np.searchsorted(self.years, start_year), np.searchsorted(self.years, end_year)]
+        return {name: float(v) for name, v in zip(self.meta["metrics"], self.values[row, col])}
+
+
+def open_surface(paths, store_dir=None):
+    # 開啟預先計算的曲面；檔案不存在、版本不符或來源 CSV 已更新時回傳 None
+    npy_path, meta_path = artifact_paths(paths, store_dir)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != VERSION:
+            return None
+        if meta["sources"] != {store.asset_name(p): _stamp(p) for p in paths}:
+            return None
+        return Surface(np.load(npy_path, mmap_mode="r"), meta)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="預先計算配置曲面")
+    parser.add_argument("files", nargs="*", default=["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"])
+    parser.add_argument("--workers", type=int, default=None, help="預設使用所有 CPU")
+    parser.add_argument("--step", type=float, default=0.01)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    path = build(args.files, step=args.step, workers=args.workers)
+    surf = open_surface(args.files)
+    print(f"{path}：{surf.values.shape}，{surf.values.nbytes / 2**20:.1f} MB，{time.perf_counter() - t0:.1f} 秒")
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import backtest
+
+# 分段向量化回測 vs 逐日迴圈（逐日更新持股金額，遇到再平衡日就調回目標權重）
+
+
+def _market(n_days=800, seed=0):
+    rng = np.random.default_rng(seed)
+    price_ret = rng.normal(0.0003, [[0.012], [0.004], [0.009]], (3, n_days))
+    # 每 21 天配一次息
+    div_yield = np.where(np.arange(n_days) % 21 == 20, rng.uniform(0.001, 0.004, (3, n_days)), 0.0)
+    dates = np.datetime64("2020-01-01") + np.arange(n_days)
+    return backtest.Market(price_ret, div_yield, dates)
+
+
+def _daily_loop(market, w, policy, band, cost, reinvest):
+    calendar = set(market.rebalance_points(policy)) if policy in ("monthly", "quarterly", "annual") else set()
+    held, cash = w.copy(), 0.0
+    value, n_rebalances = [1.0], 0
+    for t in range(market.n_days):
+        if reinvest:
+            held = held * (1 + market.total_ret[:, t])
+        else:
+            # 股息以前一天的持股金額計算，留在現金
+            cash += held @ market.div_yield[:, t]
+            held = held * (1 + market.price_ret[:, t])
+        total = held.sum() + cash
+        day = t + 1
+        due = policy == "daily" or day in calendar or (policy == "band" and np.abs(held / total - w).max() > band)
+        if due and day < market.n_days:
+            total -= cost * np.abs(w * total - held).sum()
+            held, cash = w * total, 0.0
+            n_rebalances += 1
+        value.append(total)
+    return np.array(value), n_rebalances
+
+
+@pytest.mark.parametrize("policy", ["buy_and_hold", "monthly", "quarterly", "annual", "band"])
+@pytest.mark.parametrize("reinvest", [True, False])
+def test_segments_match_daily_loop(policy, reinvest):
+    market = _market()
+    w = np.array([0.3, 0.2, 0.5])
+    res = backtest.backtest(market, w, policy=policy, band=0.03, cost=0.001, reinvest=reinvest, scan=50)
+    value, n_rebalances = _daily_loop(market, w, policy, 0.03, 0.001, reinvest)
+    np.testing.assert_allclose(res["value"], value, rtol=1e-10)
+    assert res["n_rebalances"] == n_rebalances
+
+
+def test_daily_matches_daily_loop():
+    market = _market(seed=1)
+    w = np.array([0.5, 0.25, 0.25])
+    res = backtest.backtest(market, w, policy="daily", cost=0.002)
+    value, _ = _daily_loop(market, w, "daily", 0.0, 0.002, True)
+    np.testing.assert_allclose(res["value"], value, rtol=1e-10)
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from bs4 import BeautifulSoup
+
+import crawl
+
+# 本機 http.server 模擬歷史價格頁：依路徑回傳預先排好的狀態碼序列（429／5xx 後成功），
+# 檢查 Fetcher 的退避重試、速率限制，以及只解析 <table> 與整頁解析結果一致
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "history.html")
+
+with open(FIXTURE, "r", encoding="utf-8") as f:
+    HTML = f.read()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits.append((self.path, time.monotonic()))
+            queue = server.script.get(self.path.split("?")[0], [])
+            status = queue.pop(0) if queue else 200
+        body = HTML.encode("utf-8") if status == 200 else b"busy"
+        self.send_response(status)
+        # 不宣告 charset，fetch_html 應以 utf-8 解碼
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.hits = []
+    srv.script = {}
+    srv.base_url = f"http://127.0.0.1:{srv.server_address[1]}"
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _times(srv, path):
+    return [t for p, t in srv.hits if p.split("?")[0] == path]
+
+
+def test_retries_with_backoff_then_succeeds(server):
+    server.script["/quote/TLT/history/"] = [429, 503, 500]
+    fetch = crawl.Fetcher(rate=None, retries=3, backoff=0.05)
+    html = fetch(crawl.build_url("TLT", 0, 86400, server.base_url))
+
+    assert crawl.parse_history(html) == crawl.parse_history(HTML)
+    times = _times(server, "/quote/TLT/history/")
+    assert len(times) == 4
+    # 第 k 次重試前至少等待 backoff * 2**k
+    for k, gap in enumerate(b - a for a, b in zip(times, times[1:])):
+        assert gap >= 0.05 * 2**k
+
+
+def test_gives_up_after_retries(server):
+    server.script["/quote/SPY/history/"] = [502] * 5
+    fetch = crawl.Fetcher(rate=None, retries=2, backoff=0.01)
+    with pytest.raises(requests.HTTPError) as err:
+        fetch(crawl.build_url("SPY", 0, 86400, server.base_url))
+    assert err.value.response.status_code == 502
+    assert len(_times(server, "/quote/SPY/history/")) == 3
+
+
+def test_client_error_is_not_retried(server):
+    server.script["/quote/QQQ/history/"] = [404]
+    fetch = crawl.Fetcher(rate=None, retries=3, backoff=0.01)
+    with pytest.raises(requests.HTTPError):
+        fetch(crawl.build_url("QQQ", 0, 86400, server.base_url))
+    assert len(_times(server, "/quote/QQQ/history/")) == 1
+
+
+def test_rate_limit_is_shared_across_threads(server):
+    rate, n = 20.0, 12
+    fetch = crawl.Fetcher(rate=rate, burst=1, retries=0, pool_size=4)
+    urls = {f"T{i}": crawl.build_url(f"T{i}", 0, 86400, server.base_url) for i in range(n)}
+    results = crawl.crawl_many(urls, fetch, workers=4)
+
+    assert all(rows == crawl.parse_history(HTML) for rows in results.values())
+    times = sorted(t for _, t in server.hits)
+    assert len(times) == n
+    # burst=1：n 次請求至少跨 (n - 1) / rate 秒，任意連續 5 次請求也不會擠在一起（保留伺服器端計時誤差）
+    assert times[-1] - times[0] >= (n - 1) / rate * 0.9
+    for i in range(n - 4):
+        assert times[i + 4] - times[i] >= 3 / rate * 0.9
+
+
+def test_rate_limiter_allows_burst():
+    limiter = crawl.RateLimiter(rate=10.0, burst=5)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.05
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_table_only_parse_matches_full_parse():
+    rows = crawl.parse_history(HTML)
+    soup = BeautifulSoup(HTML, "html.parser")
+    tbody = soup.select_one("table.table.noDl.hideOnPrint > tbody")
+    full = [[td.get_text(strip=True) for td in tr.find_all("td")] for tr in tbody.find_all("tr")]
+
+    assert rows == full
+    assert rows[0] == ["2025年5月21日", "85.80", "86.10", "85.10", "85.20", "85.20", "41,233,100"]
+    assert ["2025年5月16日", "0.305股息"] in rows
+
+
+def test_page_without_history_table():
+    assert crawl.parse_history("<html><body><p>沒有資料</p></body></html>") == []
@@ -0,0 +1,59 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dates
+
+# 向量化中文日期解析 vs pd.to_datetime 與手寫預期值
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_single_and_double_digit_month_day():
+    got = dates.parse(["2005年5月3日", "'2005年10月10日'", " '2019年1月31日'", "2020年12月9日"])
+    want = np.array(["2005-05-03", "2005-10-10", "2019-01-31", "2020-12-09"], dtype="datetime64[D]")
+    np.testing.assert_array_equal(got, want)
+
+
+def test_order_is_chronological_not_lexical():
+    raw = ["2005年10月10日", "2005年9月30日", "2005年10月9日", "2006年1月2日"]
+    # 字串排序會把 10 月排在 9 月之前、10 日排在 9 日之前
+    assert sorted(raw) != [raw[1], raw[2], raw[0], raw[3]]
+    order = np.argsort(dates.parse(raw), kind="stable")
+    assert [raw[i] for i in order] == [raw[1], raw[2], raw[0], raw[3]]
+
+
+@pytest.mark.parametrize("bad", ["2005年2月30日", "2005年13月1日", "2005年0月1日", "2005年4月31日",
+                                 "2005年1月32日", "2005-01-01", "abc", ""])
+def test_invalid_dates_become_nat(bad):
+    got = dates.parse(["2005年1月3日", bad])
+    assert got[0] == np.datetime64("2005-01-03")
+    assert np.isnat(got[1])
+
+
+def test_leap_day():
+    got = dates.parse(["2004年2月29日", "2005年2月29日"])
+    assert got[0] == np.datetime64("2004-02-29")
+    assert np.isnat(got[1])
+
+
+def test_empty_input():
+    got = dates.parse([])
+    assert got.dtype == np.dtype("datetime64[D]")
+    assert len(got) == 0
+    assert len(dates.to_days([])) == 0
+
+
+def test_format_round_trip():
+    raw = ["2005年5月3日", "2005年10月10日", "2024年2月29日"]
+    assert dates.format_days(dates.parse(raw)) == raw
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "*_c.csv"))))
+def test_matches_pandas_on_bundled_csv(path):
+    raw = pd.read_csv(path, quotechar="'", skipinitialspace=True, dtype=str, encoding="utf-8")["Date"]
+    want = pd.to_datetime(raw.str.strip("' "), format="%Y年%m月%d日").to_numpy().astype("datetime64[D]")
+    np.testing.assert_array_equal(dates.parse(raw.to_numpy()), want)
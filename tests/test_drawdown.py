@@ -0,0 +1,59 @@
+import numpy as np
+
+import drawdown
+
+# 排序 + 前綴最大值的持有期計算 vs 逐進場日往後掃描
+
+
+def _levels(seed=0):
+    rng = np.random.default_rng(seed)
+    level = np.cumsum(rng.normal(0.15, 1.0, (3, 400)), axis=1)
+    # 第三列四捨五入到整數，製造大量同值（同值不算跌破進場價）
+    level[2] = np.round(level[2])
+    level[:, 0] = 0.0
+    return level
+
+
+def test_holding_required_matches_scan():
+    level = _levels()
+    req = drawdown.holding_required(level)
+    for a in range(len(level)):
+        for i in range(level.shape[1]):
+            below = np.flatnonzero(level[a, i + 1:] < level[a, i])
+            assert req[a, i] == (below[-1] + 2 if len(below) else 0)
+
+
+def test_never_lose_days_is_the_shortest_safe_horizon():
+    level = _levels(seed=1)
+    never = drawdown.never_lose_days(level)
+    for a in range(len(level)):
+        n = never[a]
+        # 持有 n 天以上任何進場日都不虧；持有 n - 1 天至少有一個進場日虧損
+        for h in range(max(n, 1), level.shape[1]):
+            assert (level[a, h:] >= level[a, :-h]).all()
+        if n > 1:
+            assert (level[a, n - 1:] < level[a, :-(n - 1)]).any()
+
+
+def test_underwater_matches_scan():
+    level = _levels(seed=2)
+    under = drawdown.underwater(level)
+    for a in range(len(level)):
+        last_high = 0
+        for t in range(level.shape[1]):
+            if level[a, t] >= level[a, :t + 1].max():
+                last_high = t
+            assert under[a, t] == t - last_high
+
+
+def test_sweep_matches_single_allocation():
+    rng = np.random.default_rng(3)
+    rets = rng.normal(0.0003, [[0.01], [0.004], [0.012]], (3, 500))
+    dates = np.datetime64("2020-01-01") + np.arange(500)
+    weights = np.array([[1, 0, 0], [0.2, 0.5, 0.3], [0, 0, 1]])
+    res = drawdown.sweep(weights, rets, chunk=2)
+    for k, w in enumerate(weights):
+        single = drawdown.analyze(w @ rets, dates)
+        assert np.isclose(res["mdd"][k], single["mdd"])
+        assert res["never_lose_days"][k] == single["never_lose_days"]
+        assert res["max_underwater_days"][k] == single["max_underwater_days"]
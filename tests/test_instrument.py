@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import cache
+import instrument
+
+# Prometheus 文字格式：每個 metric family 只有一行 # TYPE，且其樣本緊接在後；
+# PORTFOLIO_LOG 無效時匯入不失敗
+
+
+def _family(sample):
+    name = sample.split("{")[0].split(" ")[0]
+    for suffix in ("_count", "_sum"):
+        if name.endswith(suffix) and name != "portfolio_stage_seconds_max":
+            return name[: -len(suffix)]
+    return name
+
+
+def test_prometheus_groups_samples_by_family():
+    reg = instrument.Registry()
+    with reg.timer("load"):
+        pass
+    reg.count("cache_calls", cache="load_matrix")
+    reg.count("cache_misses", cache="load_matrix")
+    reg.count("rows", 10, stage="load")
+    a, b = cache.LRUCache(4), cache.LRUCache(4)
+    a.get_or_compute(("k",), lambda: 1)
+    a.get_or_compute(("k",), lambda: 1)
+
+    lines = reg.prometheus({"portfolios": a, "results": b}).splitlines()
+    types = [line.split()[2] for line in lines if line.startswith("# TYPE")]
+    assert len(types) == len(set(types))
+
+    current, seen = None, set()
+    for line in lines:
+        if line.startswith("# TYPE"):
+            current = line.split()[2]
+            seen.add(current)
+        elif not line.startswith("#"):
+            assert _family(line) == current
+    # st.cache_data 的未命中與 LRUCache 的未命中在同一個 family
+    misses = lines[lines.index("# TYPE portfolio_cache_misses_total counter") + 1:][:3]
+    assert misses == ['portfolio_cache_misses_total{cache="load_matrix"} 1',
+                      'portfolio_cache_misses_total{cache="portfolios"} 1',
+                      'portfolio_cache_misses_total{cache="results"} 0']
+    assert 'portfolio_cache_hits_total{cache="portfolios"} 1' in lines
+
+
+@pytest.mark.parametrize("value, level", [("debug", "DEBUG"), ("verbose", "INFO"), ("5", "INFO")])
+def test_log_level_from_environment(value, level):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PORTFOLIO_LOG=value)
+    out = subprocess.run(
+        [sys.executable, "-c", "import logging, instrument; print(logging.getLevelName(instrument.log.level))"],
+        cwd=root, env=env, capture_output=True, text=True, check=True,
+    )
+    assert out.stdout.strip() == level
+    assert ("invalid PORTFOLIO_LOG" in out.stderr) == (level != value.upper())
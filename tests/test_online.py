@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+import analytics
+import online
+
+# Welford / Chan 合併的線上統計 vs 一次對全部資料計算（np.var、逐日累積）
+
+
+def _rets(n=500, seed=0):
+    return np.random.default_rng(seed).normal(0.0004, [0.01, 0.004, 0.012], (n, 3))
+
+
+def test_push_and_batches_match_numpy():
+    rets = _rets()
+    stats = online.RunningStats(3)
+    for r in rets[:7]:
+        stats.push(r)
+    # 長短不一的批次，包含空批次
+    for lo, hi in [(7, 7), (7, 40), (40, 41), (41, 300), (300, 500)]:
+        stats.push_batch(rets[lo:hi])
+
+    assert stats.n == len(rets)
+    np.testing.assert_allclose(stats.mean, rets.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(stats.m2 / (stats.n - 1), np.var(rets, axis=0, ddof=1), rtol=1e-10)
+    level = np.vstack([np.zeros(3), np.cumsum(np.log1p(rets), axis=0)])
+    np.testing.assert_allclose(stats.log, level[-1], rtol=1e-12)
+    np.testing.assert_allclose(stats.mdd, (level - np.maximum.accumulate(level, axis=0)).min(axis=0), rtol=1e-12)
+
+
+def test_merge_first_matches_numpy():
+    rets = _rets(seed=1)
+    stats = online.RunningStats(3)
+    stats.push_batch(rets[1:])
+    n, log, m2 = stats.merge_first(rets[0])
+    assert n == len(rets)
+    np.testing.assert_allclose(m2 / (n - 1), np.var(rets, axis=0, ddof=1), rtol=1e-10)
+    np.testing.assert_allclose(log, np.log1p(rets).sum(axis=0), rtol=1e-12)
+
+
+def test_year_table_matches_batch_metrics():
+    rets = _rets(n=900, seed=2)
+    frame = pd.DataFrame(rets, index=pd.bdate_range("2019-03-01", periods=len(rets), name="Date"),
+                         columns=["a", "b", "c"])
+    weights = [0.3, 0.3, 0.4]
+    acc = online.OnlineMetrics(weights, frame.columns)
+    for lo in range(0, len(frame), 37):
+        acc.update_batch(rets[lo:lo + 37], frame.index.to_numpy()[lo:lo + 37])
+
+    _, idx = analytics.portfolio(frame, weights)
+    for skip_first in (False, True):
+        batch = analytics.yearly_metrics(idx, skip_first=skip_first)
+        table = acc.year_table(skip_first=skip_first)
+        np.testing.assert_array_equal(table["year"], batch["year"])
+        np.testing.assert_allclose(table[["cagr", "vol"]], batch[["cagr", "vol"]], rtol=1e-9)
@@ -0,0 +1,62 @@
+import numpy as np
+
+import grid
+import optimize
+
+# KKT 枚舉的精確解 vs 細網格（0.5%）窮舉；投影梯度 vs 精確解
+
+
+def _moments(n_assets=3, k=4, seed=0):
+    rng = np.random.default_rng(seed)
+    rets = rng.normal(0.0004, 0.01, (n_assets, 252 * k)) * rng.uniform(0.3, 1.5, (n_assets, 1))
+    rets += rng.normal(0.0, 0.006, 252 * k)          # 共同因子，讓資產相關
+    return optimize.moments(rets, [(252 * i, 252 * (i + 1)) for i in range(k)])
+
+
+def _grid_stats(mu, cov):
+    W = grid.simplex_grid(mu.shape[1], 0.005)
+    ret = mu @ W.T
+    vol = np.sqrt(np.einsum("pi,kij,pj->kp", W, cov, W))
+    return W, ret, vol
+
+
+def test_min_variance_beats_fine_grid():
+    mu, cov = _moments()
+    w = optimize.min_variance(mu, cov)
+    W, _, vol = _grid_stats(mu, cov)
+    np.testing.assert_allclose(w.sum(axis=1), 1.0)
+    assert (w >= 0).all()
+    assert (optimize._vol(w, cov) <= vol.min(axis=1) + 1e-12).all()
+    np.testing.assert_allclose(w, W[vol.argmin(axis=1)], atol=0.01)
+
+
+def test_max_sharpe_beats_fine_grid():
+    mu, cov = _moments(seed=1)
+    w = optimize.max_sharpe(mu, cov, risk_free_rate=0.02)
+    _, ret, vol = _grid_stats(mu, cov)
+    sharpe = ((w * mu).sum(axis=1) - 0.02) / optimize._vol(w, cov)
+    assert (sharpe >= ((ret - 0.02) / vol).max(axis=1) - 1e-9).all()
+
+
+def test_target_vol_beats_fine_grid():
+    mu, cov = _moments(seed=2)
+    _, ret, vol = _grid_stats(mu, cov)
+    target = np.sqrt(vol.min(axis=1) * vol.max(axis=1))   # 介於最低與最高波動之間
+    w = optimize.target_vol(mu, cov, target)
+    assert (optimize._vol(w, cov) <= target + 1e-6).all()
+    best = np.where(vol <= target[:, None], ret, -np.inf).max(axis=1)
+    assert ((w * mu).sum(axis=1) >= best - 1e-6).all()
+
+
+def test_risk_parity_equalizes_contributions():
+    _, cov = _moments(n_assets=4, seed=3)
+    w = optimize.risk_parity(cov)
+    contrib = w * np.einsum("kij,kj->ki", cov, w)
+    np.testing.assert_allclose(contrib / contrib.sum(axis=1, keepdims=True), 0.25, atol=1e-8)
+
+
+def test_projected_gradient_matches_exact():
+    mu, cov = _moments(n_assets=5, seed=4)
+    exact = optimize.solve_qp(cov, 3 * mu)
+    pg = optimize.solve_simplex_pg(cov, 3 * mu, iters=5000)
+    np.testing.assert_allclose(pg, exact, atol=1e-5)
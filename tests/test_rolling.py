@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import rolling
+
+# 前綴和 / 區塊掃描的滾動指標 vs 逐視窗直接計算
+
+
+def _rets(n=300, seed=0):
+    return np.random.default_rng(seed).normal(0.0003, [[0.01], [0.005], [0.012]], (3, n))
+
+
+@pytest.mark.parametrize("w", [2, 5, 21, 64])
+def test_metrics_match_window_loop(w):
+    rets = _rets()
+    roll = rolling.Rolling(rets)
+    ret, vol, sharpe, mdd = roll.ret(w), roll.vol(w), roll.sharpe(w), roll.mdd(w)
+    assert np.isnan(ret[:, :w - 1]).all() and np.isnan(mdd[:, :w - 1]).all()
+    for t in range(w - 1, rets.shape[1]):
+        x = rets[:, t - w + 1:t + 1]
+        # 視窗起點（財富 1）也算一個高點
+        level = np.hstack([np.zeros((3, 1)), np.cumsum(np.log1p(x), axis=1)])
+        exp_ret = np.expm1(level[:, -1] * 252 / w)
+        exp_vol = x.std(axis=1, ddof=1) * np.sqrt(252)
+        np.testing.assert_allclose(ret[:, t], exp_ret, rtol=1e-9)
+        np.testing.assert_allclose(vol[:, t], exp_vol, rtol=1e-7)
+        np.testing.assert_allclose(sharpe[:, t], (exp_ret - 0.02) / exp_vol, rtol=1e-7)
+        np.testing.assert_allclose(mdd[:, t], np.expm1((level - np.maximum.accumulate(level, axis=1)).min(axis=1)),
+                                   rtol=1e-9, atol=1e-15)
+
+
+@pytest.mark.parametrize("w", [5, 63])
+def test_corr_matches_window_loop(w):
+    rets = _rets(seed=1)
+    rho = rolling.Rolling(rets).corr(w)
+    assert np.isnan(rho[:w - 1]).all()
+    for t in range(w - 1, rets.shape[1]):
+        np.testing.assert_allclose(rho[t], np.corrcoef(rets[:, t - w + 1:t + 1]), atol=1e-9)
+
+
+def test_window_drawdown_matches_scan():
+    level = np.cumsum(np.random.default_rng(2).normal(0, 1, (2, 103)), axis=1)
+    for m in (1, 2, 7, 10, 103):
+        dd = rolling.window_drawdown(level, m)
+        for s in range(level.shape[1] - m + 1):
+            x = level[:, s:s + m]
+            np.testing.assert_allclose(dd[:, s], (np.maximum.accumulate(x, axis=1) - x).max(axis=1))
@@ -0,0 +1,67 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import search
+
+# 初篩 + 候選池整個權重網格精算 vs 所有組合 × 所有權重的窮舉；報酬為厚尾的 t 分布（非常態）
+
+
+def _universe(seed=4, n_assets=14, n_days=1000):
+    rng = np.random.default_rng(seed)
+    rets = 0.0004 + 0.005 * rng.standard_t(2.5, (n_days, n_assets)) * rng.uniform(0.3, 1.2, n_assets)
+    rets += 0.004 * rng.standard_t(2.5, (n_days, 1))
+    return pd.DataFrame(rets, columns=[f"a{i}" for i in range(n_assets)],
+                        index=pd.bdate_range("2015-01-01", periods=n_days))
+
+
+def _brute(frame, objective, vol_cap=None, min_cagr=None):
+    # 每個組合在網格上最好的 (分數, 權重)，依分數排序
+    rets = frame.to_numpy().T
+    rows = []
+    for k in (2, 3):
+        W = search.weight_grid(k, 0.05)
+        for c in combinations(range(rets.shape[0]), k):
+            score = search._score(objective, *search.exact_metrics(W @ rets[list(c)]),
+                                  vol_cap=vol_cap, min_cagr=min_cagr)
+            b = score.argmax()
+            if np.isfinite(score[b]):
+                rows.append({"assets": " + ".join(frame.columns[list(c)]),
+                             "weights": " / ".join(f"{w:.0%}" for w in W[b]), "score": score[b]})
+    return pd.DataFrame(rows).sort_values("score", ascending=False, ignore_index=True)
+
+
+# seed 3 / 6：初篩估計最好的權重不是實際最好的權重（只精算單一權重時會排錯名次）
+@pytest.mark.parametrize("objective, limits, seed", [
+    ("sharpe", {}, 3), ("sharpe", {}, 6), ("cagr", {"vol_cap": 0.20}, 3)])
+def test_matches_brute_force_on_fat_tails(objective, limits, seed):
+    frame = _universe(seed)
+    found = search.search(frame, objective, top=3, workers=1, **limits)
+    expected = _brute(frame, objective, **limits).head(3)
+    assert found["assets"].tolist() == expected["assets"].tolist()
+    assert found["weights"].tolist() == expected["weights"].tolist()
+    np.testing.assert_allclose(found["score"], expected["score"], rtol=1e-12)
+
+
+def test_mdd_refines_every_weight_of_each_candidate():
+    # mdd 的初篩（最低波動）可能漏掉組合，但池內每個組合都取到網格上真正最好的權重；
+    # 候選池涵蓋所有組合時即與窮舉相同
+    frame = _universe(seed=5)
+    expected = _brute(frame, "mdd", min_cagr=0.02).set_index("assets")
+    found = search.search(frame, "mdd", top=3, min_cagr=0.02, workers=1)
+    for _, row in found.iterrows():
+        assert row["weights"] == expected.loc[row["assets"], "weights"]
+        assert np.isclose(row["score"], expected.loc[row["assets"], "score"])
+
+    n_combo, _ = search.n_combinations(frame.shape[1])
+    full = search.search(frame, "mdd", top=3, min_cagr=0.02, workers=1, oversample=n_combo)
+    assert full["assets"].tolist() == expected.index[:3].tolist()
+
+
+def test_workers_do_not_change_results():
+    frame = _universe(seed=6)
+    one = search.search(frame, "sharpe", top=5, workers=1)
+    many = search.search(frame, "sharpe", top=5, workers=2)
+    pd.testing.assert_frame_equal(one, many)
@@ -0,0 +1,51 @@
+import numpy as np
+
+import simulate
+
+# 區塊摘要與逐區塊合併 vs 逐日拼出的路徑；同一 seed 在不同 worker 數下結果相同
+
+
+def _returns(n, seed=0):
+    return np.random.default_rng(seed).normal(0.0004, 0.01, n)
+
+
+def test_block_summaries_match_direct_scan():
+    r, block = _returns(50), 7
+    G, M, m, D = simulate.block_summaries(r, block)
+    for s in range(len(r)):
+        # 循環式區塊，含起點 0 的 log 財富
+        level = np.r_[0.0, np.cumsum(np.log1p(r[(s + np.arange(block)) % len(r)]))]
+        assert np.isclose(G[s], level[-1])
+        assert np.isclose(M[s], level.max())
+        assert np.isclose(m[s], level[1:].min())
+        assert np.isclose(D[s], (np.maximum.accumulate(level) - level).max())
+
+
+def test_chunk_matches_daily_paths():
+    r = _returns(200, seed=1)
+    block, horizon, band_blocks, n_paths = 10, 95, 2, 30
+    tables = (simulate.block_summaries(r, block), simulate.block_summaries(r, horizon % block))
+    seed = np.random.SeedSequence(1)
+    terminal, mdd, bands = simulate._simulate_chunk(tables, len(r), n_paths, horizon, block, band_blocks, seed)
+
+    # 以相同亂數重抽區塊起點，逐日拼出路徑（最後一個區塊截短）
+    n_blocks = -(-horizon // block)
+    starts = np.random.default_rng(seed).integers(0, len(r), size=(n_paths, n_blocks))
+    band_days = np.minimum(np.arange(1, bands.shape[1] + 1) * band_blocks * block, horizon)
+    for p in range(n_paths):
+        days = np.concatenate([(s + np.arange(block)) % len(r) for s in starts[p]])[:horizon]
+        wealth = np.r_[1.0, np.cumprod(1 + r[days])]
+        assert np.isclose(terminal[p], wealth[-1])
+        assert np.isclose(mdd[p], (wealth / np.maximum.accumulate(wealth) - 1).min())
+        np.testing.assert_allclose(bands[p], wealth[band_days], rtol=1e-6)
+
+
+def test_results_independent_of_workers():
+    rets = np.random.default_rng(2).normal(0.0003, 0.01, (3, 600))
+    kw = dict(n_paths=3000, horizon=252, block=21, seed=7, memory_cap=2**18)
+    # 記憶體上限小到會切成多批，才測得到批次切法
+    assert len(simulate._chunk_sizes(kw["n_paths"], 12, kw["memory_cap"])) > 1
+    one = simulate.simulate(rets, [0.3, 0.3, 0.4], workers=1, **kw)
+    many = simulate.simulate(rets, [0.3, 0.3, 0.4], workers=3, **kw)
+    for key in ("terminal", "mdd", "bands", "loss_prob"):
+        np.testing.assert_array_equal(one[key], many[key])
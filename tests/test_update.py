@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+
+import dates
+import store
+import update
+
+# 以存下來的 HTML 頁面（fetch= 掛鉤）增量更新暫存 CSV 與 store，
+# 結果與整份 CSV 重新 ingest 比對
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "history.html")
+
+EXISTING = (
+    "Date,Price,Dividend\n"
+    "'2025年4月30日', '88.99',\n"
+    "'2025年5月1日', '89.20', '0.298'\n"
+    "'2025年5月13日', '86.40',\n"
+    "'2025年5月14日', '86.00',\n"
+)
+NOW = 1750000000  # 2025/06/15
+
+
+def _fetch(urls):
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        html = f.read()
+
+    def fetch(url):
+        urls.append(url)
+        return html
+    return fetch
+
+
+def _setup(tmp_path, content=EXISTING):
+    csv_path = str(tmp_path / "tlt_c.csv")
+    if content is not None:
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return csv_path, str(tmp_path / "store")
+
+
+def _assert_store_matches_reingest(csv_path, store_dir, tmp_path):
+    assert store.is_fresh(csv_path, store_dir)
+    got = store.load_name(store.asset_name(csv_path), store_dir, mmap=False)
+    ref_dir = str(tmp_path / "ref")
+    store.ingest(csv_path, ref_dir)
+    ref = store.load_name(store.asset_name(csv_path), ref_dir, mmap=False)
+    np.testing.assert_array_equal(got.date, ref.date)
+    np.testing.assert_array_equal(got.price, ref.price)
+    np.testing.assert_array_equal(got.dividend, ref.dividend)
+    return got
+
+
+def test_update_appends_only_new_rows(tmp_path):
+    csv_path, store_dir = _setup(tmp_path)
+    urls = []
+    added = update.update("TLT", csv_path, store_dir, fetch=_fetch(urls), now=NOW)
+
+    # 5/13、5/14 已存在；5/19 無價格略過；沒有價格的股息列（5/1）不新增
+    assert added == 4
+    assert len(urls) == 1
+    last = dates.to_days(["2025年5月14日"])[0]
+    assert f"period1={(last + 1) * update.DAY}" in urls[0]
+    assert f"period2={NOW}" in urls[0]
+
+    with open(csv_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    assert content.startswith(EXISTING)
+    assert content[len(EXISTING):] == (
+        "'2025年5月15日', '86.20',\n"
+        "'2025年5月16日', '86.45', '0.305'\n"
+        "'2025年5月20日', '85.90',\n"
+        "'2025年5月21日', '85.20',\n"
+    )
+
+    got = _assert_store_matches_reingest(csv_path, store_dir, tmp_path)
+    assert len(got.date) == 8
+    assert got.date[-1] == np.datetime64("2025-05-21")
+    # 同一天的價格列與股息列合併成一列
+    i = int(np.flatnonzero(got.date == np.datetime64("2025-05-16"))[0])
+    assert got.price[i] == 86.45 and got.dividend[i] == 0.305
+    assert got.dividend[got.date == np.datetime64("2025-05-01")][0] == 0.298
+
+
+def test_rerun_adds_nothing(tmp_path):
+    csv_path, store_dir = _setup(tmp_path)
+    update.update("TLT", csv_path, store_dir, fetch=_fetch([]), now=NOW)
+    with open(csv_path, "rb") as f:
+        before = f.read()
+    manifest = store.read_manifest(store_dir)
+
+    assert update.update("TLT", csv_path, store_dir, fetch=_fetch([]), now=NOW) == 0
+    with open(csv_path, "rb") as f:
+        assert f.read() == before
+    assert store.read_manifest(store_dir) == manifest
+
+
+def test_missing_csv_is_created(tmp_path):
+    csv_path, store_dir = _setup(tmp_path, content=None)
+    urls = []
+    added = update.update("TLT", csv_path, store_dir, fetch=_fetch(urls), now=NOW)
+
+    assert added == 7
+    assert f"period1={update.DAY}&" in urls[0]
+    with open(csv_path, "r", encoding="utf-8") as f:
+        assert f.readline() == update.CSV_HEADER
+    got = _assert_store_matches_reingest(csv_path, store_dir, tmp_path)
+    assert got.date[0] == np.datetime64("2025-04-30")
+    assert got.date[-1] == np.datetime64("2025-05-21")
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import prefix
+import withdrawal
+
+# 一次 cumsum 得到的最大提領率 vs 逐次提領的直接模擬
+
+
+def _level(n_assets=2, n_days=1600, seed=0):
+    rets = np.random.default_rng(seed).normal(0.0003, 0.01, (n_assets, n_days))
+    return prefix.log_wealth(rets)
+
+
+def _survives(level, s, rate, years, rule, every, inflation=0.03):
+    # 期初資金 1，每 every 天期初提領；任何一次提領後資金 <= 0 即失敗
+    m = withdrawal.n_withdrawals(years, every)
+    amounts = rate * withdrawal.shape(rule, m, every, inflation=inflation)
+    wealth = 1.0
+    for j in range(m):
+        t = s + every * j
+        if j:
+            wealth *= np.exp(level[t] - level[t - every])
+        wealth -= amounts[j]
+        if wealth <= 0:
+            return False
+    return True
+
+
+@pytest.mark.parametrize("rule", ["fixed", "inflation"])
+@pytest.mark.parametrize("every", [21, 63])
+def test_max_rate_is_the_survival_boundary(rule, every):
+    level = _level()
+    s, rates = withdrawal.max_rates(level, 5, rule, every, stride=97)
+    assert len(s) > 3
+    for a in range(len(level)):
+        for k, start in enumerate(s):
+            rate = rates[a, k]
+            assert _survives(level[a], start, rate * (1 - 1e-9), 5, rule, every)
+            assert not _survives(level[a], start, rate * (1 + 1e-6), 5, rule, every)
+
+
+def test_horizons_match_single_horizon():
+    level = _level(seed=1)
+    res = withdrawal.max_rates_by_horizon(level, [1, 3, 5], "inflation", stride=5)
+    for h, (s, rates) in res.items():
+        s_one, rates_one = withdrawal.max_rates(level, h, "inflation", stride=5)
+        np.testing.assert_array_equal(s, s_one)
+        np.testing.assert_allclose(rates, rates_one, rtol=1e-12)
+
+
+def test_percent_paths_match_loop():
+    level = _level(seed=2)
+    rate, years, every = 0.05, 3, 21
+    s, final, floor = withdrawal.percent_paths(level, rate, years, every, stride=50)
+    m = withdrawal.n_withdrawals(years, every)
+    for a in range(len(level)):
+        for k, start in enumerate(s):
+            wealth, amounts = 1.0, []
+            for j in range(m):
+                t = start + every * j
+                if j:
+                    wealth *= np.exp(level[a, t] - level[a, t - every])
+                amounts.append(wealth * rate * every / 252)
+                wealth -= amounts[-1]
+            wealth *= np.exp(level[a, start + years * 252] - level[a, start + every * (m - 1)])
+            assert np.isclose(final[a, k], wealth)
+            assert np.isclose(floor[a, k] * amounts[0], min(amounts))
@@ -0,0 +1,133 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import crawl
+import dates
+import store
+
+# 增量更新：只抓 store 中最後一天之後的資料，解析後與既有資料合併，一次寫回
+# 資料檔（*_c.csv）與欄式 store 都先寫暫存檔再 os.replace，中途失敗不會留下半套資料
+
+DAY = 86400
+CSV_HEADER = "Date,Price,Dividend\n"
+
+
+def merge_rows(rows):
+    # 一次走訪同時合併價格列與股息列（對應 adjust.py 的 data_map 邏輯）
+    # 回傳依日期排序的 (dates[str], days[int64], price, dividend)
+    data_map = {}
+    for cols in rows:
+        if not cols:
+            continue
+        if len(cols) > 5:
+            price = cols[5].replace(",", "")
+            try:
+                data_map.setdefault(cols[0], {})["price"] = float(price)
+            except ValueError:
+                continue
+        elif len(cols) == 2 and "股息" in cols[1]:
+            dividend = cols[1].replace("股息", "").replace(",", "")
+            try:
+                data_map.setdefault(cols[0], {})["dividend"] = float(dividend)
+            except ValueError:
+                continue
+
+    labels = [d for d, e in data_map.items() if "price" in e]
+    if not labels:
+        return [], np.empty(0, np.int64), np.empty(0), np.empty(0)
+    parsed = dates.parse(labels)
+    labels = [d for d, ok in zip(labels, ~np.isnat(parsed)) if ok]
+    days = parsed[~np.isnat(parsed)].astype(np.int64)
+    price = np.array([data_map[d]["price"] for d in labels])
+    dividend = np.array([data_map[d].get("dividend", 0.0) for d in labels])
+    order = np.argsort(days, kind="stable")
+    return [labels[i] for i in order], days[order], price[order], dividend[order]
+
+
+def format_rows(labels, price, dividend):
+    # 與 adjust.py 輸出一致：'2025年5月19日', '562.10', '0.672'（無股息則留空）
+    lines = []
+    for d, p, v in zip(labels, price, dividend):
+        div = f" '{v:g}'" if v else ""
+        lines.append(f"'{d}', '{p:.2f}',{div}\n")
+    return "".join(lines)
+
+
+def _append_atomic(path, text):
+    # CSV 不存在時（第一次抓取的代號）先寫入表頭
+    content = CSV_HEADER
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as fin:
+            content = fin.read()
+    if content and not content.endswith("\n"):
+        content += "\n"
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fout:
+        fout.write(content + text)
+    os.replace(tmp, path)
+
+
+def update(ticker, csv_path, store_dir=None, fetch=None, base_url=crawl.BASE_URL, now=None):
+    # 回傳新增的交易日數；fetch(url) -> html 可替換成讀取本機檔案或測試用 HTTP 伺服器
+    store_dir = store_dir or store.default_store_dir(csv_path)
+    if os.path.exists(csv_path):
+        series = store.load(csv_path, store_dir, mmap=False)
+    else:
+        # 尚無資料檔：從頭抓取，last_day = 0
+        empty = np.empty(0)
+        series = store.PriceSeries(store.asset_name(csv_path), empty.astype("datetime64[D]"), empty, empty)
+    last_day = int(series.date[-1].astype(np.int64)) if len(series.date) else 0
+
+    period1 = (last_day + 1) * DAY
+    period2 = int(now if now is not None else time.time())
+    if period1 > period2:
+        return 0
+    html = (fetch or crawl.fetch_html)(crawl.build_url(ticker, period1, period2, base_url))
+    labels, days, price, dividend = merge_rows(crawl.parse_history(html))
+    new = days > last_day
+    if not new.any():
+        return 0
+    labels = [d for d, keep in zip(labels, new) if keep]
+    days, price, dividend = days[new], price[new], dividend[new]
+
+    _append_atomic(csv_path, format_rows(labels, price, dividend))
+    store.write_arrays(
+        store_dir, series.name,
+        np.concatenate([series.date.astype(np.int64), days]),
+        np.concatenate([series.price, price]),
+        np.concatenate([series.dividend, dividend]),
+        source=csv_path,
+    )
+    return int(new.sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="增量更新 *_c.csv 與欄式 store")
+    parser.add_argument("tickers", nargs="*", default=list(crawl.TICKERS), help="預設更新 crawl.TICKERS 全部")
+    parser.add_argument("--base-url", default=crawl.BASE_URL, help="可指向本機測試伺服器")
+    parser.add_argument("--html", help="改從本機 HTML 檔解析（離線測試用，只適用單一代號）")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=5.0, help="每秒最多請求數")
+    args = parser.parse_args()
+
+    if args.html:
+        with open(args.html, "r", encoding="utf-8") as f:
+            html = f.read()
+        fetch = lambda url: html
+    else:
+        # 多個代號共用同一個連線池與速率限制，同時更新
+        fetch = crawl.Fetcher(rate=args.rate, pool_size=args.workers)
+
+    def run(ticker):
+        try:
+            return update(ticker, crawl.TICKERS[ticker], fetch=fetch, base_url=args.base_url)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for ticker, added in zip(args.tickers, pool.map(run, args.tickers)):
+            print(f"{ticker}: 失敗 {added}" if isinstance(added, Exception) else f"{ticker}: +{added} rows")
+    print("Done")
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+import prefix
+
+# 退休提領模擬：每一個進場日 × 每一種持有年數一次批次計算，不逐進場日跑迴圈
+# 期初資金 1，第 s 天開始，每 every 個交易日的期初提領一次（第 j 次在 t_j = s + j·every）
+# 以 log 財富 L 表示，D_j = exp(L_s - L_{t_j}) 是第 j 次提領折回起點的「現值」
+# 第 k 次提領後資金仍為正  <=>  Σ_{j<=k} a_j · D_j < 1
+# 提領金額為「年提領率 × 形狀 c_j」時，該進場日撐過前 k 次提領的最大年提領率為
+#     1 / max_{k'<=k} Σ_{j<=k'} c_j · D_j
+# 一次 cumsum + running max 就得到所有持有年數的答案，任何提領率的成功率只是一個比較
+# 規則：
+# - fixed：每期提領固定金額（期初資金的 rate / 年）
+# - inflation：固定金額每年依通膨調升
+# - percent：每期提領當時資金的固定比例，永不耗盡，改看最低提領金額與期末資金
+
+RULES = ("fixed", "inflation", "percent")
+EVERY = {21: "每月", 63: "每季", 252: "每年"}
+
+
+def n_withdrawals(years, every=21, periods=252):
+    return max(int(round(years * periods / every)), 1)
+
+
+def shape(rule, m, every=21, periods=252, inflation=0.03):
+    # 每單位年提領率在第 j 次的提領金額 c_j（以期初資金為 1）
+    per = every / periods
+    if rule == "fixed":
+        return np.full(m, per)
+    if rule == "inflation":
+        return per * (1 + inflation) ** (np.arange(m) * per)
+    raise ValueError(f"{rule} 規則沒有固定金額形狀，請用 percent_paths")
+
+
+def starts(n_days, years, periods=252, stride=1):
+    # 資料足以觀察完整持有期的進場點（log 財富的時間點）
+    last = n_days - int(round(years * periods))
+    return np.arange(0, last + 1, stride) if last >= 0 else np.arange(0)
+
+
+def _discount(level, s, m, every):
+    # level 為 (A × P)；回傳 (A × S × m) 的 D_j；超出資料範圍者為 NaN
+    t = s[:, None] + every * np.arange(m)
+    valid = t < level.shape[1]
+    d = np.exp(level[:, s][:, :, None] - level[:, np.minimum(t, level.shape[1] - 1)])
+    return np.where(valid, d, np.nan)
+
+
+def max_rates(level, years, rule="fixed", every=21, periods=252, inflation=0.03, stride=1):
+    # 每個進場日可持續的最大年提領率；level 為 (A × P) log 財富
+    # 回傳 (進場點, (A × S) 的最大提領率)
+    level = np.atleast_2d(level)
+    m = n_withdrawals(years, every, periods)
+    s = starts(level.shape[1] - 1, years, periods, stride)
+    if len(s) == 0:
+        return s, np.empty((len(level), 0))
+    pv = np.cumsum(_discount(level, s, m, every) * shape(rule, m, every, periods, inflation), axis=2)
+    return s, 1.0 / pv.max(axis=2)
+
+
+def max_rates_by_horizon(level, horizons, rule="fixed", every=21, periods=252, inflation=0.03, stride=1):
+    # 所有持有年數一次算完：running max 的第 m_h - 1 欄即為持有 h 年的答案
+    # 回傳 {h: (進場點, (A × S_h))}；資料不足以觀察完整 h 年的進場點不列入
+    level = np.atleast_2d(level)
+    n_days = level.shape[1] - 1
+    m_max = n_withdrawals(max(horizons), every, periods)
+    s_all = starts(n_days, min(horizons), periods, stride)
+    pv = np.cumsum(_discount(level, s_all, m_max, every) * shape(rule, m_max, every, periods, inflation), axis=2)
+    worst = np.fmax.accumulate(pv, axis=2)
+    out = {}
+    for h in horizons:
+        keep = s_all <= n_days - int(round(h * periods))
+        out[h] = (s_all[keep], 1.0 / worst[:, keep, n_withdrawals(h, every, periods) - 1])
+    return out
+
+
+def success_rates(rates_by_start, rates):
+    # 各年提領率下的成功率（資金撐過整個持有期的進場日比例）
+    rates_by_start = np.atleast_2d(rates_by_start)
+    rates = np.asarray(rates, dtype=np.float64)
+    return (rates_by_start[:, :, None] >= rates).mean(axis=1)
+
+
+def percent_paths(level, rate, years, every=21, periods=252, stride=1):
+    # 固定比例提領：每次提領當時資金的 rate × every / periods
+    # 回傳 (進場點, 期末資金 (A × S), 最低單次提領金額相對第一次的比例 (A × S))
+    level = np.atleast_2d(level)
+    m = n_withdrawals(years, every, periods)
+    s = starts(level.shape[1] - 1, years, periods, stride)
+    if len(s) == 0:
+        empty = np.empty((len(level), 0))
+        return s, empty, empty
+    keep = 1 - rate * every / periods
+    t = s[:, None] + every * np.arange(m)
+    # 第 j 次提領前的資金 = keep^j · G(s, t_j)
+    before = keep ** np.arange(m) * np.exp(level[:, t] - level[:, s][:, :, None])
+    end = s + int(round(years * periods))
+    final = keep ** m * np.exp(level[:, end] - level[:, s])
+    return s, final, before.min(axis=2)
+
+
+def summary(level, years, rates, rule="fixed", every=21, periods=252, inflation=0.03):
+    # 每個配置一列：最差 / 中位可持續提領率，以及各提領率的成功率
+    s, r = max_rates(level, years, rule, every, periods, inflation)
+    ok = success_rates(r, rates)
+    out = pd.DataFrame({
+        "starts": len(s),
+        "safe_rate": r.min(axis=1) if len(s) else np.nan,
+        "median_rate": np.median(r, axis=1) if len(s) else np.nan,
+    })
+    for k, rate in enumerate(rates):
+        out[f"success_{rate:.2%}"] = ok[:, k]
+    return out
+
+
+def sweep(weights, rets_mat, years, rates, rule="fixed", every=21, periods=252, inflation=0.03, chunk=16):
+    # 整個配置網格：每個配置的最差 / 中位可持續提領率與各提領率成功率，配置分批避免 (A × S × m) 過大
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    frames = [summary(prefix.log_wealth(weights[lo:lo + chunk] @ rets_mat), years, rates, rule, every, periods, inflation)
+              for lo in range(0, len(weights), chunk)]
+    return pd.concat(frames, ignore_index=True)
+
+
+def by_start(port_ret, dates, years, rule="fixed", every=21, periods=252, inflation=0.03):
+    # 單一配置：每個進場日可持續的最大年提領率，供畫圖
+    s, r = max_rates(prefix.log_wealth(port_ret), years, rule, every, periods, inflation)
+    return pd.DataFrame({"Date": np.asarray(dates)[s], "max_rate": r[0]})
+
+
+if __name__ == "__main__":
+    import time
+
+    import data
+    import grid
+
+    frame = data.load_matrix(["ishare20_c.csv", "ishare1_3_c.csv", "spy_c.csv"])
+    rets_mat = data.rets_mat(frame)
+    port = np.array([0.3, 0.3, 0.4]) @ rets_mat
+    level = prefix.log_wealth(port)
+
+    rates = [0.03, 0.04, 0.05, 0.06]
+    t0 = time.perf_counter()
+    res = max_rates_by_horizon(level, [5, 10, 15], rule="inflation")
+    print(f"單一配置，5 / 10 / 15 年全部進場日：{time.perf_counter() - t0:.3f} 秒")
+    for h, (s, r) in res.items():
+        ok = success_rates(r, rates)[0]
+        print(f"{h:>2} 年：{len(s)} 個進場日，最差 {r.min():.2%}，中位 {np.median(r):.2%}，"
+              + "，".join(f"{x:.0%} 成功 {p:.1%}" for x, p in zip(rates, ok)))
+
+    # 與逐進場日直接模擬比對
+    s0, years, rate = 100, 10, float(res[10][1][0, 100])
+    wealth, w = 1.0, np.exp(np.diff(level))
+    for j in range(n_withdrawals(years)):
+        wealth -= rate / 12 * 1.03 ** (j / 12)
+        assert wealth > -1e-9, j
+        wealth *= np.prod(w[s0 + 21 * j:s0 + 21 * (j + 1)])
+    print(f"逐日模擬：以最大提領率 {rate:.4%} 提領 {years} 年後剩 {wealth:.2e}")
+
+    W = grid.simplex_grid(3, 0.05)
+    t0 = time.perf_counter()
+    table = sweep(W, rets_mat, 10, rates, rule="inflation")
+    print(f"{len(W)} 組配置 × {rets_mat.shape[1] - 2520 + 1} 個進場日 × {len(rates)} 種提領率：{time.perf_counter() - t0:.2f} 秒")
+    best = table["safe_rate"].idxmax()
+    print("最差情況下可提領最多的配置：", W[best], f"{table['safe_rate'][best]:.2%}")